@@ -14,17 +14,29 @@ ML-Аналитика доставок версия 2.0
 
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+import tkinter.font as tkfont
 from tkcalendar import DateEntry
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from functools import lru_cache
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
 import webbrowser
 from pathlib import Path
-from openpyxl import load_workbook
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter
 from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from io import BytesIO
+import base64
+import json
 import threading
+import queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import sys
 import os
 import time
@@ -35,6 +47,7 @@ import matplotlib
 matplotlib.use('TkAgg')
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.figure import Figure
 import matplotlib.dates as mdates
 # Подавление предупреждений о шрифтах
@@ -61,7 +74,13 @@ plt.rcParams['axes.unicode_minus'] = False
 import networkx as nx
 
 # Импорт ML модуля
-from ml_predictor import DeliveryMLPredictor, ScheduleRecommendation, TrendType
+from ml_predictor import ScheduleRecommendation, TrendType, train_and_recommend
+
+# Copy-on-Write: производные DataFrame разделяют данные до первой записи,
+# поэтому df_original и df_current можно хранить без явных копий (с pandas 3.0 режим включён всегда,
+# а опция устарела - задаём её только для pandas 2.x)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
 
 # ========================================
 # ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ДЛЯ КОПИРУЕМЫХ ТЕКСТОВ
@@ -69,13 +88,15 @@ from ml_predictor import DeliveryMLPredictor, ScheduleRecommendation, TrendType
 def enable_treeview_copy(tree):
     """Включить копирование для Treeview (Ctrl+C)"""
     def copy_selection(event):
-        selection = tree.selection()
-        if not selection:
+        if isinstance(tree, VirtualTreeview):
+            # Выделение виртуальной таблицы хранится в модели: копируются и прокрученные строки
+            selected_values = tree.selected_values()
+        else:
+            selected_values = [tree.item(item_id).get('values', []) for item_id in tree.selection()]
+        if not selected_values:
             return
         items = []
-        for item_id in selection:
-            item = tree.item(item_id)
-            values = item.get('values', [])
+        for values in selected_values:
             if values:
                 items.append('\t'.join(str(v) for v in values))
         if items:
@@ -94,7 +115,7 @@ def create_copyable_text(parent, text, **kwargs):
     # Извлекаем параметры для Text виджета
     bg = kwargs.pop('bg', parent.cget('bg') if hasattr(parent, 'cget') else 'white')
     fg = kwargs.pop('fg', 'black')
-    font = kwargs.pop('font', ('Segoe UI', 10))
+    font = kwargs.pop('font', "SegoeUI10")
     width = kwargs.pop('width', None)
     height = kwargs.pop('height', 1)
     wrap = kwargs.pop('wrap', 'none')
@@ -131,7 +152,7 @@ def create_copyable_label(parent, text, **kwargs):
     if len(text) < 100 and '\n' not in text:
         bg = kwargs.get('bg', parent.cget('bg') if hasattr(parent, 'cget') else 'white')
         fg = kwargs.get('fg', 'black')
-        font = kwargs.get('font', ('Segoe UI', 10))
+        font = kwargs.get('font', "SegoeUI10")
         width = kwargs.get('width', len(text) + 2)
         anchor = kwargs.get('anchor', 'w')
         
@@ -200,11 +221,29 @@ else:
     # Локальное окружение (по умолчанию)
     CRM_BASE_URL = "http://crm.public.lan"
 
+# Число параллельных загрузок частей данных
+FETCH_WORKERS = 6
+
+# Общая HTTP-сессия: соединения с CRM переиспользуются между запросами (keep-alive).
+# Пул соединений не меньше числа потоков загрузки, иначе лишние соединения закрываются
+SESSION = requests.Session()
+_http_adapter = HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=max(16, FETCH_WORKERS * 2),
+    max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[502, 503, 504])
+)
+SESSION.mount('http://', _http_adapter)
+SESSION.mount('https://', _http_adapter)
+
 # ========================================
 # КОНСТАНТЫ
 # ========================================
 DAYS_RU = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
 DAYS_SHORT = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+# День недели храним упорядоченной категорией - группировки сразу идут в порядке Пн..Вс
+WEEKDAY_DTYPE = pd.CategoricalDtype(DAYS_RU, ordered=True)
+# Час заказа ("00:00".."23:00") - упорядоченная категория по номеру часа
+HOUR_DTYPE = pd.CategoricalDtype([f"{hour:02d}:00" for hour in range(24)], ordered=True)
 
 # Цветовая схема
 COLORS = {
@@ -223,8 +262,9 @@ COLORS = {
 DEFAULT_PV_LABEL = "ПВ не указан"
 
 
+@lru_cache(maxsize=4096)
 def normalize_pv_value(value):
-    """Единый формат отображения ПВ"""
+    """Единый формат отображения ПВ (результаты кэшируются: различных ПВ немного)"""
     if value is None or pd.isna(value):
         return DEFAULT_PV_LABEL
     value_str = str(value).strip()
@@ -239,6 +279,153 @@ def normalize_pv_column(df: pd.DataFrame) -> pd.DataFrame:
         df['ПВ'] = df['ПВ'].apply(normalize_pv_value)
     return df
 
+
+# Теги строк таблиц по коду отклонения (см. deviation_tag_codes)
+DEVIATION_TAGS = ((), ('good',), ('medium',), ('bad',))
+
+# Статусы заказов в окне расписания по тому же коду
+WINDOW_ORDER_STATUSES = ("❓ Нет данных", "✅ Вовремя", "⚠️ Опоздание", "❌ Сильное откл.")
+
+
+# Теги строк по доле заказов вовремя (см. ontime_tag_codes)
+ONTIME_TAGS = (('bad',), ('medium',), ('good',))
+
+
+def ontime_tag_codes(pct):
+    """Коды тегов по % вовремя: 2 - от 80%, 1 - от 60%, 0 - ниже (и для пропусков)"""
+    pct = np.asarray(pct, dtype=float)
+    return np.select([pct >= 80, pct >= 60], [2, 1], default=0)
+
+
+def deviation_tag_codes(dev):
+    """Коды тегов по отклонению: 0 - нет данных, 1 - до 30 мин, 2 - до 60 мин, 3 - больше"""
+    dev = np.asarray(dev, dtype=float)
+    abs_dev = np.abs(dev)
+    return np.select([np.isnan(dev), abs_dev <= 30, abs_dev <= 60], [0, 1, 2], default=3)
+
+
+def format_deviation_column(dev):
+    """Векторное форматирование отклонений ('+12', '-5', пустая строка для пропусков)"""
+    dev = np.asarray(dev, dtype=float)
+    valid = ~np.isnan(dev)
+    text = np.char.mod('%+d', np.where(valid, np.round(dev), 0).astype(np.int64))
+    return np.where(valid, text, '')
+
+
+def format_number_column(values, fmt):
+    """Векторное форматирование чисел по %-шаблону ('%+.1f', '%.1f%%' ...) вместо f-строки на каждую ячейку"""
+    return np.char.mod(fmt, np.asarray(values, dtype=float))
+
+
+def format_route_columns(routes):
+    """Столбцы таблицы направлений (поставщик, склад, ПВ, заказы, % вовремя, отклонения) одним проходом"""
+    return (
+        format_text_column(routes['Поставщик'], 30),
+        format_text_column(routes['Склад'], 25),
+        format_text_column(routes['ПВ'].astype(object).map(normalize_pv_value), 35),
+        routes['orders'].tolist(),
+        format_number_column(routes['on_time_pct'], '%.1f%%'),
+        format_number_column(routes['mean_deviation'], '%+.0f'),
+        format_number_column(routes['median_deviation'], '%+.0f'),
+    )
+
+
+def format_datetime_column(series, fmt='%d.%m.%Y %H:%M', empty=''):
+    """Векторное форматирование столбца дат (empty для пропусков)"""
+    return series.dt.strftime(fmt).fillna(empty)
+
+
+def format_text_column(series, width):
+    """Векторное приведение столбца к строкам с обрезкой по ширине
+    
+    У категорий строки готовятся один раз на категорию и раздаются по кодам.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        labels = series.cat.categories.astype(str).str.slice(0, width).to_numpy(dtype=object)
+        labels = np.append(labels, '')  # код -1 (пропуск) -> последний элемент
+        return pd.Series(labels[series.cat.codes.to_numpy()], index=series.index)
+    return series.astype(object).fillna('').astype(str).str.slice(0, width)
+
+
+# Коды полосы отклонения в столбце '_dev_cat' (int8)
+DEV_BAND_EARLY, DEV_BAND_ON_TIME, DEV_BAND_LATE, DEV_BAND_NONE = 0, 1, 2, 3
+
+
+def add_deviation_band(df):
+    """Полоса отклонения (ранний / вовремя ±30 / опоздание / нет данных) одним проходом при загрузке"""
+    dev = df['Разница во времени привоза (мин.)'].to_numpy(dtype=np.float32)
+    df['_dev_cat'] = np.select(
+        [np.isnan(dev), dev < -30, dev <= 30],
+        [DEV_BAND_NONE, DEV_BAND_EARLY, DEV_BAND_ON_TIME],
+        default=DEV_BAND_LATE
+    ).astype(np.int8)
+    return df
+
+
+# Низкокардинальные текстовые столбцы, которые хранятся категориями (группировки по целым кодам)
+CATEGORY_COLUMNS = ('Поставщик', 'Склад', 'ПВ', 'Бренд')
+
+
+def add_category_columns(df):
+    """Поставщик / Склад / ПВ / Бренд - категориями; все группировки по ним идут с observed=True"""
+    for col in CATEGORY_COLUMNS:
+        df[col] = df[col].astype('category')
+    return df
+
+
+def add_order_codes(df):
+    """Целочисленный код номера заказа ('_order_code', Int32): nunique по кодам вместо хеширования строк"""
+    codes = pd.factorize(df['№ заказа'])[0].astype(np.int32)
+    df['_order_code'] = pd.arrays.IntegerArray(codes, codes < 0)  # пустой номер -> <NA>, как у nunique
+    return df
+
+
+def add_calendar_columns(df):
+    """День недели (упорядоченная категория) и месяц заказа - один раз при загрузке"""
+    df['День_недели'] = df['День_недели'].astype(WEEKDAY_DTYPE)
+    df['Месяц'] = df['Время заказа позиции'].dt.to_period('M').astype('category')
+    return df
+
+
+class DerivedFrame:
+    """Ленивые производные признаки заказа (день недели, час, минута, дата) без записи в DataFrame
+    
+    Массив вычисляется при первом обращении и живёт, пока жив объект:
+    для df_current объект берётся через get_derived('frame', DerivedFrame).
+    """
+    
+    def __init__(self, df):
+        self._df = df
+        self._cache = {}
+    
+    def _get(self, key, compute):
+        if key not in self._cache:
+            self._cache[key] = compute(self._df)
+        return self._cache[key]
+    
+    @property
+    def weekday(self):
+        """Номер дня недели 0-6 по коду категории (-1 - нет даты)"""
+        return self._get('weekday', lambda df: df['День_недели'].cat.codes.to_numpy())
+    
+    @property
+    def hour(self):
+        """Час заказа (готовый столбец 'Час', если он уже есть)"""
+        return self._get('hour', lambda df: (
+            df['Час'] if 'Час' in df.columns else df['Время заказа позиции'].dt.hour
+        ).to_numpy())
+    
+    @property
+    def minute(self):
+        """Минута заказа"""
+        return self._get('minute', lambda df: df['Время заказа позиции'].dt.minute.to_numpy())
+    
+    @property
+    def day(self):
+        """Дата заказа (datetime64[D] группируется как int64, без объектов date)"""
+        return self._get('day', lambda df: df['Время заказа позиции'].to_numpy().astype('datetime64[D]'))
+
+
 # ========================================
 # ГЛОБАЛЬНЫЕ ПЕРЕМЕННЫЕ
 # ========================================
@@ -246,6 +433,7 @@ df_original = None
 df_current = None
 ml_predictor = None
 recommendations = []
+recommendations_index = {}  # Ключ строки таблицы рекомендаций -> рекомендация
 is_model_trained = False
 current_pv_filter = None  # Текущий фильтр по ПВ
 schedules_cache = None  # Кэш расписания доставки
@@ -263,17 +451,25 @@ def fetch_schedules():
     
     try:
         url = f"{CRM_BASE_URL}/logistic/schedules?type=jsonresponse"
-        response = requests.get(url, timeout=30)
-        
-        if response.status_code == 500:
-            print(f"Ошибка сервера 500: эндпоинт {url} не доступен или не реализован")
-            return []
-        
-        response.raise_for_status()
+        # stream=True: JSON разбирается прямо из потока ответа, без промежуточных
+        # копий тела в bytes (response.content) и str (response.text)
+        with SESSION.get(url, timeout=30, stream=True) as response:
+            if response.status_code == 500:
+                print(f"Ошибка сервера 500: эндпоинт {url} не доступен или не реализован")
+                return []
+            
+            response.raise_for_status()
+            
+            response.raw.decode_content = True  # gzip/deflate распаковывается на лету
+            data = json.load(response.raw)
         
-        data = response.json()
         if data.get('result') == 'success':
-            schedules_cache = data.get('data', [])
+            schedules = data.get('data', [])
+            # Время "Заказ до" разбираем один раз при загрузке: дальше сравниваются только целые минуты
+            for sched in schedules:
+                minutes = parse_time_minutes(sched.get('timeOrder', '00:00'))
+                sched['_cutoff_min'] = 0 if minutes is None else minutes
+            schedules_cache = schedules
             print(f"Загружено {len(schedules_cache)} записей расписания")
             return schedules_cache
         else:
@@ -288,6 +484,63 @@ def fetch_schedules():
     return []
 
 
+# Индекс расписания по (warehouseId, branchId) - перестраивается при замене schedules_cache
+_schedule_index_cache = {'source': None, 'by_id': {}, 'by_day': {}}
+
+
+def get_schedule_index():
+    """Окна расписания, сгруппированные по (str(warehouseId), str(branchId))"""
+    cache = _schedule_index_cache
+    if cache['source'] is not schedules_cache:
+        by_id = {}
+        for schedule in schedules_cache or []:
+            key = (str(schedule.get('warehouseId')), str(schedule.get('branchId')))
+            by_id.setdefault(key, []).append(schedule)
+        cache['source'] = schedules_cache
+        cache['by_id'] = by_id
+        cache['by_day'] = {}
+    return cache['by_id']
+
+
+@lru_cache(maxsize=None)
+def parse_time_minutes(time_str):
+    """"HH:MM" -> минуты от начала суток (None при ошибке); различных значений немного, разбор кэшируется"""
+    try:
+        h, m = map(int, time_str.split(':'))
+        return h * 60 + m
+    except:
+        return None
+
+
+def schedule_time_minutes(sched):
+    """Время "Заказ до" окна в минутах от начала суток (0 при ошибке разбора)"""
+    minutes = sched.get('_cutoff_min')
+    if minutes is None:  # окно не из fetch_schedules - разбираем строку
+        minutes = parse_time_minutes(sched.get('timeOrder', '00:00'))
+    return 0 if minutes is None else minutes
+
+
+def get_schedule_day_windows(warehouse_id, branch_id):
+    """Окна направления по дням недели: {день 1-7: (минуты по возрастанию, окна)}
+    
+    Сортировка выполняется один раз на направление, поиск окна - через bisect.
+    """
+    by_id = get_schedule_index()
+    key = (str(warehouse_id), str(branch_id))
+    by_day = _schedule_index_cache['by_day']
+    day_windows = by_day.get(key)
+    if day_windows is None:
+        grouped = {}
+        for sched in by_id.get(key, ()):
+            grouped.setdefault(sched.get('weekday'), []).append((schedule_time_minutes(sched), sched))
+        day_windows = {}
+        for weekday, windows in grouped.items():
+            windows.sort(key=lambda w: w[0])
+            day_windows[weekday] = ([w[0] for w in windows], [w[1] for w in windows])
+        by_day[key] = day_windows
+    return day_windows
+
+
 def get_schedules_for_warehouse_pv(warehouse, pv, warehouse_id=None, branch_id=None):
     """Получить расписание для конкретного склада и ПВ
     
@@ -304,27 +557,19 @@ def get_schedules_for_warehouse_pv(warehouse, pv, warehouse_id=None, branch_id=N
     if not schedules_cache:
         return []
     
-    matching = []
-    
-    # Сопоставление только по ID
+    # Сопоставление только по ID (приводим к строке для надёжности)
     if warehouse_id is not None and branch_id is not None:
-        for schedule in schedules_cache:
-            sched_wh_id = schedule.get('warehouseId')
-            sched_branch_id = schedule.get('branchId')
-            
-            # Сравниваем ID (приводим к строке для надёжности)
-            if str(sched_wh_id) == str(warehouse_id) and str(sched_branch_id) == str(branch_id):
-                matching.append(schedule)
+        return list(get_schedule_index().get((str(warehouse_id), str(branch_id)), ()))
     
-    return matching
+    return []
 
 
+@lru_cache(maxsize=None)
 def calculate_expected_delivery(time_order_str, delivery_duration):
-    """Рассчитать ожидаемое время доставки"""
+    """Рассчитать ожидаемое время доставки (пар время/длительность немного - результат кэшируется)"""
     try:
         # time_order в формате "HH:MM"
-        hours, minutes = map(int, time_order_str.split(':'))
-        total_minutes = hours * 60 + minutes + delivery_duration
+        total_minutes = parse_time_minutes(time_order_str) + delivery_duration
         result_hours = total_minutes // 60
         result_minutes = total_minutes % 60
         
@@ -381,22 +626,14 @@ def find_schedule_window_for_order(order_weekday, order_hour, order_minute, sche
     if not day_windows:
         return None
     
-    # Сортируем по времени "Заказ до"
-    def get_time_minutes(sched):
-        try:
-            t = sched.get('timeOrder', '00:00')
-            h, m = map(int, t.split(':'))
-            return h * 60 + m
-        except:
-            return 0
-    
-    day_windows.sort(key=get_time_minutes)
+    # Сортируем по времени "Заказ до" (минуты разобраны при загрузке расписания)
+    day_windows.sort(key=schedule_time_minutes)
     
     order_time_minutes = order_hour * 60 + order_minute
     
     # Ищем подходящее окно
     for window in day_windows:
-        window_time = get_time_minutes(window)
+        window_time = schedule_time_minutes(window)
         if order_time_minutes <= window_time:
             return window
     
@@ -404,6 +641,63 @@ def find_schedule_window_for_order(order_weekday, order_hour, order_minute, sche
     return day_windows[-1] if day_windows else None
 
 
+def match_orders_to_windows(order_days, order_minutes, day_windows_by_num):
+    """
+    Векторное распределение заказов по окнам расписания (merge_asof вместо вызова на каждый заказ).
+    
+    order_days - номера дней 1-7 (0 - день неизвестен), order_minutes - минуты от начала суток (NaN - нет времени),
+    day_windows_by_num - {день: [(минуты, окно, слот), ...]} по возрастанию минут.
+    Заказ после последнего окна дня (или в день без окон) попадает в первое окно следующего дня,
+    а если его нет - в последнее окно своего дня.
+    
+    Returns:
+        tuple: (win_day int8, win_slot object) - 0 / None для заказов без окна
+    """
+    total = len(order_days)
+    win_day = np.zeros(total, dtype=np.int8)
+    win_slot = np.empty(total, dtype=object)
+    
+    windows_df = pd.DataFrame(
+        [(day, minutes, sched.get('weekday'), time_slot)
+         for day, windows in day_windows_by_num.items()
+         for minutes, sched, time_slot in windows],
+        columns=['day', 'cutoff_min', 'win_day', 'win_slot']
+    )
+    valid = (order_days > 0) & ~np.isnan(order_minutes)
+    if windows_df.empty or not valid.any():
+        return win_day, win_slot
+    
+    windows_df = windows_df.astype({'day': np.int64, 'cutoff_min': np.int64}).sort_values('cutoff_min', kind='stable')
+    orders_df = pd.DataFrame({
+        'pos': np.flatnonzero(valid),
+        'day': order_days[valid].astype(np.int64),
+        'order_min': order_minutes[valid].astype(np.int64),
+    }).sort_values('order_min', kind='stable')
+    
+    # Первое окно того же дня с "Заказ до" >= времени заказа
+    matched = pd.merge_asof(orders_df, windows_df, left_on='order_min', right_on='cutoff_min',
+                            by='day', direction='forward')
+    positions = matched['pos'].to_numpy()
+    hit = matched['win_slot'].notna().to_numpy()
+    win_day[positions[hit]] = matched['win_day'].to_numpy()[hit].astype(np.int8)
+    win_slot[positions[hit]] = matched['win_slot'].to_numpy()[hit]
+    
+    # Остальные заказы - в запасное окно своего дня (7 значений, а не по строке)
+    missed_positions = positions[~hit]
+    missed_days = matched['day'].to_numpy()[~hit]
+    for day in range(1, 8):
+        next_windows = day_windows_by_num.get(day % 7 + 1)
+        own_windows = day_windows_by_num.get(day)
+        fallback = next_windows[0] if next_windows else (own_windows[-1] if own_windows else None)
+        if fallback is None:
+            continue
+        day_positions = missed_positions[missed_days == day]
+        win_day[day_positions] = fallback[1].get('weekday')
+        win_slot[day_positions] = fallback[2]
+    
+    return win_day, win_slot
+
+
 def get_weekday_name(dt):
     if pd.isna(dt):
         return ""
@@ -420,123 +714,187 @@ def open_order_in_crm(order_id):
 # ========================================
 # TOOLTIP (ПОДСКАЗКИ)
 # ========================================
+class TooltipWindow:
+    """Постоянное окно подсказки: создаётся один раз, дальше только перемещается, меняет текст и скрывается"""
+    
+    def __init__(self, master, **label_options):
+        self.window = tk.Toplevel(master)
+        self.window.wm_overrideredirect(True)
+        self.window.withdraw()
+        self.label = tk.Label(
+            self.window,
+            background="#ffffe0",
+            relief='solid',
+            borderwidth=1,
+            font="SegoeUI9",
+            justify='left',
+            wraplength=300,
+            **label_options
+        )
+        self.label.pack()
+        self.text = None
+        self.visible = False
+    
+    def show(self, text, x, y):
+        if text != self.text:
+            self.label.configure(text=text)
+            self.text = text
+        self.window.wm_geometry(f"+{x}+{y}")
+        if not self.visible:
+            self.window.deiconify()
+            self.window.lift()
+            self.visible = True
+    
+    def move(self, x, y):
+        self.window.wm_geometry(f"+{x}+{y}")
+    
+    def hide(self):
+        if self.visible:
+            self.window.withdraw()
+            self.visible = False
+
+
 class Tooltip:
-    """Класс для создания подсказок при наведении мыши"""
+    """Класс для создания подсказок при наведении мыши
+    
+    Обработчики <Enter>/<Leave> привязаны один раз на тег BINDTAG: виджет получает
+    только этот тег и текст подсказки, без собственных привязок и замыканий.
+    """
+    BINDTAG = 'TooltipWidget'
+    _class_bound = False
+    tooltip_window = None  # общее TooltipWindow всех подсказок, создаётся при первом показе
+    
     def __init__(self, widget, text):
         self.widget = widget
         self.text = text
-        self.tooltip_window = None
-        self.widget.bind('<Enter>', self.on_enter)
-        self.widget.bind('<Leave>', self.on_leave)
-        self.widget.bind('<Motion>', self.on_motion)
-    
-    def on_enter(self, event=None):
-        self.show_tooltip()
-    
-    def on_leave(self, event=None):
-        self.hide_tooltip()
-    
-    def on_motion(self, event=None):
-        if self.tooltip_window:
-            self.hide_tooltip()
-            self.show_tooltip()
+        widget._tooltip = self
+        widget.bindtags(widget.bindtags() + (self.BINDTAG,))
+        if not Tooltip._class_bound:
+            widget.bind_class(self.BINDTAG, '<Enter>', Tooltip.on_enter)
+            widget.bind_class(self.BINDTAG, '<Leave>', Tooltip.on_leave)
+            Tooltip._class_bound = True
+    
+    @staticmethod
+    def on_enter(event):
+        tooltip = getattr(event.widget, '_tooltip', None)
+        if tooltip is not None:
+            tooltip.show_tooltip()
+    
+    @staticmethod
+    def on_leave(event=None):
+        if Tooltip.tooltip_window is not None:
+            Tooltip.tooltip_window.hide()
     
     def show_tooltip(self):
         x, y, _, _ = self.widget.bbox('insert') if hasattr(self.widget, 'bbox') else (0, 0, 0, 0)
         x += self.widget.winfo_rootx() + 25
         y += self.widget.winfo_rooty() + 20
         
-        self.tooltip_window = tk.Toplevel(self.widget)
-        self.tooltip_window.wm_overrideredirect(True)
-        self.tooltip_window.wm_geometry(f"+{x}+{y}")
-        
-        label = tk.Label(
-            self.tooltip_window,
-            text=self.text,
-            background="#ffffe0",
-            relief='solid',
-            borderwidth=1,
-            font=("Segoe UI", 9),
-            justify='left',
-            wraplength=300
-        )
-        label.pack()
+        if Tooltip.tooltip_window is None:
+            # Владелец - корневое окно: подсказка переживает закрытие диалогов
+            Tooltip.tooltip_window = TooltipWindow(self.widget._root())
+        Tooltip.tooltip_window.show(self.text, x, y)
     
     def hide_tooltip(self):
-        if self.tooltip_window:
-            self.tooltip_window.destroy()
-            self.tooltip_window = None
+        Tooltip.on_leave()
 
 
 def add_tooltips_to_treeview(tree, columns):
     """Добавить подсказки ко всем заголовкам столбцов таблицы"""
-    tooltip_window = None
+    popup = None  # одно окно подсказки на таблицу, создаётся при первом наведении
+    last_col_index = None
+    pending = None  # отложенный показ: серия событий Motion схлопывается в один показ
+    bounds = None  # правые границы столбцов в координатах окна (с учётом прокрутки)
+    in_header = False  # мышь в полосе заголовка: движение по строкам до выхода из неё ничего не делает
+    tooltip_texts = None  # тексты подсказок по позиции столбца, готовятся при первом наведении
     HEADER_HEIGHT = 30  # Высота области заголовка в пикселях
+    SHOW_DELAY_MS = 50
+    
+    def cancel_pending():
+        nonlocal pending
+        if pending is not None:
+            tree.after_cancel(pending)
+            pending = None
+    
+    def build_bounds():
+        """Границы столбцов по ширинам: дальше столбец под мышью ищется bisect без identify_column"""
+        edges = list(accumulate(int(tree.column(col, 'width')) for col in columns))
+        offset = int(tree.xview()[0] * edges[-1]) if edges else 0
+        return [edge - offset for edge in edges]
+    
+    def invalidate_bounds(event=None):
+        nonlocal bounds
+        bounds = None
+    
+    def really_show(col_index, x_root, y_root):
+        nonlocal popup, pending
+        pending = None
+        tooltip_text = tooltip_texts[col_index]
+        if tooltip_text:
+            if popup is None:
+                popup = TooltipWindow(tree, padx=8, pady=5)
+            popup.show(tooltip_text, x_root + 10, y_root + 10)
+        elif popup is not None:
+            popup.hide()
     
     def show_tooltip(event):
-        nonlocal tooltip_window
+        nonlocal last_col_index, pending, bounds, in_header
         
         # Проверяем, что мышь находится в области заголовка (верхние 30 пикселей)
         if event.y > HEADER_HEIGHT:
-            # Мышь не в области заголовка - закрываем tooltip если открыт
-            if tooltip_window:
-                tooltip_window.destroy()
-                tooltip_window = None
+            # Мышь над строками: подсказку убираем один раз при выходе из заголовка
+            if in_header:
+                leave_header()
             return
+        in_header = True
+        
+        # Определяем, на какой столбец наведена мышь (None - правее последнего столбца)
+        if bounds is None:
+            bounds = build_bounds()
+        col_index = bisect_right(bounds, event.x)
+        if col_index >= len(bounds):
+            col_index = None
+        
+        # Тот же столбец - окно только следует за мышью
+        if col_index == last_col_index:
+            if popup is not None and popup.visible:
+                popup.move(event.x_root + 10, event.y_root + 10)
+            return
+        last_col_index = col_index
         
-        # Определяем, на какой столбец наведена мышь
-        x = event.x
-        column_id = tree.identify_column(x)
-        
-        if column_id:
-            # column_id имеет формат "#0", "#1", "#2" и т.д.
-            # "#0" - это tree column, остальные - наши столбцы
-            try:
-                col_index = int(column_id.replace('#', ''))
-                if col_index == 0:
-                    return  # Пропускаем tree column
-                
-                # Получаем список столбцов (без tree column)
-                all_columns = tree['columns']
-                if col_index <= len(all_columns):
-                    column_name = all_columns[col_index - 1]
-                    tooltip_text = COLUMN_TOOLTIPS.get(column_name, '')
-                    
-                    if tooltip_text:
-                        # Закрываем предыдущий tooltip
-                        if tooltip_window:
-                            tooltip_window.destroy()
-                        
-                        # Создаём новый tooltip
-                        tooltip_window = tk.Toplevel()
-                        tooltip_window.wm_overrideredirect(True)
-                        tooltip_window.wm_geometry(f"+{event.x_root + 10}+{event.y_root + 10}")
-                        
-                        label = tk.Label(
-                            tooltip_window,
-                            text=tooltip_text,
-                            background="#ffffe0",
-                            relief='solid',
-                            borderwidth=1,
-                            font=("Segoe UI", 9),
-                            justify='left',
-                            wraplength=300,
-                            padx=8,
-                            pady=5
-                        )
-                        label.pack()
-            except (ValueError, IndexError):
-                pass
+        # Новый столбец - показ откладывается, пока мышь не остановится
+        cancel_pending()
+        if col_index is not None:
+            pending = tree.after(SHOW_DELAY_MS, really_show, col_index, event.x_root, event.y_root)
+    
+    def leave_header():
+        nonlocal last_col_index, in_header
+        in_header = False
+        last_col_index = None
+        cancel_pending()
+        if popup is not None:
+            popup.hide()
     
     def hide_tooltip(event):
-        nonlocal tooltip_window
-        if tooltip_window:
-            tooltip_window.destroy()
-            tooltip_window = None
+        nonlocal bounds
+        bounds = None  # пока мышь вне таблицы, её могли прокрутить полосой прокрутки
+        leave_header()
+    
+    def activate(event):
+        """Первое наведение на таблицу: только теперь готовим тексты и привязываем обработчики"""
+        nonlocal tooltip_texts
+        if tooltip_texts is not None:
+            return
+        # Тексты по позиции столбца - без чтения tree['columns'] и поиска в словаре при наведении
+        tooltip_texts = [COLUMN_TOOLTIPS.get(col, '') for col in columns]
+        tree.bind('<Motion>', show_tooltip)
+        tree.bind('<Leave>', hide_tooltip)
+        # Ширины и прокрутка меняются: размер окна, перетаскивание границы столбца, Shift+колесо
+        for sequence in ('<Configure>', '<ButtonRelease-1>', '<Shift-MouseWheel>', '<Shift-Button-4>', '<Shift-Button-5>'):
+            tree.bind(sequence, invalidate_bounds, add='+')
     
-    # Привязываем события
-    tree.bind('<Motion>', show_tooltip)
-    tree.bind('<Leave>', hide_tooltip)
+    # При построении интерфейса - одна привязка; остальное при первом наведении
+    tree.bind('<Enter>', activate, add='+')
 
 
 # Словарь подсказок для столбцов
@@ -593,6 +951,24 @@ COLUMN_TOOLTIPS = {
 # ========================================
 # СОРТИРУЕМАЯ ТАБЛИЦА
 # ========================================
+def _sort_number(value):
+    """Число из ячейки ('+12', '85.0%', '30 мин'): отрезаются только суффиксы ' мин' и '%'"""
+    text = str(value).strip().removesuffix(' мин').removesuffix('%')
+    return float(text.replace(',', '.'))  # знак '+' float разбирает сам
+
+
+def _sort_keys(values):
+    """Ключи сортировки столбца, разобранные один раз: числа, если разбирается каждое значение, иначе текст"""
+    try:
+        return [_sort_number(value) for value in values]
+    except ValueError:
+        return [str(value) for value in values]
+
+
+# Строки и значения одного столбца одним вызовом Tcl: плоский список "iid значение iid значение ..."
+_TCL_COLUMN_VALUES = '{w col} {set out {}; foreach item [$w children {}] {lappend out $item [$w set $item $col]}; return $out}'
+
+
 class SortableTreeview(ttk.Treeview):
     """Расширенный Treeview с сортировкой по столбцам"""
     
@@ -601,11 +977,36 @@ class SortableTreeview(ttk.Treeview):
         self.columns_list = columns
         self.sort_column = None
         self.sort_reverse = False
+        # Порядок строк последней сортировки (по возрастанию) для быстрого переключения;
+        # сбрасывается при любом изменении строк
+        self._sorted_order = None
         
         for col in columns:
             self.heading(col, text=col, command=lambda c=col: self.sort_by(c))
             self.column(col, anchor='center')
     
+    def invalidate_sort_cache(self):
+        """Сброс сохранённого порядка сортировки (строки или значения изменились)"""
+        self._sorted_order = None
+    
+    def insert(self, parent, index, iid=None, **kw):
+        self._sorted_order = None
+        return super().insert(parent, index, iid, **kw)
+    
+    def delete(self, *items):
+        self._sorted_order = None
+        super().delete(*items)
+    
+    def item(self, item, option=None, **kw):
+        if 'values' in kw:
+            self._sorted_order = None
+        return super().item(item, option, **kw)
+    
+    def set(self, item, column=None, value=None):
+        if value is not None:
+            self._sorted_order = None
+        return super().set(item, column, value)
+    
     def sort_by(self, col):
         """Сортировка по столбцу"""
         # Переключаем направление если тот же столбец
@@ -615,19 +1016,272 @@ class SortableTreeview(ttk.Treeview):
             self.sort_column = col
             self.sort_reverse = False
         
-        # Получаем все данные
-        data = [(self.set(child, col), child) for child in self.get_children('')]
+        # Строки не менялись и столбец тот же - достаточно развернуть прошлый порядок,
+        # без чтения значений из таблицы
+        cached = self._sorted_order
+        if cached is not None and cached[0] == col:
+            ordered = list(cached[1])
+        else:
+            # Строки и значения столбца одним вызовом Tcl вместо set() на каждую строку
+            flat = self.tk.splitlist(self.tk.call('apply', _TCL_COLUMN_VALUES, self._w, col))
+            children = flat[0::2]
+            # Разбираем ключи один раз на строку
+            keys = _sort_keys(flat[1::2])
+            order = sorted(range(len(children)), key=keys.__getitem__)
+            ordered = [children[pos] for pos in order]
+            self._sorted_order = (col, tuple(ordered))
+        
+        if self.sort_reverse:
+            ordered.reverse()
+        
+        # Перемещаем все элементы одним вызовом Tcl
+        self.tk.call(self._w, 'children', '', tuple(ordered))
         
-        # Пробуем преобразовать в числа для числовой сортировки
+        # Обновляем заголовки
+        for c in self.columns_list:
+            if c == col:
+                arrow = ' ▼' if self.sort_reverse else ' ▲'
+                self.heading(c, text=c + arrow)
+            else:
+                self.heading(c, text=c)
+
+
+# Вставка всех строк одним вызовом Tcl вместо отдельного insert на каждую строку
+_TCL_BULK_INSERT = '{w rows} {foreach {values tags} $rows {$w insert {} end -values $values -tags $tags}}'
+# Удаление всех строк внутри Tcl: список идентификаторов не передаётся в Python и обратно
+_TCL_DELETE_ALL = '{w} {$w delete [$w children {}]}'
+
+
+def clear_treeview(tree):
+    """Удаление всех строк таблицы одним вызовом Tcl"""
+    if isinstance(tree, SortableTreeview):
+        tree.invalidate_sort_cache()  # удаление идёт в обход SortableTreeview.delete
+    tree.tk.call('apply', _TCL_DELETE_ALL, tree._w)
+
+
+# Строк в одном вызове Tcl: большие таблицы уходят несколькими пакетами
+BULK_INSERT_CHUNK = 500
+
+
+def insert_treeview_rows(tree, rows):
+    """Пакетная вставка строк: rows - последовательность пар (values, tags)"""
+    if isinstance(tree, SortableTreeview):
+        tree.invalidate_sort_cache()  # вставка идёт в обход SortableTreeview.insert
+    flat = []
+    for values, tags in rows:
+        flat.append(tuple(values))
+        flat.append(tuple(tags))
+        if len(flat) >= 2 * BULK_INSERT_CHUNK:
+            tree.tk.call('apply', _TCL_BULK_INSERT, tree._w, tuple(flat))
+            flat = []
+    if flat:
+        tree.tk.call('apply', _TCL_BULK_INSERT, tree._w, tuple(flat))
+
+
+class VirtualTreeview(ttk.Treeview):
+    """Treeview, который держит в виджете только видимые строки
+    
+    Выделение и строка с фокусом хранятся индексами строк модели, поэтому переживают
+    прокрутку; стрелки и PageUp/PageDown на краю видимой области прокручивают модель.
+    """
+    
+    ROW_HEIGHT = 26  # запасное значение, если в стиле Treeview rowheight не задан
+    
+    def __init__(self, master, **kwargs):
+        self._rows = []
+        self._first = 0
+        self._selected = set()  # индексы выделенных строк модели
+        self._focus_row = None  # индекс строки модели с фокусом клавиатуры
+        self._item_rows = {}  # iid отрисованной строки -> индекс строки модели
+        self._user_select = None  # 'replace' / 'extend' - выделение меняет пользователь мышью
+        self._yscrollcommand = kwargs.pop('yscrollcommand', None)
+        super().__init__(master, **kwargs)
+        self.bind('<Configure>', lambda e: self._render())
+        self.bind('<MouseWheel>', lambda e: self._scroll_units(-1 if e.delta > 0 else 1))
+        self.bind('<Button-4>', lambda e: self._scroll_units(-1))
+        self.bind('<Button-5>', lambda e: self._scroll_units(1))
+        self.bind('<ButtonPress-1>', lambda e: self._mark_user_select('replace'))
+        self.bind('<Shift-ButtonPress-1>', lambda e: self._mark_user_select('extend'))
+        self.bind('<Control-ButtonPress-1>', lambda e: self._mark_user_select('extend'))
+        self.bind('<<TreeviewSelect>>', self._on_select, add='+')
+        self.bind('<Down>', lambda e: self._move_focus(1))
+        self.bind('<Up>', lambda e: self._move_focus(-1))
+        self.bind('<Next>', lambda e: self._move_focus(self._visible_count()))
+        self.bind('<Prior>', lambda e: self._move_focus(-self._visible_count()))
+    
+    def configure(self, cnf=None, **kwargs):
+        # Скроллбар должен видеть весь набор строк, а не только отрисованные
+        intercepted = False
+        if isinstance(cnf, dict) and 'yscrollcommand' in cnf:
+            cnf = dict(cnf)
+            self._yscrollcommand = cnf.pop('yscrollcommand')
+            intercepted = True
+        if 'yscrollcommand' in kwargs:
+            self._yscrollcommand = kwargs.pop('yscrollcommand')
+            intercepted = True
+        if intercepted:
+            self._update_scrollbar()
+            if not cnf and not kwargs:
+                return None
+        return super().configure(cnf or None, **kwargs)
+    
+    config = configure
+    
+    def set_rows(self, rows):
+        """Новый набор строк: последовательность пар (values, tags)"""
+        self._rows = list(rows)
+        self._first = 0
+        self._selected = set()
+        self._focus_row = None
+        self._render()
+    
+    def selected_values(self):
+        """Значения всех выделенных строк модели (в том числе прокрученных за край) в порядке таблицы"""
+        return [self._rows[index][0] for index in sorted(self._selected)]
+    
+    def _mark_user_select(self, mode):
+        self._user_select = mode
+    
+    def _on_select(self, event):
+        # Выделение, восстановленное при отрисовке, в модель не переносится
+        mode, self._user_select = self._user_select, None
+        if mode is None:
+            return
+        visible = set(self._item_rows.values())
+        chosen = {self._item_rows[iid] for iid in self.selection() if iid in self._item_rows}
+        kept = self._selected - visible if mode == 'extend' else set()
+        self._selected = kept | chosen
+        focus_iid = self.focus()
+        if focus_iid in self._item_rows:
+            self._focus_row = self._item_rows[focus_iid]
+    
+    def _move_focus(self, step):
+        """Стрелки / PageUp / PageDown по всей модели: у края видимой области строки прокручиваются"""
+        total = len(self._rows)
+        if not total:
+            return 'break'
+        current = self._focus_row if self._focus_row is not None else self._first - (1 if step > 0 else -1)
+        row = max(0, min(total - 1, current + step))
+        self._focus_row = row
+        self._selected = {row}
+        count = self._visible_count()
+        if row < self._first:
+            self._first = row
+        elif row >= self._first + count:
+            self._first = row - count + 1
+        self._render()
+        self.event_generate('<<TreeviewSelect>>')
+        return 'break'
+    
+    def _visible_count(self):
+        # До первого отображения виджета ориентируемся на height, затем - на реальную высоту
+        height = self.winfo_height()
+        if height <= 1:
+            return max(int(self.cget('height')), 1)
+        return max(height // self._row_height() - 1, 1)
+    
+    def _row_height(self):
+        """Высота строки из стиля таблицы (меняется вместе со стилем и шрифтами)"""
+        value = ttk.Style(self).lookup(self.cget('style') or 'Treeview', 'rowheight')
         try:
-            data.sort(key=lambda x: float(x[0].replace('%', '').replace('+', '').replace(' мин', '').replace(',', '.')), 
-                     reverse=self.sort_reverse)
-        except (ValueError, AttributeError):
-            data.sort(key=lambda x: x[0], reverse=self.sort_reverse)
+            return max(int(value), 1)
+        except (TypeError, ValueError):
+            return self.ROW_HEIGHT
+    
+    def _render(self):
+        count = self._visible_count()
+        total = len(self._rows)
+        self._first = max(0, min(self._first, total - count))
+        clear_treeview(self)
+        insert_treeview_rows(self, self._rows[self._first:self._first + count])
+        # Восстанавливаем выделение и фокус модели на отрисованных строках
+        self._user_select = None
+        self._item_rows = {iid: self._first + pos for pos, iid in enumerate(self.get_children())}
+        self.selection_set([iid for iid, index in self._item_rows.items() if index in self._selected])
+        for iid, index in self._item_rows.items():
+            if index == self._focus_row:
+                self.focus(iid)
+                break
+        self._update_scrollbar()
+    
+    def _update_scrollbar(self):
+        if self._yscrollcommand is None:
+            return
+        first, last = self.yview()
+        self._yscrollcommand(first, last)
+    
+    def _scroll_units(self, units):
+        self._first += units
+        self._render()
+        return 'break'
+    
+    def yview(self, *args):
+        """Прокрутка по индексу строки в полном наборе данных"""
+        total = len(self._rows)
+        count = self._visible_count()
+        if not args:
+            if not total:
+                return (0.0, 1.0)
+            return (self._first / total, min(1.0, (self._first + count) / total))
+        if args[0] == 'moveto':
+            self._first = int(float(args[1]) * total)
+        elif args[0] == 'scroll':
+            step = count if args[2].startswith('page') else 1
+            self._first += int(args[1]) * step
+        self._render()
+
+
+class VirtualSortableTreeview(VirtualTreeview):
+    """Виртуальная таблица с сортировкой по столбцам: сортируется модель строк, а не элементы Tk"""
+    
+    def __init__(self, master, columns, **kwargs):
+        super().__init__(master, columns=columns, **kwargs)
+        self.columns_list = columns
+        self.sort_column = None
+        self.sort_reverse = False
+        self._model = None
         
-        # Перемещаем элементы
-        for index, (_, child) in enumerate(data):
-            self.move(child, '', index)
+        for col in columns:
+            self.heading(col, text=col, command=lambda c=col: self.sort_by(c))
+            self.column(col, anchor='center')
+    
+    def set_rows(self, rows, model=None):
+        """Новый набор строк; model - DataFrame исходных значений в том же порядке строк
+        (столбцы названы как в таблице) - по ним сортировка идёт без разбора текста ячеек"""
+        self._model = None if model is None else model.reset_index(drop=True)
+        super().set_rows(rows)
+    
+    def sort_by(self, col):
+        """Сортировка по столбцу"""
+        # Переключаем направление если тот же столбец
+        if self.sort_column == col:
+            self.sort_reverse = not self.sort_reverse
+        else:
+            self.sort_column = col
+            self.sort_reverse = False
+        
+        model = self._model
+        if model is not None and col in model.columns:
+            # Стабильная сортировка pandas по исходным значениям (пропуски - в конце)
+            order = model[col].sort_values(
+                kind='mergesort', ascending=not self.sort_reverse, na_position='last'
+            ).index.to_numpy()
+        else:
+            idx = self.columns_list.index(col)
+            keys = _sort_keys([row[0][idx] for row in self._rows])
+            order = sorted(range(len(keys)), key=keys.__getitem__, reverse=self.sort_reverse)
+        
+        rows = self._rows
+        self._rows = [rows[pos] for pos in order]
+        if model is not None:
+            self._model = model.take(order).reset_index(drop=True)
+        # Выделение и фокус следуют за строками на их новые места
+        new_index = {old: new for new, old in enumerate(order)}
+        self._selected = {new_index[old] for old in self._selected}
+        if self._focus_row is not None:
+            self._focus_row = new_index[self._focus_row]
+        self._first = 0
+        self._render()
         
         # Обновляем заголовки
         for c in self.columns_list:
@@ -641,6 +1295,67 @@ class SortableTreeview(ttk.Treeview):
 # ========================================
 # ЗАГРУЗКА ДАННЫХ
 # ========================================
+# Переименование колонок из JSON в формат программы
+CRM_COLUMN_MAPPING = {
+    'orderNumber': '№ заказа',
+    'url': 'URL',
+    'supplierName': 'Поставщик',
+    'warehouseName': 'Склад',
+    'branchAddress': 'ПВ',
+    'brandName': 'Бренд',
+    'articleSearch': 'Артикул',
+    'expectedAssemblyTime': 'Рассчетное время привоза',
+    'onStoreDate': 'Время поступления на склад',
+    'orderedDate': 'Время заказа позиции',
+    'diffMinutes': 'Разница во времени привоза (мин.)',
+    # ID для точного сопоставления с расписанием
+    'supplierId': 'supplierId',
+    'warehouseId': 'warehouseId',
+    'branchId': 'branchId'
+}
+
+# Ключ строки для удаления дублей (проверяется до разбора дат: разные нераспознанные
+# строки времени не должны склеиться в один NaT)
+DEDUP_KEYS = ['№ заказа', 'Артикул', 'Время заказа позиции']
+
+# Очередь вызовов GUI из фоновых потоков (разбирается главным потоком)
+ui_queue = queue.Queue()
+# Минимальный интервал между сообщениями о прогрессе загрузки (сек)
+STATUS_MIN_INTERVAL = 0.25
+
+
+def post_to_ui(func, *args):
+    """Передать вызов функции GUI в главный поток
+    
+    Все вызовы GUI из фоновых потоков идут через эту очередь: так они выполняются
+    строго в порядке отправки (прогресс загрузки не перезапишет итоговый статус).
+    """
+    ui_queue.put((func, args))
+
+
+def drain_ui_queue():
+    """Выполнение накопленных вызовов из фоновых потоков (главный поток)
+    
+    Из нескольких накопленных update_status выполняется только последний:
+    промежуточные сообщения всё равно были бы сразу перезаписаны.
+    """
+    calls = []
+    while True:
+        try:
+            calls.append(ui_queue.get_nowait())
+        except queue.Empty:
+            break
+    last_status = max((i for i, (func, _) in enumerate(calls) if func is update_status), default=-1)
+    for i, (func, args) in enumerate(calls):
+        if func is update_status and i != last_status:
+            continue
+        try:
+            func(*args)
+        except Exception as e:
+            print(f"Ошибка обновления интерфейса: {e}")
+    root.after(100, drain_ui_queue)
+
+
 def fetch_data():
     """Загрузка данных с сервера за выбранный период"""
     start_date = cal_start.get_date()
@@ -651,18 +1366,18 @@ def fetch_data():
             df = fetch_data_chunked(start_date, end_date)
             if df is not None and not df.empty:
                 global df_original, df_current, is_model_trained
-                df_original = df.copy()
-                df_current = df.copy()
+                df_original = df
+                df_current = df
                 is_model_trained = False
                 
-                root.after(0, update_pv_filter_options)
-                root.after(0, update_stats_display)
-                root.after(0, update_raw_data_display)
-                root.after(0, update_supply_chain_map)
-                root.after(0, lambda: update_status(f"✅ Загружено {len(df):,} записей", "success"))
-                root.after(0, train_model_async)
+                post_to_ui(update_pv_filter_options)
+                post_to_ui(update_stats_display)
+                post_to_ui(update_raw_data_display)
+                post_to_ui(update_supply_chain_map)
+                post_to_ui(lambda: update_status(f"✅ Загружено {len(df):,} записей", "success"))
+                post_to_ui(train_model_async)
         except Exception as e:
-            root.after(0, lambda: update_status(f"❌ Ошибка: {str(e)[:50]}", "error"))
+            post_to_ui(lambda: update_status(f"❌ Ошибка: {str(e)[:50]}", "error"))
     
     update_status("⏳ Загрузка данных...", "info")
     progress_bar.start()
@@ -670,72 +1385,79 @@ def fetch_data():
     thread.start()
 
 
-def fetch_data_chunked(start_date, end_date, chunk_days=14):
-    """Порционная загрузка данных с сервера в формате JSON"""
-    all_data = []
-    current_start = start_date
-    total_chunks = ((end_date - start_date).days // chunk_days) + 1
-    chunk_num = 0
+def download_chunk(chunk_start, chunk_end):
+    """Загрузка и разбор JSON одной части данных (выполняется в пуле потоков)"""
+    url = (
+        f"{CRM_BASE_URL}/logistic/delivery_statistic"
+        f"?fromDate={chunk_start.strftime('%Y-%m-%d')}"
+        f"&toDate={chunk_end.strftime('%Y-%m-%d')}"
+        f"&type=jsonresponse"
+    )
     
-    while current_start < end_date:
-        chunk_num += 1
-        current_end = min(current_start + timedelta(days=chunk_days - 1), end_date)
-        
-        root.after(0, lambda cn=chunk_num, tc=total_chunks: 
-            update_status(f"⏳ Загрузка части {cn}/{tc}...", "info"))
+    # stream=True: тело части разбирается прямо из потока, без буфера response.content
+    with SESSION.get(url, timeout=60, stream=True) as response:
+        response.raise_for_status()
         
-        url = (
-            f"{CRM_BASE_URL}/logistic/delivery_statistic"
-            f"?fromDate={current_start.strftime('%Y-%m-%d')}"
-            f"&toDate={current_end.strftime('%Y-%m-%d')}"
-            f"&type=jsonresponse"
-        )
+        # Проверяем что это не HTML страница с ошибкой (по заголовку, без чтения тела)
+        if 'html' in response.headers.get('Content-Type', ''):
+            return None
         
+        response.raw.decode_content = True  # gzip/deflate распаковывается на лету
         try:
-            response = requests.get(url, timeout=60)
-            response.raise_for_status()
-            
-            # Проверяем что это не HTML страница с ошибкой
-            if b'<html' in response.content[:500]:
-                current_start = current_end + timedelta(days=1)
-                continue
-            
-            # Парсим JSON ответ
-            json_data = response.json()
-            
-            if json_data.get('result') == 'success' and json_data.get('data'):
-                # Преобразуем JSON в DataFrame
-                df_chunk = pd.DataFrame(json_data['data'])
-                
-                if len(df_chunk) > 0:
-                    # Переименовываем колонки из JSON в нужный формат
-                    column_mapping = {
-                        'orderNumber': '№ заказа',
-                        'url': 'URL',
-                        'supplierName': 'Поставщик',
-                        'warehouseName': 'Склад',
-                        'branchAddress': 'ПВ',
-                        'brandName': 'Бренд',
-                        'articleSearch': 'Артикул',
-                        'expectedAssemblyTime': 'Рассчетное время привоза',
-                        'onStoreDate': 'Время поступления на склад',
-                        'orderedDate': 'Время заказа позиции',
-                        'diffMinutes': 'Разница во времени привоза (мин.)',
-                        # ID для точного сопоставления с расписанием
-                        'supplierId': 'supplierId',
-                        'warehouseId': 'warehouseId',
-                        'branchId': 'branchId'
-                    }
-                    df_chunk = df_chunk.rename(columns=column_mapping)
-                    all_data.append(df_chunk)
-            
-        except Exception as e:
-            print(f"Ошибка загрузки данных: {e}")
-        
+            json_data = json.load(response.raw)
+        except ValueError:
+            # HTML с ошибкой, отданный без соответствующего Content-Type
+            return None
+    
+    if json_data.get('result') == 'success' and json_data.get('data'):
+        return json_data['data']
+    return None
+
+
+def fetch_data_chunked(start_date, end_date, chunk_days=14):
+    """Порционная загрузка данных с сервера в формате JSON
+    
+    Части загружаются параллельно в пуле потоков (сеть отпускает GIL),
+    а сборка DataFrame выполняется в вызывающем потоке.
+    """
+    # Диапазоны дат для каждой части
+    ranges = []
+    current_start = start_date
+    while current_start < end_date:
+        current_end = min(current_start + timedelta(days=chunk_days - 1), end_date)
+        ranges.append((current_start, current_end))
         current_start = current_end + timedelta(days=1)
-        time.sleep(0.2)  # Уменьшил задержку т.к. JSON быстрее
+    total_chunks = len(ranges)
+    
+    chunk_records = [None] * total_chunks
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        futures = {
+            executor.submit(download_chunk, chunk_start, chunk_end): i
+            for i, (chunk_start, chunk_end) in enumerate(ranges)
+        }
+        last_post = 0.0
+        for done, future in enumerate(as_completed(futures), 1):
+            # Прогресс не чаще 4 раз в секунду (и обязательно на последней части)
+            now = time.monotonic()
+            if now - last_post >= STATUS_MIN_INTERVAL or done == total_chunks:
+                post_to_ui(update_status, f"⏳ Загружено частей: {done}/{total_chunks}...", "info")
+                last_post = now
+            try:
+                chunk_records[futures[future]] = future.result()
+            except Exception as e:
+                print(f"Ошибка загрузки данных: {e}")
     
-    root.after(0, progress_bar.stop)
+    post_to_ui(progress_bar.stop)
+    
+    # Собираем части в исходном порядке дат
+    all_data = []
+    for records in chunk_records:
+        if records:
+            # Берём только известные поля CRM - лишние ключи не попадают в DataFrame,
+            # отсутствующие в записи поля становятся NaN в этой строке
+            df_chunk = pd.DataFrame.from_records(records, columns=list(CRM_COLUMN_MAPPING))
+            df_chunk.rename(columns=CRM_COLUMN_MAPPING, inplace=True)
+            all_data.append(df_chunk)
     
     if not all_data:
         return None
@@ -750,16 +1472,30 @@ def fetch_data_chunked(start_date, end_date, chunk_days=14):
         if col not in df.columns:
             df[col] = ''
     
+    # Один проход по всей таблице по исходным строкам; ignore_index сразу даёт
+    # сплошной индекс без reset_index, а даты дальше разбираются уже без дублей
+    df = df.drop_duplicates(subset=DEDUP_KEYS, keep='first', ignore_index=True)
+    
     # Преобразуем даты
     for col in ['Рассчетное время привоза', 'Время поступления на склад', 'Время заказа позиции']:
         df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True)
     
-    df['Разница во времени привоза (мин.)'] = pd.to_numeric(df['Разница во времени привоза (мин.)'], errors='coerce')
-    df['День_недели'] = df['Время заказа позиции'].apply(get_weekday_name)
-    df['Час_заказа'] = df['Время заказа позиции'].dt.floor('h').dt.strftime('%H:%M')
+    # float32: минутной точности хватает, а все агрегации по столбцу читают вдвое меньше памяти
+    df['Разница во времени привоза (мин.)'] = pd.to_numeric(
+        df['Разница во времени привоза (мин.)'], errors='coerce'
+    ).astype(np.float32)
+    # День недели сразу категорией по номеру дня (-1 для пустой даты -> NaN)
+    weekday_codes = df['Время заказа позиции'].dt.weekday.fillna(-1).astype(np.int8)
+    df['День_недели'] = pd.Categorical.from_codes(weekday_codes, dtype=WEEKDAY_DTYPE)
+    # Час заказа - категорией "ЧЧ:00" по целому номеру часа, без strftime на каждую строку
+    hour_codes = df['Время заказа позиции'].dt.hour.fillna(-1).astype(np.int8)
+    df['Час_заказа'] = pd.Categorical.from_codes(hour_codes, dtype=HOUR_DTYPE)
+    df = add_calendar_columns(df)
+    df = add_deviation_band(df)
     
-    df = df.drop_duplicates(subset=['№ заказа', 'Артикул', 'Время заказа позиции'])
     df = normalize_pv_column(df)
+    df = add_category_columns(df)
+    df = add_order_codes(df)
     
     return df
 
@@ -785,28 +1521,28 @@ def fetch_historical_data():
             df = fetch_data_chunked(start_date, end_date, chunk_days=14)
             if df is not None and not df.empty:
                 global df_original, df_current, is_model_trained
-                df_original = df.copy()
-                df_current = df.copy()
+                df_original = df
+                df_current = df
                 is_model_trained = False
                 
                 cache_path = os.path.join(os.path.dirname(__file__), 'ml_data_cache.pkl')
                 df.to_pickle(cache_path)
                 
-                root.after(0, update_pv_filter_options)
-                root.after(0, update_stats_display)
-                root.after(0, update_raw_data_display)
-                root.after(0, update_supply_chain_map)
-                root.after(0, lambda: update_status(f"✅ Загружено {len(df):,} записей. Сохранено в кэш.", "success"))
-                root.after(0, lambda: messagebox.showinfo(
+                post_to_ui(update_pv_filter_options)
+                post_to_ui(update_stats_display)
+                post_to_ui(update_raw_data_display)
+                post_to_ui(update_supply_chain_map)
+                post_to_ui(lambda: update_status(f"✅ Загружено {len(df):,} записей. Сохранено в кэш.", "success"))
+                post_to_ui(lambda: messagebox.showinfo(
                     "✅ Готово", 
                     f"Загружено записей: {len(df):,}\n"
                     f"Период: {start_date.strftime('%d.%m.%Y')} — {end_date.strftime('%d.%m.%Y')}\n\n"
                     f"Данные сохранены в кэш."
                 ))
-                root.after(0, train_model_async)
+                post_to_ui(train_model_async)
         except Exception as e:
-            root.after(0, lambda: update_status(f"❌ Ошибка", "error"))
-            root.after(0, lambda: messagebox.showerror("Ошибка", str(e)))
+            post_to_ui(lambda: update_status(f"❌ Ошибка", "error"))
+            post_to_ui(lambda: messagebox.showerror("Ошибка", str(e)))
     
     update_status("⏳ Загрузка исторических данных...", "info")
     progress_bar.start()
@@ -829,9 +1565,20 @@ def load_cached_data():
         progress_bar.start()
         
         df = pd.read_pickle(cache_path)
-        df = normalize_pv_column(df)
-        df_original = df.copy()
-        df_current = df.copy()
+        # Новый кэш уже содержит производные столбцы в нужных типах - пересчитываем
+        # только то, чего нет в кэше, сохранённом старой версией программы
+        df['Разница во времени привоза (мин.)'] = df['Разница во времени привоза (мин.)'].astype(np.float32)
+        if not isinstance(df['ПВ'].dtype, pd.CategoricalDtype):
+            df = normalize_pv_column(df)
+        df = add_category_columns(df)
+        if 'Месяц' not in df.columns:
+            df = add_calendar_columns(df)
+        if '_dev_cat' not in df.columns:
+            df = add_deviation_band(df)
+        if '_order_code' not in df.columns:
+            df = add_order_codes(df)
+        df_original = df
+        df_current = df
         is_model_trained = False
         
         cache_date = datetime.fromtimestamp(os.path.getmtime(cache_path))
@@ -859,46 +1606,53 @@ def train_model_async():
     def train():
         global ml_predictor, is_model_trained, recommendations
         
-        root.after(0, lambda: update_status("🤖 Анализ данных...", "info"))
-        root.after(0, progress_bar.start)
+        post_to_ui(lambda: update_status("🤖 Анализ данных...", "info"))
+        post_to_ui(progress_bar.start)
         
         try:
-            # Обучаем ML модель
-            ml_predictor = DeliveryMLPredictor()
-            ml_predictor.fit(df_current)
-            
-            # Генерируем ML-рекомендации с привязкой к расписанию
-            if schedules_cache:
-                recommendations = ml_predictor.generate_recommendations_by_schedule(
-                    df_current, schedules_cache, min_samples=5, min_shift=15
-                )
-            else:
-                # Пробуем загрузить расписание
+            # Пробуем загрузить расписание для привязки рекомендаций
+            if not schedules_cache:
                 fetch_schedules()
-                if schedules_cache:
-                    recommendations = ml_predictor.generate_recommendations_by_schedule(
-                        df_current, schedules_cache, min_samples=5, min_shift=15
-                    )
-                else:
-                    # Если расписание недоступно - старый метод по часам
-                    recommendations = ml_predictor.generate_recommendations(df_current, min_samples=5, min_shift=15)
+            
+            # Обучаем ML модель и генерируем рекомендации (в этом же фоновом потоке:
+            # fork многопоточного процесса с Tk небезопасен, а spawn заново строит окно)
+            ml_predictor, recommendations = train_and_recommend(
+                df, schedules_cache, min_samples=5, min_shift=15
+            )
             
             is_model_trained = True
+            rebuild_recommendations_index()
             
-            root.after(0, progress_bar.stop)
-            root.after(0, update_ml_recommendations_display)
-            root.after(0, lambda: update_status(
+            post_to_ui(progress_bar.stop)
+            post_to_ui(update_ml_recommendations_display)
+            post_to_ui(lambda: update_status(
                 f"✅ Анализ завершён | ML-рекомендаций: {len(recommendations)}", "success"))
             
         except Exception as e:
-            root.after(0, progress_bar.stop)
-            root.after(0, lambda: update_status(f"⚠️ Ошибка: {str(e)[:40]}", "warning"))
+            post_to_ui(progress_bar.stop)
+            post_to_ui(lambda: update_status(f"⚠️ Ошибка: {str(e)[:40]}", "warning"))
             print(f"Ошибка ML: {e}")
     
+    # Данные фиксируются при запуске: перезагрузка во время обучения не меняет вход
+    df = df_current
     thread = threading.Thread(target=train, daemon=True)
     thread.start()
 
 
+def recommendation_row_key(rec):
+    """Ключ рекомендации в том виде, в каком она показана в таблице"""
+    return (rec.supplier[:25], rec.warehouse[:20], normalize_pv_value(rec.pv)[:30], rec.weekday[:2])
+
+
+def rebuild_recommendations_index():
+    """Индекс рекомендаций для поиска по строке таблицы (первое совпадение как раньше)"""
+    global recommendations_index
+    index = {}
+    for rec in recommendations:
+        index.setdefault(recommendation_row_key(rec), rec)
+    recommendations_index = index
+
+
 def retrain_model():
     """Переобучение модели"""
     if df_current is None:
@@ -910,50 +1664,56 @@ def retrain_model():
 # ========================================
 # ОБНОВЛЕНИЕ ТАБЛИЦ
 # ========================================
+def route_stats(df):
+    """Статистика по направлениям (Поставщик, Склад, ПВ) одним groupby
+    
+    Столбцы: orders, mean_deviation, median_deviation, std_deviation, on_time_pct.
+    % вовремя (±30 мин) считается в той же агрегации как среднее булевого признака.
+    """
+    stats = df.assign(
+        _ontime=df['_dev_cat'] == DEV_BAND_ON_TIME
+    ).groupby(['Поставщик', 'Склад', 'ПВ'], observed=True).agg(
+        orders=('_order_code', 'nunique'),
+        mean_deviation=('Разница во времени привоза (мин.)', 'mean'),
+        median_deviation=('Разница во времени привоза (мин.)', 'median'),
+        std_deviation=('Разница во времени привоза (мин.)', 'std'),
+        on_time_pct=('_ontime', 'mean')
+    ).reset_index()
+    stats['on_time_pct'] *= 100
+    return stats
+
+
 def update_stats_display():
     """Обновление статистики поставщиков"""
     if df_current is None:
         return
     
-    for item in tree_stats.get_children():
-        tree_stats.delete(item)
-    
-    stats = df_current.groupby(['Поставщик', 'Склад', 'ПВ']).agg(
-        Заказов=('№ заказа', 'nunique'),
-        Среднее=('Разница во времени привоза (мин.)', 'mean'),
-        Медиана=('Разница во времени привоза (мин.)', 'median'),
-        СтдОткл=('Разница во времени привоза (мин.)', 'std')
-    ).round(1).reset_index()
-    
-    for idx, row in stats.iterrows():
-        mask = (
-            (df_current['Поставщик'] == row['Поставщик']) &
-            (df_current['Склад'] == row['Склад']) &
-            (df_current['ПВ'] == row['ПВ'])
-        )
-        subset = df_current[mask]
-        on_time = (subset['Разница во времени привоза (мин.)'].between(-30, 30).sum() / len(subset)) * 100
-        stats.loc[idx, 'Вовремя'] = round(on_time, 1)
-    
-    for _, row in stats.iterrows():
-        pct = row['Вовремя']
-        if pct >= 80:
-            tags = ('good',)
-        elif pct >= 60:
-            tags = ('medium',)
-        else:
-            tags = ('bad',)
-        
-        tree_stats.insert('', 'end', values=(
-            row['Поставщик'],
-            row['Склад'],
-            normalize_pv_value(row['ПВ']),
-            f"{row['Заказов']:,}",
-            f"{row['Среднее']:+.1f}",
-            f"{row['Медиана']:+.1f}",
-            f"{row['СтдОткл']:.1f}",
-            f"{row['Вовремя']:.1f}%"
-        ), tags=tags)
+    stats = route_stats(df_current).round(1)
+    
+    tag_codes = ontime_tag_codes(stats['on_time_pct']).tolist()
+    # Кортежи строк без упаковки каждой строки в Series (порядок столбцов - как в route_stats)
+    rows = [
+        ((
+            supplier,
+            warehouse,
+            normalize_pv_value(pv),
+            f"{orders:,}",
+            f"{mean_dev:+.1f}",
+            f"{median_dev:+.1f}",
+            f"{std_dev:.1f}",
+            f"{ontime:.1f}%"
+        ), ONTIME_TAGS[code])
+        for (supplier, warehouse, pv, orders, mean_dev, median_dev, std_dev, ontime), code
+        in zip(stats.itertuples(index=False, name=None), tag_codes)
+    ]
+    # Числовые столбцы сортируются по значениям, а не по тексту ячеек
+    tree_stats.set_rows(rows, model=pd.DataFrame({
+        'Заказов': stats['orders'],
+        'Ср. откл.': stats['mean_deviation'],
+        'Медиана': stats['median_deviation'],
+        'Ст. откл.': stats['std_deviation'],
+        '% вовремя': stats['on_time_pct'],
+    }))
     
     # Обновляем счетчик с информацией о ПВ
     unique_pv = df_current['ПВ'].nunique()
@@ -966,44 +1726,36 @@ def update_raw_data_display():
     if df_current is None:
         return
     
-    for item in tree_raw.get_children():
-        tree_raw.delete(item)
-    
     # Показываем последние 1000 записей
-    display_df = df_current.sort_values('Время заказа позиции', ascending=False).head(1000)
-    
-    for _, row in display_df.iterrows():
-        dev = row.get('Разница во времени привоза (мин.)', 0)
-        tags = ()
-        if pd.notna(dev):
-            if abs(dev) <= 30:
-                tags = ('good',)
-            elif abs(dev) <= 60:
-                tags = ('medium',)
-            else:
-                tags = ('bad',)
-        
-        order_date = row['Время заказа позиции'].strftime('%d.%m.%Y %H:%M') if pd.notna(row.get('Время заказа позиции')) else ''
-        plan_time = row['Рассчетное время привоза'].strftime('%d.%m.%Y %H:%M') if pd.notna(row.get('Рассчетное время привоза')) else ''
-        fact_time = row['Время поступления на склад'].strftime('%d.%m.%Y %H:%M') if pd.notna(row.get('Время поступления на склад')) else ''
-        
-        # Получаем дополнительные поля
-        pv = normalize_pv_value(row.get('ПВ'))[:40]
-        brand = str(row.get('Бренд', ''))[:25] if pd.notna(row.get('Бренд')) else ''
-        article = str(row.get('Артикул', ''))[:20] if pd.notna(row.get('Артикул')) else ''
-        
-        tree_raw.insert('', 'end', values=(
-            row.get('№ заказа', ''),
-            row.get('Поставщик', '')[:25],
-            row.get('Склад', '')[:18],
-            pv,
-            brand,
-            article,
-            order_date,
-            plan_time,
-            fact_time,
-            f"{dev:+.0f}" if pd.notna(dev) else ''
-        ), tags=tags)
+    display_df = df_current.nlargest(1000, 'Время заказа позиции')
+    
+    # Строки для отображения готовим векторно, без обращений к строкам в цикле
+    dev = display_df['Разница во времени привоза (мин.)'].to_numpy(dtype=float)
+    tag_codes = deviation_tag_codes(dev)
+    
+    columns = (
+        display_df['№ заказа'].fillna('').astype(str),
+        format_text_column(display_df['Поставщик'], 25),
+        format_text_column(display_df['Склад'], 18),
+        format_text_column(display_df['ПВ'], 40),  # ПВ нормализован при загрузке
+        format_text_column(display_df['Бренд'], 25),
+        format_text_column(display_df['Артикул'], 20),
+        format_datetime_column(display_df['Время заказа позиции']),
+        format_datetime_column(display_df['Рассчетное время привоза']),
+        format_datetime_column(display_df['Время поступления на склад']),
+        format_deviation_column(dev)
+    )
+    
+    # В виджет попадают только видимые строки, остальные хранятся в модели таблицы;
+    # даты и отклонение сортируются по исходным значениям, а не по тексту "дд.мм.гггг"
+    tree_raw.set_rows([
+        (values, DEVIATION_TAGS[code]) for values, code in zip(zip(*columns), tag_codes.tolist())
+    ], model=pd.DataFrame({
+        'Дата заказа': display_df['Время заказа позиции'].to_numpy(),
+        'План привоза': display_df['Рассчетное время привоза'].to_numpy(),
+        'Факт привоза': display_df['Время поступления на склад'].to_numpy(),
+        'Откл. (мин)': dev,
+    }))
     
     total = len(df_current)
     shown = min(total, 1000)
@@ -1024,49 +1776,33 @@ def update_supply_chain_map():
     if df_current is None or df_current.empty:
         return
     
-    # Очищаем предыдущий график
+    # Очищаем предыдущий график вместе с его фигурой
     if supply_chain_canvas is not None:
         supply_chain_canvas.get_tk_widget().destroy()
+    if supply_chain_fig is not None:
+        supply_chain_fig.clf()
+        plt.close(supply_chain_fig)
     
     # Агрегируем данные по направлениям
-    route_stats = df_current.groupby(['Поставщик', 'Склад', 'ПВ']).agg(
-        orders=('№ заказа', 'nunique'),
-        mean_deviation=('Разница во времени привоза (мин.)', 'mean'),
-        median_deviation=('Разница во времени привоза (мин.)', 'median'),
-        std_deviation=('Разница во времени привоза (мин.)', 'std')
-    ).reset_index()
-    
-    # Рассчитываем % вовремя для каждого направления
-    def calc_on_time_pct(row):
-        mask = (
-            (df_current['Поставщик'] == row['Поставщик']) &
-            (df_current['Склад'] == row['Склад']) &
-            (df_current['ПВ'] == row['ПВ'])
-        )
-        subset = df_current[mask]
-        if len(subset) == 0:
-            return 0
-        return (subset['Разница во времени привоза (мин.)'].between(-30, 30).sum() / len(subset)) * 100
-    
-    route_stats['on_time_pct'] = route_stats.apply(calc_on_time_pct, axis=1)
+    routes = route_stats(df_current)
     
     # Создаём объединённые узлы "Поставщик: Склад"
-    route_stats['supplier_warehouse'] = route_stats['Поставщик'] + ': ' + route_stats['Склад']
+    routes['supplier_warehouse'] = routes['Поставщик'].astype(str) + ': ' + routes['Склад'].astype(str)
     
     # Создаём граф
     G = nx.DiGraph()
     
     # Собираем уникальные узлы
-    supplier_warehouses = route_stats['supplier_warehouse'].unique()
-    pvs = route_stats['ПВ'].unique()
+    supplier_warehouses = routes['supplier_warehouse'].unique()
+    pvs = routes['ПВ'].unique()
     
     # Статистика по узлам
-    sw_stats = route_stats.groupby('supplier_warehouse').agg({
+    sw_stats = routes.groupby('supplier_warehouse').agg({
         'orders': 'sum',
         'on_time_pct': 'mean'
     }).to_dict('index')
     
-    pv_stats = route_stats.groupby('ПВ').agg({
+    pv_stats = routes.groupby('ПВ', observed=True).agg({
         'orders': 'sum',
         'on_time_pct': 'mean'
     }).to_dict('index')
@@ -1100,7 +1836,7 @@ def update_supply_chain_map():
                    on_time_pct=stats['on_time_pct'])
     
     # Добавляем рёбра: Склад поставщика → ПВ
-    for _, row in route_stats.iterrows():
+    for _, row in routes.iterrows():
         sw_key = f"SW:{row['supplier_warehouse']}"
         pv_key = f"P:{row['ПВ']}"
         G.add_edge(sw_key, pv_key, 
@@ -1235,12 +1971,12 @@ def update_supply_chain_map():
     ax.legend(handles=legend_elements, loc='upper right', fontsize=8, framealpha=0.9)
     
     # Статистика
-    total_routes = len(route_stats)
-    total_orders = route_stats['orders'].sum()
-    avg_on_time = route_stats['on_time_pct'].mean()
+    total_routes = len(routes)
+    total_orders = routes['orders'].sum()
+    avg_on_time = routes['on_time_pct'].mean()
     
-    problematic = route_stats[route_stats['on_time_pct'] < 60]
-    good = route_stats[route_stats['on_time_pct'] >= 80]
+    problematic = routes[routes['on_time_pct'] < 60]
+    good = routes[routes['on_time_pct'] >= 80]
     
     stats_text = (f"Направлений: {total_routes} | Заказов: {total_orders:,}\n"
                   f"✅ Хороших (≥80%): {len(good)} | ⚠️ Проблемных (<60%): {len(problematic)}\n"
@@ -1272,28 +2008,10 @@ def show_problematic_routes():
         return
     
     # Агрегируем данные
-    route_stats = df_current.groupby(['Поставщик', 'Склад', 'ПВ']).agg(
-        orders=('№ заказа', 'nunique'),
-        mean_deviation=('Разница во времени привоза (мин.)', 'mean'),
-        median_deviation=('Разница во времени привоза (мин.)', 'median')
-    ).reset_index()
-    
-    # Рассчитываем % вовремя
-    def calc_on_time_pct(row):
-        mask = (
-            (df_current['Поставщик'] == row['Поставщик']) &
-            (df_current['Склад'] == row['Склад']) &
-            (df_current['ПВ'] == row['ПВ'])
-        )
-        subset = df_current[mask]
-        if len(subset) == 0:
-            return 0
-        return (subset['Разница во времени привоза (мин.)'].between(-30, 30).sum() / len(subset)) * 100
-    
-    route_stats['on_time_pct'] = route_stats.apply(calc_on_time_pct, axis=1)
+    routes = route_stats(df_current)
     
     # Фильтруем проблемные (< 60% вовремя)
-    problematic = route_stats[route_stats['on_time_pct'] < 60].sort_values('on_time_pct')
+    problematic = routes[routes['on_time_pct'] < 60].sort_values('on_time_pct')
     
     if problematic.empty:
         messagebox.showinfo("✅ Отлично!", "Проблемных направлений не найдено (все ≥60% вовремя)")
@@ -1308,7 +2026,7 @@ def show_problematic_routes():
     header = tk.Frame(win, bg=COLORS['danger'])
     header.pack(fill='x')
     tk.Label(header, text=f"🔴 Проблемные направления (<60% вовремя): {len(problematic)}", 
-            font=("Segoe UI", 14, "bold"), bg=COLORS['danger'], fg='white').pack(pady=10)
+            font="SegoeUI14B", bg=COLORS['danger'], fg='white').pack(pady=10)
     
     # Таблица
     table_frame = tk.Frame(win, bg=COLORS['bg'])
@@ -1326,16 +2044,7 @@ def show_problematic_routes():
     tree.column('Ср. откл.', width=90)
     tree.column('Медиана', width=80)
     
-    for _, row in problematic.iterrows():
-        tree.insert('', 'end', values=(
-            row['Поставщик'][:30],
-            row['Склад'][:25],
-            normalize_pv_value(row['ПВ'])[:35],
-            row['orders'],
-            f"{row['on_time_pct']:.1f}%",
-            f"{row['mean_deviation']:+.0f}",
-            f"{row['median_deviation']:+.0f}"
-        ))
+    insert_treeview_rows(tree, [(values, ()) for values in zip(*format_route_columns(problematic))])
     
     scrollbar_v = ttk.Scrollbar(table_frame, orient='vertical', command=tree.yview)
     tree.configure(yscrollcommand=scrollbar_v.set)
@@ -1369,28 +2078,10 @@ def show_popular_routes():
         return
     
     # Агрегируем данные
-    route_stats = df_current.groupby(['Поставщик', 'Склад', 'ПВ']).agg(
-        orders=('№ заказа', 'nunique'),
-        mean_deviation=('Разница во времени привоза (мин.)', 'mean'),
-        median_deviation=('Разница во времени привоза (мин.)', 'median')
-    ).reset_index()
-    
-    # Рассчитываем % вовремя
-    def calc_on_time_pct(row):
-        mask = (
-            (df_current['Поставщик'] == row['Поставщик']) &
-            (df_current['Склад'] == row['Склад']) &
-            (df_current['ПВ'] == row['ПВ'])
-        )
-        subset = df_current[mask]
-        if len(subset) == 0:
-            return 0
-        return (subset['Разница во времени привоза (мин.)'].between(-30, 30).sum() / len(subset)) * 100
-    
-    route_stats['on_time_pct'] = route_stats.apply(calc_on_time_pct, axis=1)
+    routes = route_stats(df_current)
     
     # Топ-30 по количеству заказов
-    popular = route_stats.nlargest(30, 'orders')
+    popular = routes.nlargest(30, 'orders')
     
     # Окно со списком
     win = tk.Toplevel(root)
@@ -1401,7 +2092,7 @@ def show_popular_routes():
     header = tk.Frame(win, bg=COLORS['info'])
     header.pack(fill='x')
     tk.Label(header, text=f"🔥 Топ-30 популярных направлений", 
-            font=("Segoe UI", 14, "bold"), bg=COLORS['info'], fg='white').pack(pady=10)
+            font="SegoeUI14B", bg=COLORS['info'], fg='white').pack(pady=10)
     
     # Таблица
     table_frame = tk.Frame(win, bg=COLORS['bg'])
@@ -1423,24 +2114,11 @@ def show_popular_routes():
     tree.tag_configure('medium', background='#fff9c4')
     tree.tag_configure('bad', background='#ffcdd2')
     
-    for _, row in popular.iterrows():
-        on_time = row['on_time_pct']
-        if on_time >= 80:
-            tag = 'good'
-        elif on_time >= 60:
-            tag = 'medium'
-        else:
-            tag = 'bad'
-        
-        tree.insert('', 'end', values=(
-            row['Поставщик'][:30],
-            row['Склад'][:25],
-            normalize_pv_value(row['ПВ'])[:35],
-            row['orders'],
-            f"{row['on_time_pct']:.1f}%",
-            f"{row['mean_deviation']:+.0f}",
-            f"{row['median_deviation']:+.0f}"
-        ), tags=(tag,))
+    # Текст ячеек и теги строк считаются по столбцам, в цикле только сборка кортежей
+    tag_codes = ontime_tag_codes(popular['on_time_pct']).tolist()
+    insert_treeview_rows(tree, [
+        (values, ONTIME_TAGS[code]) for values, code in zip(zip(*format_route_columns(popular)), tag_codes)
+    ])
     
     scrollbar_v = ttk.Scrollbar(table_frame, orient='vertical', command=tree.yview)
     tree.configure(yscrollcommand=scrollbar_v.set)
@@ -1481,60 +2159,44 @@ def find_schedule_window_for_order_time(warehouse, pv, weekday_name, order_hour,
     if not schedules_cache:
         return None, False
     
-    pv_schedules = get_schedules_for_warehouse_pv(warehouse, pv, warehouse_id, branch_id)
-    if not pv_schedules:
+    if warehouse_id is None or branch_id is None:
+        return None, False
+    
+    # Окна направления, заранее разложенные по дням и отсортированные по времени
+    pv_day_windows = get_schedule_day_windows(warehouse_id, branch_id)
+    if not pv_day_windows:
         return None, False
     
     weekday_num = DAYS_RU.index(weekday_name) + 1 if weekday_name in DAYS_RU else 0
     if weekday_num == 0:
         return None, False
     
-    # Получаем окна для этого дня, сортируем по времени
-    day_windows = [s for s in pv_schedules if s.get('weekday') == weekday_num]
-    
-    def get_minutes(sched):
-        try:
-            t = sched.get('timeOrder', '00:00')
-            h, m = map(int, t.split(':'))
-            return h * 60 + m
-        except:
-            return 0
-    
-    day_windows.sort(key=get_minutes)
-    
+    day_windows = pv_day_windows.get(weekday_num)
     if not day_windows:
         return None, False
     
     order_minutes = order_hour * 60 + 30  # Берём середину часа
     
-    # Ищем подходящее окно
-    prev_window_minutes = 0
-    for sched in day_windows:
-        window_minutes = get_minutes(sched)
-        
-        # Если время заказа <= время текущего окна (и > предыдущего)
-        if order_minutes <= window_minutes:
-            return sched, False
-        
-        prev_window_minutes = window_minutes
+    # Первое окно, время которого >= времени заказа
+    window_minutes, windows = day_windows
+    pos = bisect_left(window_minutes, order_minutes)
+    if pos < len(windows):
+        return windows[pos], False
     
     # Если заказ после последнего окна дня - смотрим на следующий день
     next_weekday_num = (weekday_num % 7) + 1  # 1-7, после 7 идёт 1
-    next_day_windows = [s for s in pv_schedules if s.get('weekday') == next_weekday_num]
-    next_day_windows.sort(key=get_minutes)
+    next_day_windows = pv_day_windows.get(next_weekday_num)
     
     if next_day_windows:
-        return next_day_windows[0], True  # Первое окно следующего дня
+        return next_day_windows[1][0], True  # Первое окно следующего дня
     
     return None, False
 
 
 def update_ml_recommendations_display():
     """Обновление таблицы ML-рекомендаций с привязкой к расписанию"""
-    for item in tree_ml_rec.get_children():
-        tree_ml_rec.delete(item)
-    
     if not recommendations:
+        tree_ml_rec.set_rows([])
         lbl_ml_rec_count.config(text="Рекомендаций: 0 (загрузите данные и дождитесь анализа)")
         return
     
@@ -1542,6 +2204,7 @@ def update_ml_recommendations_display():
     if schedules_cache is None:
         fetch_schedules()
     
+    rows = []
     for rec in recommendations:
         # Определяем цвет по уверенности
         confidence = rec.confidence
@@ -1586,7 +2249,7 @@ def update_ml_recommendations_display():
                     next_day_mark = " (след.день)" if is_next_day else ""
                     current_schedule = f"до {time_order}→{deliver_by}{next_day_mark}"
         
-        tree_ml_rec.insert('', 'end', values=(
+        rows.append(((
             rec.supplier[:25],
             rec.warehouse[:20],
             normalize_pv_value(rec.pv)[:30],
@@ -1596,8 +2259,9 @@ def update_ml_recommendations_display():
             shift_str,
             f"{confidence*100:.0f}%",
             rec.reason[:50] + "..." if len(rec.reason) > 50 else rec.reason
-        ), tags=tags)
+        ), tags))
     
+    tree_ml_rec.set_rows(rows)
     lbl_ml_rec_count.config(text=f"ML-рекомендаций: {len(recommendations)}")
 
 
@@ -1614,14 +2278,9 @@ def show_ml_recommendation_details(event):
     weekday = str(values[3])
     
     # Ищем полную рекомендацию
-    for rec in recommendations:
-        if (rec.supplier[:25] == supplier and 
-            rec.warehouse[:20] == warehouse and 
-            normalize_pv_value(rec.pv)[:30] == pv and
-            rec.weekday[:2] == weekday):
-            
-            show_ml_recommendation_window(rec)
-            return
+    rec = recommendations_index.get((supplier, warehouse, pv, weekday))
+    if rec is not None:
+        show_ml_recommendation_window(rec)
 
 
 def show_ml_recommendation_window(rec):
@@ -1700,9 +2359,9 @@ def show_ml_recommendation_window(rec):
     title_frame.grid_columnconfigure(0, weight=1)
     
     tk.Label(title_frame, text="🤖 ML Рекомендация", 
-            font=("Segoe UI", 18, "bold"), bg=header_color, fg='white').grid(row=0, column=0, sticky='w')
+            font="SegoeUI18B", bg=header_color, fg='white').grid(row=0, column=0, sticky='w')
     tk.Label(title_frame, text=priority_text,
-            font=("Segoe UI", 9), bg=header_color, fg='white').grid(row=0, column=1, sticky='e', padx=10)
+            font="SegoeUI9", bg=header_color, fg='white').grid(row=0, column=1, sticky='e', padx=10)
     
     # Информация о направлении с адаптивностью
     info_header = tk.Frame(header, bg=header_color)
@@ -1710,15 +2369,15 @@ def show_ml_recommendation_window(rec):
     
     # Используем grid для лучшей адаптивности
     supplier_label = tk.Label(info_header, text=f"🏭 {rec.supplier}",
-            font=("Segoe UI", 11, "bold"), bg=header_color, fg='white')
+            font="SegoeUI11B", bg=header_color, fg='white')
     supplier_label.grid(row=0, column=0, sticky='w', padx=(0, 15))
     
     warehouse_label = tk.Label(info_header, text=f"📦 {rec.warehouse}",
-            font=("Segoe UI", 11), bg=header_color, fg='#e3f2fd')
+            font="SegoeUI11", bg=header_color, fg='#e3f2fd')
     warehouse_label.grid(row=0, column=1, sticky='w', padx=(0, 15))
     
     pv_label_widget = tk.Label(info_header, text=f"🏬 {pv_label}",
-            font=("Segoe UI", 11), bg=header_color, fg='#e3f2fd')
+            font="SegoeUI11", bg=header_color, fg='#e3f2fd')
     pv_label_widget.grid(row=0, column=2, sticky='w')
     
     # Настройка адаптивности
@@ -1743,10 +2402,10 @@ def show_ml_recommendation_window(rec):
         inner = tk.Frame(card, bg=COLORS['card'])
         inner.pack(fill='both', expand=True, padx=12, pady=10)
         
-        tk.Label(inner, text=icon, font=("Segoe UI", 16), bg=COLORS['card']).pack()
-        tk.Label(inner, text=label, font=("Segoe UI", 9), bg=COLORS['card'], 
+        tk.Label(inner, text=icon, font="SegoeUI16", bg=COLORS['card']).pack()
+        tk.Label(inner, text=label, font="SegoeUI9", bg=COLORS['card'], 
                 fg=COLORS['text_light'], wraplength=150).pack(pady=(5, 2))
-        tk.Label(inner, text=value, font=("Segoe UI", 14, "bold"), bg=COLORS['card'], 
+        tk.Label(inner, text=value, font="SegoeUI14B", bg=COLORS['card'], 
                 fg=color, wraplength=150).pack()
         
         return card
@@ -1774,7 +2433,7 @@ def show_ml_recommendation_window(rec):
     left_col.grid(row=0, column=0, sticky="nsew", padx=(0, 10))
     left_col.grid_rowconfigure(1, weight=1)
     
-    tk.Label(left_col, text="📋 Основные параметры", font=("Segoe UI", 11, "bold"),
+    tk.Label(left_col, text="📋 Основные параметры", font="SegoeUI11B",
             bg=COLORS['card'], fg=COLORS['primary']).grid(row=0, column=0, sticky='w', padx=15, pady=(15, 10))
     
     params_left = [
@@ -1792,9 +2451,9 @@ def show_ml_recommendation_window(rec):
         row_frame.grid(row=i, column=0, sticky='ew', pady=5)
         params_inner.grid_columnconfigure(0, weight=1)
         
-        tk.Label(row_frame, text=label, font=("Segoe UI", 9), bg=COLORS['card'],
+        tk.Label(row_frame, text=label, font="SegoeUI9", bg=COLORS['card'],
                 fg=COLORS['text_light'], anchor='w').grid(row=0, column=0, sticky='w')
-        value_widget = create_copyable_label(row_frame, value, font=("Segoe UI", 9, "bold"),
+        value_widget = create_copyable_label(row_frame, value, font="SegoeUI9B",
                                             bg=COLORS['card'], fg=COLORS['text'])
         value_widget.grid(row=0, column=1, sticky='w', padx=(5, 0))
         row_frame.grid_columnconfigure(1, weight=1)
@@ -1805,7 +2464,7 @@ def show_ml_recommendation_window(rec):
     right_col.grid(row=0, column=1, sticky="nsew", padx=(10, 0))
     right_col.grid_rowconfigure(1, weight=1)
     
-    tk.Label(right_col, text="💡 Рекомендация", font=("Segoe UI", 11, "bold"),
+    tk.Label(right_col, text="💡 Рекомендация", font="SegoeUI11B",
             bg=COLORS['card'], fg=COLORS['primary']).grid(row=0, column=0, sticky='w', padx=15, pady=(15, 10))
     
     rec_inner = tk.Frame(right_col, bg=COLORS['card'])
@@ -1814,7 +2473,7 @@ def show_ml_recommendation_window(rec):
     rec_inner.grid_columnconfigure(0, weight=1)
     
     reason_widget = create_copyable_text(rec_inner, rec.reason,
-                                        font=("Segoe UI", 9), bg=COLORS['card'],
+                                        font="SegoeUI9", bg=COLORS['card'],
                                         width=40, height=6, wrap='word')
     reason_widget.grid(row=0, column=0, sticky="nsew")
     
@@ -1822,7 +2481,7 @@ def show_ml_recommendation_window(rec):
     sched_frame = tk.Frame(parent_frame, bg=COLORS['bg'])
     sched_frame.pack(fill='x', padx=20, pady=10)
     
-    tk.Label(sched_frame, text="📅 Расписание доставки", font=("Segoe UI", 12, "bold"),
+    tk.Label(sched_frame, text="📅 Расписание доставки", font="SegoeUI12B",
             bg=COLORS['bg'], fg=COLORS['primary']).pack(anchor='w', pady=(0, 10))
     
     # Ищем текущее расписание с учётом времени заказа
@@ -1866,7 +2525,7 @@ def show_ml_recommendation_window(rec):
         current_inner = tk.Frame(current_card, bg='#e3f2fd')
         current_inner.pack(fill='x', padx=15, pady=12)
         
-        tk.Label(current_inner, text="📋 Текущее расписание", font=("Segoe UI", 10, "bold"),
+        tk.Label(current_inner, text="📋 Текущее расписание", font="SegoeUI10B",
                 bg='#e3f2fd', fg=COLORS['primary']).pack(anchor='w', pady=(0, 8))
         
         sched_info = f"📅 {sched_day_name}\n⏰ Заказ до: {time_order}\n🚚 Доставят к: {deliver_by}\n{type_str}\n⏱️ Длительность: {duration} мин"
@@ -1874,7 +2533,7 @@ def show_ml_recommendation_window(rec):
             sched_info += f"\n{next_day_note}"
         
         current_text = create_copyable_text(current_inner, sched_info,
-                                           font=("Segoe UI", 9), bg='#e3f2fd',
+                                           font="SegoeUI9", bg='#e3f2fd',
                                            width=70, height=6, wrap='word')
         current_text.pack(anchor='w', fill='x')
         
@@ -1890,12 +2549,12 @@ def show_ml_recommendation_window(rec):
         recommended_inner.pack(fill='x', padx=15, pady=12)
         
         tk.Label(recommended_inner, text="✅ Рекомендуемое расписание", 
-                font=("Segoe UI", 10, "bold"), bg='#c8e6c9', fg=COLORS['success']).pack(anchor='w', pady=(0, 8))
+                font="SegoeUI10B", bg='#c8e6c9', fg=COLORS['success']).pack(anchor='w', pady=(0, 8))
         
         rec_sched_info = f"📅 {sched_day_name}\n⏰ Заказ до: {time_order}\n🚚 Доставят к: {new_deliver_by}\n{type_str}\n⏱️ Новая длительность: {new_duration} мин ({shift:+d} мин)"
         
         recommended_text = create_copyable_text(recommended_inner, rec_sched_info,
-                                               font=("Segoe UI", 9, "bold"), bg='#c8e6c9',
+                                               font="SegoeUI9B", bg='#c8e6c9',
                                                fg=COLORS['success'], width=70, height=6, wrap='word')
         recommended_text.pack(anchor='w', fill='x')
     else:
@@ -1904,14 +2563,14 @@ def show_ml_recommendation_window(rec):
         no_sched_card.pack(fill='x')
         
         tk.Label(no_sched_card, text="⚠️ Расписание не найдено для данного направления",
-                font=("Segoe UI", 10), bg='#ffebee', fg=COLORS['danger'],
+                font="SegoeUI10", bg='#ffebee', fg=COLORS['danger'],
                 pady=15).pack()
     
     # Данные, на основе которых принято решение - улучшенное отображение
     data_section = tk.Frame(parent_frame, bg=COLORS['bg'])
     data_section.pack(fill='x', padx=20, pady=15)
     
-    tk.Label(data_section, text="📊 Данные для анализа", font=("Segoe UI", 12, "bold"),
+    tk.Label(data_section, text="📊 Данные для анализа", font="SegoeUI12B",
             bg=COLORS['bg'], fg=COLORS['primary']).pack(anchor='w', pady=(0, 10))
     
     data_frame = tk.Frame(data_section, bg=COLORS['card'], relief='flat', bd=1,
@@ -1920,42 +2579,41 @@ def show_ml_recommendation_window(rec):
     
     # Получаем статистику из исходных данных
     if df_current is not None and not df_current.empty:
-        # Фильтруем данные по параметрам рекомендации
-        mask = (
-            (df_current['Поставщик'] == rec.supplier) &
-            (df_current['Склад'] == rec.warehouse) &
-            (df_current['ПВ'].apply(normalize_pv_value) == pv_label) &
-            (df_current['День_недели'] == rec.weekday)
-        )
-        
-        filtered_data = df_current[mask].copy()
+        # Фильтруем данные по параметрам рекомендации: строки направления берём из
+        # кэшированного индекса (ПВ нормализован при загрузке), без копии df_current
+        rows = get_direction_rows(rec.supplier, rec.warehouse, pv_label)
+        direction = df_current[['Время заказа позиции', 'Разница во времени привоза (мин.)', 'День_недели']].take(
+            rows if rows is not None else _NO_ROWS)
+        filtered_data = direction[direction['День_недели'] == rec.weekday]
         
         if not filtered_data.empty and 'Разница во времени привоза (мин.)' in filtered_data.columns:
             # Сортируем по дате
             if 'Время заказа позиции' in filtered_data.columns:
                 filtered_data = filtered_data.sort_values('Время заказа позиции')
             
-            deviations = filtered_data['Разница во времени привоза (мин.)'].dropna()
+            # Один массив numpy без пропусков - все счётчики и статистики считаются по нему
+            deviations = filtered_data['Разница во времени привоза (мин.)'].to_numpy(dtype=float)
+            deviations = deviations[~np.isnan(deviations)]
             
-            if len(deviations) > 0:
+            if deviations.size > 0:
+                total_devs = deviations.size
+                on_time_pct = np.count_nonzero(np.abs(deviations) <= 30) / total_devs * 100
+                late_pct = np.count_nonzero(deviations > 30) / total_devs * 100
+                early_pct = np.count_nonzero(deviations < -30) / total_devs * 100
+                total_std = deviations.std(ddof=1) if total_devs > 1 else 0
+                
                 # Разделяем на периоды (как в ML-модели)
-                cutoff_idx = len(deviations) * 2 // 3
-                if cutoff_idx >= 3 and len(deviations) - cutoff_idx >= 3:
-                    recent_devs = deviations.iloc[cutoff_idx:].values
-                    older_devs = deviations.iloc[:cutoff_idx].values
-                    
-                    import statistics
-                    recent_median = statistics.median(recent_devs)
-                    older_median = statistics.median(older_devs)
-                    recent_mean = statistics.mean(recent_devs)
-                    older_mean = statistics.mean(older_devs)
+                cutoff_idx = total_devs * 2 // 3
+                if cutoff_idx >= 3 and total_devs - cutoff_idx >= 3:
+                    recent_devs = deviations[cutoff_idx:]
+                    older_devs = deviations[:cutoff_idx]
                     
-                    try:
-                        recent_std = statistics.stdev(recent_devs) if len(recent_devs) > 1 else 0
-                        older_std = statistics.stdev(older_devs) if len(older_devs) > 1 else 0
-                    except:
-                        recent_std = 0
-                        older_std = 0
+                    recent_median = np.median(recent_devs)
+                    older_median = np.median(older_devs)
+                    recent_mean = recent_devs.mean()
+                    older_mean = older_devs.mean()
+                    recent_std = recent_devs.std(ddof=1)
+                    older_std = older_devs.std(ddof=1)
                     
                     # Статистика по периодам
                     stats_text = f"""📈 СТАТИСТИКА ПО ПЕРИОДАМ:
@@ -1965,66 +2623,65 @@ def show_ml_recommendation_window(rec):
    • Медиана отклонения: {older_median:+.1f} мин
    • Среднее отклонение: {older_mean:+.1f} мин
    • Стандартное отклонение: {older_std:.1f} мин
-   • Минимум: {min(older_devs):+.1f} мин
-   • Максимум: {max(older_devs):+.1f} мин
+   • Минимум: {older_devs.min():+.1f} мин
+   • Максимум: {older_devs.max():+.1f} мин
 
 🕑 ПОСЛЕДНИЙ ПЕРИОД (последние {len(recent_devs)} заказов):
    • Количество заказов: {len(recent_devs)}
    • Медиана отклонения: {recent_median:+.1f} мин
    • Среднее отклонение: {recent_mean:+.1f} мин
    • Стандартное отклонение: {recent_std:.1f} мин
-   • Минимум: {min(recent_devs):+.1f} мин
-   • Максимум: {max(recent_devs):+.1f} мин
+   • Минимум: {recent_devs.min():+.1f} мин
+   • Максимум: {recent_devs.max():+.1f} мин
 
 📊 ИЗМЕНЕНИЕ:
    • Разница медиан: {recent_median - older_median:+.1f} мин
    • Разница средних: {recent_mean - older_mean:+.1f} мин
 
-📋 ОБЩАЯ СТАТИСТИКА (все {len(deviations)} заказов):
-   • Медиана: {statistics.median(deviations):+.1f} мин
-   • Среднее: {statistics.mean(deviations):+.1f} мин
-   • Стандартное отклонение: {statistics.stdev(deviations) if len(deviations) > 1 else 0:.1f} мин
-   • Вовремя (±30 мин): {(deviations.between(-30, 30).sum() / len(deviations) * 100):.1f}%
-   • Опозданий (>30 мин): {((deviations > 30).sum() / len(deviations) * 100):.1f}%
-   • Ранних (<-30 мин): {((deviations < -30).sum() / len(deviations) * 100):.1f}%"""
+📋 ОБЩАЯ СТАТИСТИКА (все {total_devs} заказов):
+   • Медиана: {np.median(deviations):+.1f} мин
+   • Среднее: {deviations.mean():+.1f} мин
+   • Стандартное отклонение: {total_std:.1f} мин
+   • Вовремя (±30 мин): {on_time_pct:.1f}%
+   • Опозданий (>30 мин): {late_pct:.1f}%
+   • Ранних (<-30 мин): {early_pct:.1f}%"""
                     
                     data_widget = create_copyable_text(data_frame, stats_text,
-                                                      font=("Segoe UI", 9), bg=COLORS['card'],
+                                                      font="SegoeUI9", bg=COLORS['card'],
                                                       width=80, height=20, wrap='word')
                     data_widget.pack(fill='both', expand=True, padx=15, pady=15)
                 else:
                     # Если недостаточно данных для разделения на периоды
-                    import statistics
-                    stats_text = f"""📊 ОБЩАЯ СТАТИСТИКА ({len(deviations)} заказов):
-   • Медиана отклонения: {statistics.median(deviations):+.1f} мин
-   • Среднее отклонение: {statistics.mean(deviations):+.1f} мин
-   • Стандартное отклонение: {statistics.stdev(deviations) if len(deviations) > 1 else 0:.1f} мин
-   • Минимум: {min(deviations):+.1f} мин
-   • Максимум: {max(deviations):+.1f} мин
-   • Вовремя (±30 мин): {(deviations.between(-30, 30).sum() / len(deviations) * 100):.1f}%
-   • Опозданий (>30 мин): {((deviations > 30).sum() / len(deviations) * 100):.1f}%
-   • Ранних (<-30 мин): {((deviations < -30).sum() / len(deviations) * 100):.1f}%"""
+                    stats_text = f"""📊 ОБЩАЯ СТАТИСТИКА ({total_devs} заказов):
+   • Медиана отклонения: {np.median(deviations):+.1f} мин
+   • Среднее отклонение: {deviations.mean():+.1f} мин
+   • Стандартное отклонение: {total_std:.1f} мин
+   • Минимум: {deviations.min():+.1f} мин
+   • Максимум: {deviations.max():+.1f} мин
+   • Вовремя (±30 мин): {on_time_pct:.1f}%
+   • Опозданий (>30 мин): {late_pct:.1f}%
+   • Ранних (<-30 мин): {early_pct:.1f}%"""
                     
                     data_widget = create_copyable_text(data_frame, stats_text,
-                                                      font=("Segoe UI", 9), bg=COLORS['card'],
+                                                      font="SegoeUI9", bg=COLORS['card'],
                                                       width=80, height=12, wrap='word')
                     data_widget.pack(fill='both', expand=True, padx=15, pady=15)
             else:
                 tk.Label(data_frame, text="📭 Нет данных об отклонениях для анализа",
-                        font=("Segoe UI", 10), bg=COLORS['card'], fg=COLORS['text_light']).pack(pady=20)
+                        font="SegoeUI10", bg=COLORS['card'], fg=COLORS['text_light']).pack(pady=20)
         else:
             tk.Label(data_frame, text="📭 Недостаточно данных для анализа",
-                    font=("Segoe UI", 10), bg=COLORS['card'], fg=COLORS['text_light']).pack(pady=20)
+                    font="SegoeUI10", bg=COLORS['card'], fg=COLORS['text_light']).pack(pady=20)
     else:
         tk.Label(data_frame, text="📭 Данные не загружены",
-                font=("Segoe UI", 10), bg=COLORS['card'], fg=COLORS['text_light']).pack(pady=20)
+                font="SegoeUI10", bg=COLORS['card'], fg=COLORS['text_light']).pack(pady=20)
     
     # Примеры заказов - улучшенное отображение
     if rec.example_orders:
         examples_section = tk.Frame(parent_frame, bg=COLORS['bg'])
         examples_section.pack(fill='x', padx=20, pady=15)
         
-        tk.Label(examples_section, text="📋 Примеры заказов", font=("Segoe UI", 12, "bold"),
+        tk.Label(examples_section, text="📋 Примеры заказов", font="SegoeUI12B",
                 bg=COLORS['bg'], fg=COLORS['primary']).pack(anchor='w', pady=(0, 10))
         
         examples_frame = tk.Frame(examples_section, bg=COLORS['card'], relief='flat', bd=1,
@@ -2063,14 +2720,12 @@ def show_ml_recommendation_window(rec):
         import sys
         debug_info = []
         
+        # Строки собираем заранее, тег берём из таблицы по двум порогам без ветвлений
+        rows = []
         for ex in rec.example_orders[:5]:
             deviation = ex.get('deviation', 0) or 0
-            if -30 <= deviation <= 30:
-                tags = ('good',)
-            elif 30 < abs(deviation) <= 60:
-                tags = ('medium',)
-            else:
-                tags = ('bad',)
+            abs_dev = abs(deviation)
+            tags = DEVIATION_TAGS[3 - (abs_dev <= 30) - (abs_dev <= 60)]
             
             # Получаем значения напрямую из словаря
             order_id = ex.get('order_id', '') or ''
@@ -2088,15 +2743,18 @@ def show_ml_recommendation_window(rec):
                 'fact_time': fact_time
             })
             
-            # Вставляем данные - порядок должен соответствовать порядку колонок
-            tree_ex.insert('', 'end', values=(
+            # Порядок значений должен соответствовать порядку колонок
+            rows.append(((
                 str(order_id),
                 str(order_date),
                 str(order_time),
                 str(plan_time),
                 str(fact_time),
                 f"{deviation:+.0f}" if deviation else ''
-            ), tags=tags)
+            ), tags))
+        
+        # Строки вставляем одним вызовом Tcl
+        insert_treeview_rows(tree_ex, rows)
         
         # Выводим отладочную информацию в консоль (можно убрать после проверки)
         if debug_info:
@@ -2137,7 +2795,7 @@ def show_ml_recommendation_window(rec):
         
         tree_ex.bind('<Double-1>', on_example_click)
         tk.Label(examples_frame, text="💡 Двойной клик — открыть заказ в CRM",
-                font=("Segoe UI", 8), fg=COLORS['text_light'], bg=COLORS['card']).pack(pady=(5, 0))
+                font="SegoeUI8", fg=COLORS['text_light'], bg=COLORS['card']).pack(pady=(5, 0))
     
     # Кнопки действий
     btn_frame = tk.Frame(parent_frame, bg=COLORS['bg'])
@@ -2148,11 +2806,11 @@ def show_ml_recommendation_window(rec):
     
     tk.Button(btn_inner, text="📊 Детальный анализ поставщика",
              command=lambda: (win.destroy(), show_supplier_details(rec.supplier, rec.warehouse, rec.pv)),
-             font=("Segoe UI", 10, "bold"), bg=COLORS['info'], fg='white', 
+             font="SegoeUI10B", bg=COLORS['info'], fg='white', 
              width=25, height=2, cursor='hand2', relief='flat').pack(side='left', padx=5)
     
     tk.Button(btn_inner, text="✖ Закрыть", command=win.destroy,
-             font=("Segoe UI", 10), bg=COLORS['text_light'], fg='white', 
+             font="SegoeUI10", bg=COLORS['text_light'], fg='white', 
              width=15, height=2, cursor='hand2', relief='flat').pack(side='left', padx=5)
 
 
@@ -2184,9 +2842,28 @@ def on_stats_double_click(event):
     show_supplier_details(supplier, warehouse, pv)
 
 
-def show_orders_for_day(supplier, warehouse, pv, day, parent_df):
-    """Показать все заказы за конкретный день недели"""
-    day_data = parent_df[parent_df['День_недели'] == day].copy()
+# Столбцы, которые нужны окнам детализации заказов
+ORDER_DETAIL_COLUMNS = ['№ заказа', 'День_недели', 'Время заказа позиции', 'Рассчетное время привоза',
+                        'Время поступления на склад', 'Разница во времени привоза (мин.)']
+
+# Столбцы для окна анализа поставщика (ID нужны для сопоставления с расписанием,
+# служебные коды - для статистики по ПВ)
+SUPPLIER_DETAIL_COLUMNS = ORDER_DETAIL_COLUMNS + ['ПВ', 'warehouseId', 'branchId', '_dev_cat', '_order_code']
+
+
+# Пустой набор позиций строк для take()
+_NO_ROWS = np.empty(0, dtype=np.intp)
+
+
+def show_orders_for_day(supplier, warehouse, pv, day, parent_df, day_groups=None):
+    """Показать все заказы за конкретный день недели
+    
+    day_groups - готовые позиции строк parent_df по дням (groupby('День_недели').indices)
+    """
+    if day_groups is not None:
+        day_data = parent_df[ORDER_DETAIL_COLUMNS].take(day_groups.get(day, _NO_ROWS))
+    else:
+        day_data = parent_df.loc[parent_df['День_недели'] == day, ORDER_DETAIL_COLUMNS]
     
     if day_data.empty:
         messagebox.showinfo("ℹ️ Информация", f"Нет заказов в {day}")
@@ -2200,11 +2877,11 @@ def show_orders_for_day(supplier, warehouse, pv, day, parent_df):
     # Заголовок
     header = tk.Frame(win, bg=COLORS['info'])
     header.pack(fill='x')
-    tk.Label(header, text=f"📋 {day} | {supplier}", font=("Segoe UI", 14, "bold"),
+    tk.Label(header, text=f"📋 {day} | {supplier}", font="SegoeUI14B",
             bg=COLORS['info'], fg='white').pack(pady=10)
-    tk.Label(header, text=f"Склад: {warehouse} | ПВ: {pv}", font=("Segoe UI", 10),
+    tk.Label(header, text=f"Склад: {warehouse} | ПВ: {pv}", font="SegoeUI10",
             bg=COLORS['info'], fg='white').pack()
-    tk.Label(header, text=f"Всего заказов: {len(day_data)}", font=("Segoe UI", 10),
+    tk.Label(header, text=f"Всего заказов: {len(day_data)}", font="SegoeUI10",
             bg=COLORS['info'], fg='white').pack(pady=(0, 10))
     
     # Таблица с прокруткой
@@ -2220,24 +2897,18 @@ def show_orders_for_day(supplier, warehouse, pv, day, parent_df):
     tree.column('Откл. (мин)', width=100)
     add_tooltips_to_treeview(tree, cols)
     
-    for _, row in day_data.iterrows():
-        dev = row['Разница во времени привоза (мин.)']
-        tags = ()
-        if pd.notna(dev):
-            if abs(dev) <= 30:
-                tags = ('good',)
-            elif abs(dev) <= 60:
-                tags = ('medium',)
-            else:
-                tags = ('bad',)
-        
-        tree.insert('', 'end', values=(
-            row['№ заказа'],
-            row['Время заказа позиции'].strftime('%d.%m.%Y %H:%M') if pd.notna(row['Время заказа позиции']) else '',
-            row['Рассчетное время привоза'].strftime('%d.%m.%Y %H:%M') if pd.notna(row['Рассчетное время привоза']) else '',
-            row['Время поступления на склад'].strftime('%d.%m.%Y %H:%M') if pd.notna(row['Время поступления на склад']) else '',
-            f"{dev:+.0f}" if pd.notna(dev) else ''
-        ), tags=tags)
+    # Столбцы для отображения готовим векторно
+    dev = day_data['Разница во времени привоза (мин.)'].to_numpy(dtype=float)
+    columns = (
+        day_data['№ заказа'].tolist(),
+        format_datetime_column(day_data['Время заказа позиции']),
+        format_datetime_column(day_data['Рассчетное время привоза']),
+        format_datetime_column(day_data['Время поступления на склад']),
+        format_deviation_column(dev)
+    )
+    
+    tags = [DEVIATION_TAGS[code] for code in deviation_tag_codes(dev)]
+    insert_treeview_rows(tree, zip(zip(*columns), tags))
     
     tree.tag_configure('good', foreground=COLORS['success'])
     tree.tag_configure('medium', foreground=COLORS['warning'])
@@ -2265,12 +2936,20 @@ def show_orders_for_day(supplier, warehouse, pv, day, parent_df):
     table_frame.grid_columnconfigure(0, weight=1)
     
     tk.Label(win, text="💡 Двойной клик на заказ — открыть в CRM", 
-            font=("Segoe UI", 9), fg=COLORS['text_light'], bg=COLORS['bg']).pack(pady=5)
+            font="SegoeUI9", fg=COLORS['text_light'], bg=COLORS['bg']).pack(pady=5)
 
 
-def show_orders_for_hour(supplier, warehouse, pv, hour, parent_df):
-    """Показать все заказы за конкретный час"""
-    hour_data = parent_df[parent_df['Время заказа позиции'].dt.hour == hour].copy()
+def show_orders_for_hour(supplier, warehouse, pv, hour, parent_df, hour_groups=None):
+    """Показать все заказы за конкретный час
+    
+    hour_groups - готовые позиции строк parent_df по часам (groupby('Час').indices)
+    """
+    if hour_groups is not None:
+        hour_data = parent_df[ORDER_DETAIL_COLUMNS].take(hour_groups.get(hour, _NO_ROWS))
+    else:
+        # Готовый столбец 'Час' избавляет от пересчёта .dt.hour при каждом открытии
+        hours = parent_df['Час'] if 'Час' in parent_df.columns else parent_df['Время заказа позиции'].dt.hour
+        hour_data = parent_df.loc[hours == hour, ORDER_DETAIL_COLUMNS]
     
     if hour_data.empty:
         messagebox.showinfo("ℹ️ Информация", f"Нет заказов в {hour}:00")
@@ -2284,11 +2963,11 @@ def show_orders_for_hour(supplier, warehouse, pv, hour, parent_df):
     # Заголовок
     header = tk.Frame(win, bg=COLORS['warning'])
     header.pack(fill='x')
-    tk.Label(header, text=f"⏰ Час: {hour:02d}:00 | {supplier}", font=("Segoe UI", 14, "bold"),
+    tk.Label(header, text=f"⏰ Час: {hour:02d}:00 | {supplier}", font="SegoeUI14B",
             bg=COLORS['warning'], fg='white').pack(pady=10)
-    tk.Label(header, text=f"Склад: {warehouse} | ПВ: {pv}", font=("Segoe UI", 10),
+    tk.Label(header, text=f"Склад: {warehouse} | ПВ: {pv}", font="SegoeUI10",
             bg=COLORS['warning'], fg='white').pack()
-    tk.Label(header, text=f"Всего заказов: {len(hour_data)}", font=("Segoe UI", 10),
+    tk.Label(header, text=f"Всего заказов: {len(hour_data)}", font="SegoeUI10",
             bg=COLORS['warning'], fg='white').pack(pady=(0, 10))
     
     # Таблица с прокруткой
@@ -2305,25 +2984,19 @@ def show_orders_for_hour(supplier, warehouse, pv, hour, parent_df):
     tree.column('Откл. (мин)', width=100)
     add_tooltips_to_treeview(tree, cols)
     
-    for _, row in hour_data.iterrows():
-        dev = row['Разница во времени привоза (мин.)']
-        tags = ()
-        if pd.notna(dev):
-            if abs(dev) <= 30:
-                tags = ('good',)
-            elif abs(dev) <= 60:
-                tags = ('medium',)
-            else:
-                tags = ('bad',)
-        
-        tree.insert('', 'end', values=(
-            row['№ заказа'],
-            row['День_недели'][:2] if row['День_недели'] else '',
-            row['Время заказа позиции'].strftime('%d.%m.%Y %H:%M') if pd.notna(row['Время заказа позиции']) else '',
-            row['Рассчетное время привоза'].strftime('%d.%m.%Y %H:%M') if pd.notna(row['Рассчетное время привоза']) else '',
-            row['Время поступления на склад'].strftime('%d.%m.%Y %H:%M') if pd.notna(row['Время поступления на склад']) else '',
-            f"{dev:+.0f}" if pd.notna(dev) else ''
-        ), tags=tags)
+    # Столбцы для отображения готовим векторно
+    dev = hour_data['Разница во времени привоза (мин.)'].to_numpy(dtype=float)
+    columns = (
+        hour_data['№ заказа'].tolist(),
+        format_text_column(hour_data['День_недели'], 2),
+        format_datetime_column(hour_data['Время заказа позиции']),
+        format_datetime_column(hour_data['Рассчетное время привоза']),
+        format_datetime_column(hour_data['Время поступления на склад']),
+        format_deviation_column(dev)
+    )
+    
+    tags = [DEVIATION_TAGS[code] for code in deviation_tag_codes(dev)]
+    insert_treeview_rows(tree, zip(zip(*columns), tags))
     
     tree.tag_configure('good', foreground=COLORS['success'])
     tree.tag_configure('medium', foreground=COLORS['warning'])
@@ -2351,7 +3024,26 @@ def show_orders_for_hour(supplier, warehouse, pv, hour, parent_df):
     table_frame.grid_columnconfigure(0, weight=1)
     
     tk.Label(win, text="💡 Двойной клик на заказ — открыть в CRM", 
-            font=("Segoe UI", 9), fg=COLORS['text_light'], bg=COLORS['bg']).pack(pady=5)
+            font="SegoeUI9", fg=COLORS['text_light'], bg=COLORS['bg']).pack(pady=5)
+
+
+# Индексы строк df_current по направлениям (пересчитываются при смене df_current)
+_direction_index_cache = {'df': None, 'full': None, 'sw': None}
+
+# Открытые окна анализа: (поставщик, склад, ПВ) -> (df_current на момент открытия, окно)
+_supplier_windows = {}
+
+
+def get_direction_rows(supplier, warehouse, pv_label=None):
+    """Позиции строк df_current для направления (без фильтра по ПВ если pv_label=None)"""
+    cache = _direction_index_cache
+    if cache['df'] is not df_current:
+        cache['df'] = df_current
+        cache['full'] = df_current.groupby(['Поставщик', 'Склад', 'ПВ'], sort=False, observed=True).indices
+        cache['sw'] = df_current.groupby(['Поставщик', 'Склад'], sort=False, observed=True).indices
+    if pv_label is None:
+        return cache['sw'].get((supplier, warehouse))
+    return cache['full'].get((supplier, warehouse, pv_label))
 
 
 def show_supplier_details(supplier, warehouse, pv=None):
@@ -2360,17 +3052,37 @@ def show_supplier_details(supplier, warehouse, pv=None):
         return
     
     pv_label = normalize_pv_value(pv) if pv is not None else "Все ПВ"
-    mask = (df_current['Поставщик'] == supplier) & (df_current['Склад'] == warehouse)
-    if pv is not None:
-        mask &= (df_current['ПВ'] == pv_label)
-    subset = df_current[mask].copy()
     
-    if subset.empty:
+    # Окно для этого направления уже открыто на тех же данных - показываем его
+    window_key = (supplier, warehouse, pv_label)
+    opened = _supplier_windows.get(window_key)
+    if opened is not None and opened[0] is df_current and opened[1].winfo_exists():
+        opened[1].deiconify()
+        opened[1].lift()
+        return
+    
+    rows = get_direction_rows(supplier, warehouse, pv_label if pv is not None else None)
+    if rows is None or len(rows) == 0:
         messagebox.showinfo("ℹ️ Информация", "Нет данных")
         return
     
+    # Без копии всего df_current: берём только нужные столбцы найденных строк
+    columns = [col for col in SUPPLIER_DETAIL_COLUMNS if col in df_current.columns]
+    subset = df_current[columns].take(rows)
+    # Час и минута заказа разбираются один раз на df_current и переиспользуются всеми окнами
+    derived = get_derived('frame', DerivedFrame)
+    subset = subset.assign(Час=derived.hour[rows])
+    
     # Создаем окно
     win = tk.Toplevel(root)
+    _supplier_windows[window_key] = (df_current, win)
+    
+    def forget_window(event):
+        # <Destroy> приходит и от дочерних виджетов; запись удаляем только для самого окна,
+        # если её ещё не заняло более новое окно того же направления
+        if event.widget is win and _supplier_windows.get(window_key, (None, None))[1] is win:
+            del _supplier_windows[window_key]
+    win.bind('<Destroy>', forget_window)
     win.title(f"📊 {supplier} — {warehouse} | {pv_label}")
     win.geometry("1200x800")
     win.configure(bg=COLORS['bg'])
@@ -2382,7 +3094,7 @@ def show_supplier_details(supplier, warehouse, pv=None):
     tk.Label(
         header,
         text=f"📊 Анализ: {supplier}",
-        font=("Segoe UI", 16, "bold"),
+        font="SegoeUI16B",
         bg=COLORS['header'],
         fg='white'
     ).pack(pady=10)
@@ -2390,678 +3102,634 @@ def show_supplier_details(supplier, warehouse, pv=None):
     tk.Label(
         header,
         text=f"Склад: {warehouse} | ПВ: {pv_label} | Заказов: {len(subset):,}",
-        font=("Segoe UI", 11),
+        font="SegoeUI11",
         bg=COLORS['header'],
         fg='#b0bec5'
-    ).pack(pady=(0, 10))
-    
-    # Notebook для вкладок
-    notebook = ttk.Notebook(win)
-    notebook.pack(fill='both', expand=True, padx=10, pady=10)
-    
-    # === Вкладка 1: Графики ===
-    frame_charts = ttk.Frame(notebook)
-    notebook.add(frame_charts, text="📈 Графики")
-    
-    # Кнопка помощи
-    help_frame = tk.Frame(frame_charts, bg=COLORS['bg'])
-    help_frame.pack(fill='x', padx=10, pady=5)
-    
-    tk.Button(
-        help_frame,
-        text="❓ Как читать графики?",
-        command=lambda: show_charts_guide(),
-        font=("Segoe UI", 10),
-        bg=COLORS['info'],
-        fg='white',
-        cursor='hand2'
-    ).pack(side='right', padx=5)
-    
-    create_supplier_charts(frame_charts, subset, supplier, pv_label)
-    
-    # === Вкладка 2: Расписание для выбранного направления (сетка) ===
-    frame_weekday = ttk.Frame(notebook)
-    notebook.add(frame_weekday, text="📅 По расписанию")
-    
-    # Информация
-    info_wd = tk.Frame(frame_weekday, bg='#e8f5e9')
-    info_wd.pack(fill='x', padx=10, pady=5)
-    tk.Label(info_wd, text=f"📅 Расписание для: {warehouse} → {pv_label}\n🔴 Красные окна — проблемы, 🟡 Жёлтые — предупреждения. Клик на ячейку — детали отклонений.",
-            font=("Segoe UI", 9), bg='#e8f5e9', fg=COLORS['text'], justify='left').pack(pady=5, padx=10, anchor='w')
-    
-    # Получаем ID из данных для точного сопоставления с расписанием
-    warehouse_id = None
-    branch_id = None
-    if 'warehouseId' in subset.columns and subset['warehouseId'].notna().any():
-        warehouse_id = subset['warehouseId'].dropna().iloc[0] if len(subset['warehouseId'].dropna()) > 0 else None
-    if 'branchId' in subset.columns and subset['branchId'].notna().any():
-        branch_id = subset['branchId'].dropna().iloc[0] if len(subset['branchId'].dropna()) > 0 else None
-    
-    # Загружаем расписание для данного направления (склад + ПВ)
-    schedules_for_direction = get_schedules_for_warehouse_pv(warehouse, pv_label, warehouse_id, branch_id)
-    
-    # Подготовка данных с часами
-    subset_wd = subset.copy()
-    subset_wd['Час'] = subset_wd['Время заказа позиции'].dt.hour
-    subset_wd['Минута'] = subset_wd['Время заказа позиции'].dt.minute
-    
-    # Frame для сетки с прокруткой
-    grid_outer = tk.Frame(frame_weekday, bg=COLORS['bg'])
-    grid_outer.pack(fill='both', expand=True, padx=10, pady=5)
-    
-    # Canvas для прокрутки
-    grid_canvas = tk.Canvas(grid_outer, bg=COLORS['bg'], highlightthickness=0)
-    scrollbar_grid_v = ttk.Scrollbar(grid_outer, orient='vertical', command=grid_canvas.yview)
-    scrollbar_grid_h = ttk.Scrollbar(grid_outer, orient='horizontal', command=grid_canvas.xview)
-    
-    grid_frame = tk.Frame(grid_canvas, bg=COLORS['bg'])
-    grid_canvas.create_window((0, 0), window=grid_frame, anchor='nw')
-    grid_canvas.configure(yscrollcommand=scrollbar_grid_v.set, xscrollcommand=scrollbar_grid_h.set)
-    
-    def on_grid_configure(event):
-        grid_canvas.configure(scrollregion=grid_canvas.bbox('all'))
-    grid_frame.bind('<Configure>', on_grid_configure)
-    
-    # Прокрутка колесом мыши
-    def on_grid_mousewheel(event):
-        grid_canvas.yview_scroll(int(-1*(event.delta/120)), 'units')
-    def on_grid_mousewheel_linux(event):
-        if event.num == 4:
-            grid_canvas.yview_scroll(-1, 'units')
-        elif event.num == 5:
-            grid_canvas.yview_scroll(1, 'units')
+    ).pack(pady=(0, 10))
     
-    grid_canvas.bind('<MouseWheel>', on_grid_mousewheel)
-    grid_canvas.bind('<Button-4>', on_grid_mousewheel_linux)
-    grid_canvas.bind('<Button-5>', on_grid_mousewheel_linux)
+    # Notebook для вкладок
+    notebook = ttk.Notebook(win)
+    notebook.pack(fill='both', expand=True, padx=10, pady=10)
     
-    # Группируем расписание по дням недели
-    schedule_by_day = {i: [] for i in range(1, 8)}  # 1=Пн ... 7=Вс
+    # === Вкладка 1: Графики ===
+    frame_charts = ttk.Frame(notebook)
+    notebook.add(frame_charts, text="📈 Графики")
     
-    if schedules_for_direction:
-        for sched in schedules_for_direction:
-            weekday = sched.get('weekday', 1)
-            if 1 <= weekday <= 7:
-                schedule_by_day[weekday].append(sched)
-        
-        # Сортируем окна внутри каждого дня по времени
-        for day in schedule_by_day:
-            schedule_by_day[day].sort(key=lambda x: x.get('timeOrder', '00:00'))
+    # === Вкладка 2: Расписание для выбранного направления (сетка) ===
+    frame_weekday = ttk.Frame(notebook)
+    notebook.add(frame_weekday, text="📅 По расписанию")
     
-    # Определяем максимальное количество окон в день для ширины колонок
-    max_windows = max(len(windows) for windows in schedule_by_day.values()) if schedules_for_direction else 1
-    max_windows = max(max_windows, 1)
+    # === Вкладка 3: По ПВ ===
+    frame_pv = ttk.Frame(notebook)
+    notebook.add(frame_pv, text="🏬 По ПВ")
     
-    # Функция показа деталей окна
-    def show_window_details(sched, window_data, median_dev, on_time_pct, duration_diff):
-        """Показать детали отклонений для окна расписания"""
-        weekday_num = sched.get('weekday')
-        time_order = sched.get('timeOrder', '')
-        delivery_duration = sched.get('deliveryDuration', 0)
-        weekday_name = WEEKDAY_MAP.get(weekday_num, f"День {weekday_num}")
-        deliver_by = calculate_expected_delivery(time_order, delivery_duration)
-        
-        detail_win = tk.Toplevel(win)
-        detail_win.title(f"📊 Детали: {weekday_name} {time_order}")
-        detail_win.geometry("800x600")
-        detail_win.configure(bg=COLORS['bg'])
-        
-        # Заголовок
-        header_detail = tk.Frame(detail_win, bg=COLORS['header'])
-        header_detail.pack(fill='x')
-        tk.Label(header_detail, text=f"📊 {weekday_name}: заказ до {time_order} → доставка к {deliver_by}",
-                font=("Segoe UI", 14, "bold"), bg=COLORS['header'], fg='white').pack(pady=10)
-        
-        # Информация о направлении
-        info_detail = tk.Frame(detail_win, bg='#e8f5e9')
-        info_detail.pack(fill='x', padx=10, pady=5)
-        info_text = f"📦 Поставщик: {supplier}\n🏭 Склад: {warehouse} → ПВ: {pv_label}"
-        info_text_widget = create_copyable_text(info_detail, info_text,
-                                               font=("Segoe UI", 10), bg='#e8f5e9', fg=COLORS['text'],
-                                               width=60, height=2, wrap='word')
-        info_text_widget.pack(pady=5, padx=10, anchor='w', fill='x')
-        
-        # Статистика отклонений
-        stats_frame_detail = tk.LabelFrame(detail_win, text="📈 Статистика отклонений", 
-                                          font=("Segoe UI", 11, "bold"), bg=COLORS['bg'], fg=COLORS['primary'])
-        stats_frame_detail.pack(fill='x', padx=10, pady=10)
-        
-        orders_count = len(window_data)
-        
-        if orders_count > 0:
-            deviations = window_data['Разница во времени привоза (мин.)'].dropna()
-            
-            stats_text = f"""📊 Всего заказов: {orders_count}
-📉 Медиана отклонения: {median_dev:+.0f} мин
-✅ Вовремя (±30 мин): {on_time_pct:.0f}%
-📋 Текущая длительность: {delivery_duration} мин
-🔧 Рекомендуемая корректировка: {duration_diff:+d} мин
-
-📊 Распределение отклонений:
-• Раньше (< -30 мин): {(deviations < -30).sum()} заказов ({(deviations < -30).sum() / len(deviations) * 100:.0f}%)
-• Вовремя (±30 мин): {deviations.between(-30, 30).sum()} заказов ({deviations.between(-30, 30).sum() / len(deviations) * 100:.0f}%)
-• Опоздание (30-60 мин): {deviations.between(30, 60, inclusive='right').sum()} заказов ({deviations.between(30, 60, inclusive='right').sum() / len(deviations) * 100:.0f}%)
-• Сильное опоздание (> 60 мин): {(deviations > 60).sum()} заказов ({(deviations > 60).sum() / len(deviations) * 100:.0f}%)"""
-            stats_text_widget = create_copyable_text(stats_frame_detail, stats_text, 
-                                                    font=("Segoe UI", 10), bg=COLORS['bg'],
-                                                    width=70, height=10, wrap='word')
-            stats_text_widget.pack(anchor='w', padx=10, pady=5, fill='x')
-            
-            # Причина подсветки
-            reason_frame = tk.LabelFrame(detail_win, text="❓ Почему подсвечено", 
-                                        font=("Segoe UI", 11, "bold"), bg=COLORS['bg'], fg=COLORS['primary'])
-            reason_frame.pack(fill='x', padx=10, pady=5)
+    def build_charts_tab():
+        """Содержимое вкладки графиков"""
+        # Кнопка помощи
+        help_frame = tk.Frame(frame_charts, bg=COLORS['bg'])
+        help_frame.pack(fill='x', padx=10, pady=5)
+        
+        tk.Button(
+            help_frame,
+            text="❓ Как читать графики?",
+            command=lambda: show_charts_guide(),
+            font="SegoeUI10",
+            bg=COLORS['info'],
+            fg='white',
+            cursor='hand2'
+        ).pack(side='right', padx=5)
+        
+        def open_zoom():
+            """Интерактивные графики с масштабированием в отдельном окне"""
+            zoom_win = tk.Toplevel(win)
+            zoom_win.title(f"🔍 Графики: {supplier} — {warehouse} | {pv_label}")
+            zoom_win.geometry("1400x900")
+            create_supplier_charts(zoom_win, subset, supplier, pv_label)
+        
+        tk.Button(
+            help_frame,
+            text="🔍 Зум",
+            command=open_zoom,
+            font="SegoeUI10",
+            bg=COLORS['primary'],
+            fg='white',
+            cursor='hand2'
+        ).pack(side='right', padx=5)
+        
+        # Графики рисуются в фоновом потоке в PNG, окно остаётся отзывчивым
+        chart_label = tk.Label(frame_charts, text="⏳ Построение графиков...",
+                               font="SegoeUI11", fg=COLORS['text_light'])
+        chart_label.pack(fill='both', expand=True)
+        
+        win.update_idletasks()
+        chart_width = frame_charts.winfo_width()
+        chart_height = frame_charts.winfo_height() - help_frame.winfo_reqheight()
+        if chart_width < 400 or chart_height < 300:
+            chart_width, chart_height = 1160, 620
+        
+        def show_chart_png(png):
+            if not chart_label.winfo_exists():
+                return
+            image = tk.PhotoImage(master=chart_label, data=base64.b64encode(png).decode('ascii'))
+            chart_label.configure(image=image, text='')
+            chart_label.image = image  # Держим ссылку, иначе картинку удалит сборщик мусора
+        
+        chart_key = (supplier, warehouse, pv_label, chart_width, chart_height)
+        cached_png = get_cached_chart_png(chart_key)
+        if cached_png is not None:
+            show_chart_png(cached_png)
+        else:
+            df_source = df_current
             
-            reasons = []
-            if abs(duration_diff) > 30:
-                reasons.append(f"❌ Большое отклонение: {duration_diff:+d} мин от графика")
-            elif abs(duration_diff) > 15:
-                reasons.append(f"⚠️ Умеренное отклонение: {duration_diff:+d} мин от графика")
+            def render_charts():
+                try:
+                    png = render_supplier_charts_png(subset, chart_width, chart_height)
+                except Exception as e:
+                    print(f"Ошибка построения графиков: {e}")
+                    return
+                store_chart_png(df_source, chart_key, png)
+                root.after(0, lambda: show_chart_png(png))
             
-            if on_time_pct < 60:
-                reasons.append(f"❌ Низкий % вовремя: {on_time_pct:.0f}% (норма ≥70%)")
-            elif on_time_pct < 70:
-                reasons.append(f"⚠️ Пограничный % вовремя: {on_time_pct:.0f}% (норма ≥70%)")
+            threading.Thread(target=render_charts, daemon=True).start()
+    
+    def build_schedule_tab():
+        """Содержимое вкладки расписания"""
+        # Информация
+        info_wd = tk.Frame(frame_weekday, bg='#e8f5e9')
+        info_wd.pack(fill='x', padx=10, pady=5)
+        tk.Label(info_wd, text=f"📅 Расписание для: {warehouse} → {pv_label}\n🔴 Красные окна — проблемы, 🟡 Жёлтые — предупреждения. Клик на ячейку — детали отклонений.",
+                font="SegoeUI9", bg='#e8f5e9', fg=COLORS['text'], justify='left').pack(pady=5, padx=10, anchor='w')
+        
+        # Получаем ID из данных для точного сопоставления с расписанием
+        warehouse_id = None
+        branch_id = None
+        if 'warehouseId' in subset.columns and subset['warehouseId'].notna().any():
+            warehouse_id = subset['warehouseId'].dropna().iloc[0] if len(subset['warehouseId'].dropna()) > 0 else None
+        if 'branchId' in subset.columns and subset['branchId'].notna().any():
+            branch_id = subset['branchId'].dropna().iloc[0] if len(subset['branchId'].dropna()) > 0 else None
+        
+        # Загружаем расписание для данного направления (склад + ПВ)
+        schedules_for_direction = get_schedules_for_warehouse_pv(warehouse, pv_label, warehouse_id, branch_id)
+        
+        # Подготовка данных с часами
+        subset_wd = subset.assign(Минута=derived.minute[rows])
+        
+        # Frame для сетки с прокруткой
+        grid_outer = tk.Frame(frame_weekday, bg=COLORS['bg'])
+        grid_outer.pack(fill='both', expand=True, padx=10, pady=5)
+        
+        # Canvas для прокрутки
+        grid_canvas = tk.Canvas(grid_outer, bg=COLORS['bg'], highlightthickness=0)
+        scrollbar_grid_v = ttk.Scrollbar(grid_outer, orient='vertical', command=grid_canvas.yview)
+        scrollbar_grid_h = ttk.Scrollbar(grid_outer, orient='horizontal', command=grid_canvas.xview)
+        
+        grid_frame = tk.Frame(grid_canvas, bg=COLORS['bg'])
+        grid_canvas.create_window((0, 0), window=grid_frame, anchor='nw')
+        grid_canvas.configure(yscrollcommand=scrollbar_grid_v.set, xscrollcommand=scrollbar_grid_h.set)
+        
+        def on_grid_configure(event):
+            grid_canvas.configure(scrollregion=grid_canvas.bbox('all'))
+        grid_frame.bind('<Configure>', on_grid_configure)
+        
+        # Прокрутка колесом мыши
+        def on_grid_mousewheel(event):
+            grid_canvas.yview_scroll(int(-1*(event.delta/120)), 'units')
+        def on_grid_mousewheel_linux(event):
+            if event.num == 4:
+                grid_canvas.yview_scroll(-1, 'units')
+            elif event.num == 5:
+                grid_canvas.yview_scroll(1, 'units')
+        
+        grid_canvas.bind('<MouseWheel>', on_grid_mousewheel)
+        grid_canvas.bind('<Button-4>', on_grid_mousewheel_linux)
+        grid_canvas.bind('<Button-5>', on_grid_mousewheel_linux)
+        
+        # Группируем расписание по дням недели
+        schedule_by_day = {i: [] for i in range(1, 8)}  # 1=Пн ... 7=Вс
+        
+        if schedules_for_direction:
+            for sched in schedules_for_direction:
+                weekday = sched.get('weekday', 1)
+                if 1 <= weekday <= 7:
+                    schedule_by_day[weekday].append(sched)
             
-            late_pct = (deviations > 30).sum() / len(deviations) * 100
-            if late_pct > 40:
-                reasons.append(f"❌ Много опозданий: {late_pct:.0f}% заказов с опозданием >30 мин")
-            elif late_pct > 25:
-                reasons.append(f"⚠️ Заметные опоздания: {late_pct:.0f}% заказов с опозданием >30 мин")
+            # Сортируем окна внутри каждого дня по времени
+            for day in schedule_by_day:
+                schedule_by_day[day].sort(key=lambda x: x.get('timeOrder', '00:00'))
+        
+        # Определяем максимальное количество окон в день для ширины колонок
+        max_windows = max(len(windows) for windows in schedule_by_day.values()) if schedules_for_direction else 1
+        max_windows = max(max_windows, 1)
+        
+        # Функция показа деталей окна
+        def show_window_details(sched, window_data, median_dev, on_time_pct, duration_diff):
+            """Показать детали отклонений для окна расписания"""
+            weekday_num = sched.get('weekday')
+            time_order = sched.get('timeOrder', '')
+            delivery_duration = sched.get('deliveryDuration', 0)
+            weekday_name = WEEKDAY_MAP.get(weekday_num, f"День {weekday_num}")
+            deliver_by = calculate_expected_delivery(time_order, delivery_duration)
             
-            if not reasons:
-                reasons.append("✅ Окно работает в пределах нормы")
+            detail_win = tk.Toplevel(win)
+            detail_win.title(f"📊 Детали: {weekday_name} {time_order}")
+            detail_win.geometry("800x600")
+            detail_win.configure(bg=COLORS['bg'])
             
-            reasons_text = "\n".join(reasons)
-            reason_color = COLORS['danger'] if '❌' in reasons_text else (COLORS['warning'] if '⚠️' in reasons_text else COLORS['success'])
-            reason_text_widget = create_copyable_text(reason_frame, reasons_text, 
-                                                     font=("Segoe UI", 10), bg=COLORS['bg'],
-                                                     fg=reason_color, width=70, height=len(reasons)+1, wrap='word')
-            reason_text_widget.pack(anchor='w', padx=10, pady=5, fill='x')
+            # Заголовок
+            header_detail = tk.Frame(detail_win, bg=COLORS['header'])
+            header_detail.pack(fill='x')
+            tk.Label(header_detail, text=f"📊 {weekday_name}: заказ до {time_order} → доставка к {deliver_by}",
+                    font="SegoeUI14B", bg=COLORS['header'], fg='white').pack(pady=10)
             
-            # Таблица заказов
-            orders_frame = tk.LabelFrame(detail_win, text="📋 Заказы в этом окне", 
-                                        font=("Segoe UI", 11, "bold"), bg=COLORS['bg'], fg=COLORS['primary'])
-            orders_frame.pack(fill='both', expand=True, padx=10, pady=10)
+            # Информация о направлении
+            info_detail = tk.Frame(detail_win, bg='#e8f5e9')
+            info_detail.pack(fill='x', padx=10, pady=5)
+            info_text = f"📦 Поставщик: {supplier}\n🏭 Склад: {warehouse} → ПВ: {pv_label}"
+            info_text_widget = create_copyable_text(info_detail, info_text,
+                                                   font="SegoeUI10", bg='#e8f5e9', fg=COLORS['text'],
+                                                   width=60, height=2, wrap='word')
+            info_text_widget.pack(pady=5, padx=10, anchor='w', fill='x')
             
-            cols_orders = ('№ заказа', 'Время заказа', 'План доставки', 'Факт доставки', 'Откл. (мин)', 'Статус')
-            tree_orders = ttk.Treeview(orders_frame, columns=cols_orders, show='headings', height=10)
-            for col in cols_orders:
-                tree_orders.heading(col, text=col)
-                tree_orders.column(col, width=120)
-            tree_orders.column('№ заказа', width=100)
-            tree_orders.column('Время заказа', width=180)
-            tree_orders.column('План доставки', width=180)
-            tree_orders.column('Факт доставки', width=180)
-            tree_orders.column('Откл. (мин)', width=100)
-            tree_orders.column('Статус', width=120)
+            # Статистика отклонений
+            stats_frame_detail = tk.LabelFrame(detail_win, text="📈 Статистика отклонений", 
+                                              font="SegoeUI11B", bg=COLORS['bg'], fg=COLORS['primary'])
+            stats_frame_detail.pack(fill='x', padx=10, pady=10)
             
-            tree_orders.tag_configure('good', foreground=COLORS['success'])
-            tree_orders.tag_configure('medium', foreground=COLORS['warning'])
-            tree_orders.tag_configure('bad', foreground=COLORS['danger'])
+            orders_count = len(window_data)
             
-            # Показываем заказы
-            for idx, order in window_data.head(50).iterrows():
-                # Получаем номер заказа
-                try:
-                    order_num = str(order['№ заказа']) if '№ заказа' in order.index and pd.notna(order['№ заказа']) else '—'
-                except:
-                    order_num = '—'
+            if orders_count > 0:
+                # Столбец отклонений извлекаем в numpy один раз для всех счётчиков
+                dev = window_data['Разница во времени привоза (мин.)'].to_numpy(dtype=float)
+                dev = dev[~np.isnan(dev)]
+                dev_total = max(dev.size, 1)
+                early_count = np.count_nonzero(dev < -30)
+                on_time_count = np.count_nonzero((dev >= -30) & (dev <= 30))
+                late_count = np.count_nonzero((dev > 30) & (dev <= 60))
+                very_late_count = np.count_nonzero(dev > 60)
                 
-                # Время заказа (полная дата и время)
-                try:
-                    if 'Время заказа позиции' in order.index:
-                        order_time_val = order['Время заказа позиции']
-                        if pd.notna(order_time_val):
-                            if isinstance(order_time_val, pd.Timestamp) or hasattr(order_time_val, 'strftime'):
-                                order_time = order_time_val.strftime('%d.%m.%Y %H:%M')
-                            else:
-                                order_time = str(order_time_val)
-                        else:
-                            order_time = "—"
-                    else:
-                        order_time = "—"
-                except Exception as e:
-                    order_time = "—"
+                stats_text = f"""📊 Всего заказов: {orders_count}
+📉 Медиана отклонения: {median_dev:+.0f} мин
+✅ Вовремя (±30 мин): {on_time_pct:.0f}%
+📋 Текущая длительность: {delivery_duration} мин
+🔧 Рекомендуемая корректировка: {duration_diff:+d} мин
+
+📊 Распределение отклонений:
+• Раньше (< -30 мин): {early_count} заказов ({early_count / dev_total * 100:.0f}%)
+• Вовремя (±30 мин): {on_time_count} заказов ({on_time_count / dev_total * 100:.0f}%)
+• Опоздание (30-60 мин): {late_count} заказов ({late_count / dev_total * 100:.0f}%)
+• Сильное опоздание (> 60 мин): {very_late_count} заказов ({very_late_count / dev_total * 100:.0f}%)"""
+                stats_text_widget = create_copyable_text(stats_frame_detail, stats_text, 
+                                                        font="SegoeUI10", bg=COLORS['bg'],
+                                                        width=70, height=10, wrap='word')
+                stats_text_widget.pack(anchor='w', padx=10, pady=5, fill='x')
                 
-                # Время плановой доставки
-                try:
-                    if 'Рассчетное время привоза' in order.index:
-                        planned_time_val = order['Рассчетное время привоза']
-                        if pd.notna(planned_time_val):
-                            if isinstance(planned_time_val, pd.Timestamp) or hasattr(planned_time_val, 'strftime'):
-                                planned_time = planned_time_val.strftime('%d.%m.%Y %H:%M')
-                            else:
-                                planned_time = str(planned_time_val)
-                        else:
-                            planned_time = "—"
-                    else:
-                        planned_time = "—"
-                except Exception as e:
-                    planned_time = "—"
+                # Причина подсветки
+                reason_frame = tk.LabelFrame(detail_win, text="❓ Почему подсвечено", 
+                                            font="SegoeUI11B", bg=COLORS['bg'], fg=COLORS['primary'])
+                reason_frame.pack(fill='x', padx=10, pady=5)
                 
-                # Время фактической доставки
-                try:
-                    if 'Время поступления на склад' in order.index:
-                        actual_time_val = order['Время поступления на склад']
-                        if pd.notna(actual_time_val):
-                            if isinstance(actual_time_val, pd.Timestamp) or hasattr(actual_time_val, 'strftime'):
-                                actual_time = actual_time_val.strftime('%d.%m.%Y %H:%M')
-                            else:
-                                actual_time = str(actual_time_val)
-                        else:
-                            actual_time = "—"
-                    else:
-                        actual_time = "—"
-                except Exception as e:
-                    actual_time = "—"
+                reasons = []
+                if abs(duration_diff) > 30:
+                    reasons.append(f"❌ Большое отклонение: {duration_diff:+d} мин от графика")
+                elif abs(duration_diff) > 15:
+                    reasons.append(f"⚠️ Умеренное отклонение: {duration_diff:+d} мин от графика")
                 
-                # Отклонение
-                try:
-                    if 'Разница во времени привоза (мин.)' in order.index:
-                        deviation = order['Разница во времени привоза (мин.)']
-                        if pd.isna(deviation):
-                            deviation = 0
-                    else:
-                        deviation = 0
-                except:
-                    deviation = 0
+                if on_time_pct < 60:
+                    reasons.append(f"❌ Низкий % вовремя: {on_time_pct:.0f}% (норма ≥70%)")
+                elif on_time_pct < 70:
+                    reasons.append(f"⚠️ Пограничный % вовремя: {on_time_pct:.0f}% (норма ≥70%)")
                 
-                if pd.isna(deviation):
-                    status = "❓ Нет данных"
-                    tags = ()
-                elif -30 <= deviation <= 30:
-                    status = "✅ Вовремя"
-                    tags = ('good',)
-                elif 30 < deviation <= 60:
-                    status = "⚠️ Опоздание"
-                    tags = ('medium',)
-                else:
-                    status = "❌ Сильное откл."
-                    tags = ('bad',)
+                late_pct = (late_count + very_late_count) / dev_total * 100
+                if late_pct > 40:
+                    reasons.append(f"❌ Много опозданий: {late_pct:.0f}% заказов с опозданием >30 мин")
+                elif late_pct > 25:
+                    reasons.append(f"⚠️ Заметные опоздания: {late_pct:.0f}% заказов с опозданием >30 мин")
                 
-                tree_orders.insert('', 'end', values=(
-                    order_num,
-                    order_time,
-                    planned_time,
-                    actual_time,
-                    f"{deviation:+.0f}" if not pd.isna(deviation) else "—",
-                    status
-                ), tags=tags)
-            
-            scrollbar_orders = ttk.Scrollbar(orders_frame, orient='vertical', command=tree_orders.yview)
-            tree_orders.configure(yscrollcommand=scrollbar_orders.set)
-            enable_treeview_copy(tree_orders)  # Включаем копирование
-            tree_orders.pack(side='left', fill='both', expand=True)
-            scrollbar_orders.pack(side='right', fill='y')
-            
-            if len(window_data) > 50:
-                tk.Label(orders_frame, text=f"Показано 50 из {len(window_data)} заказов",
-                        font=("Segoe UI", 9), fg=COLORS['text_light']).pack()
-        else:
-            tk.Label(stats_frame_detail, text="📭 Нет заказов для анализа в этом окне",
-                    font=("Segoe UI", 11), bg=COLORS['bg'], fg=COLORS['text_light']).pack(pady=20)
-    
-    # Собираем уникальные временные слоты из всех дней
-    all_time_slots = set()
-    for day_num in range(1, 8):
-        for sched in schedule_by_day.get(day_num, []):
-            time_order = sched.get('timeOrder', '')
-            if time_order:
-                all_time_slots.add(time_order)
-    
-    # Сортируем временные слоты
-    sorted_time_slots = sorted(all_time_slots)
-    
-    # Создаём индекс расписания: (день, время) -> schedule
-    schedule_index = {}
-    for day_num in range(1, 8):
-        for sched in schedule_by_day.get(day_num, []):
-            time_order = sched.get('timeOrder', '')
-            if time_order:
-                schedule_index[(day_num, time_order)] = sched
-    
-    # Функция для определения окна для заказа
-    def get_window_for_order(order_row):
-        """
-        Определить окно расписания для заказа.
-        
-        Логика:
-        - Заказ попадает в окно, если время заказа <= время "Заказ до" этого окна
-          и > времени "Заказ до" предыдущего окна
-        - Если заказ сделан ПОСЛЕ последнего окна дня - он попадает в ПЕРВОЕ окно
-          следующего дня (т.к. доставка будет на следующий день)
-        """
-        order_day_name = order_row.get('День_недели', '')
-        order_time = order_row.get('Время заказа позиции')
+                if not reasons:
+                    reasons.append("✅ Окно работает в пределах нормы")
+                
+                reasons_text = "\n".join(reasons)
+                reason_color = COLORS['danger'] if '❌' in reasons_text else (COLORS['warning'] if '⚠️' in reasons_text else COLORS['success'])
+                reason_text_widget = create_copyable_text(reason_frame, reasons_text, 
+                                                         font="SegoeUI10", bg=COLORS['bg'],
+                                                         fg=reason_color, width=70, height=len(reasons)+1, wrap='word')
+                reason_text_widget.pack(anchor='w', padx=10, pady=5, fill='x')
+                
+                # Таблица заказов
+                orders_frame = tk.LabelFrame(detail_win, text="📋 Заказы в этом окне", 
+                                            font="SegoeUI11B", bg=COLORS['bg'], fg=COLORS['primary'])
+                orders_frame.pack(fill='both', expand=True, padx=10, pady=10)
+                
+                cols_orders = ('№ заказа', 'Время заказа', 'План доставки', 'Факт доставки', 'Откл. (мин)', 'Статус')
+                tree_orders = ttk.Treeview(orders_frame, columns=cols_orders, show='headings', height=10)
+                for col in cols_orders:
+                    tree_orders.heading(col, text=col)
+                    tree_orders.column(col, width=120)
+                tree_orders.column('№ заказа', width=100)
+                tree_orders.column('Время заказа', width=180)
+                tree_orders.column('План доставки', width=180)
+                tree_orders.column('Факт доставки', width=180)
+                tree_orders.column('Откл. (мин)', width=100)
+                tree_orders.column('Статус', width=120)
+                
+                tree_orders.tag_configure('good', foreground=COLORS['success'])
+                tree_orders.tag_configure('medium', foreground=COLORS['warning'])
+                tree_orders.tag_configure('bad', foreground=COLORS['danger'])
+                
+                # Показываем заказы (строки готовим векторно, по одному strftime на столбец)
+                shown = window_data.head(50)
+                order_nums = shown['№ заказа']
+                dev = pd.to_numeric(shown['Разница во времени привоза (мин.)'], errors='coerce').fillna(0).to_numpy()
+                status_codes = np.select([np.abs(dev) <= 30, (dev > 30) & (dev <= 60)], [1, 2], default=3)
+                columns = (
+                    np.where(order_nums.isna(), '—', order_nums.astype(str)),
+                    format_datetime_column(pd.to_datetime(shown['Время заказа позиции'], errors='coerce'), empty='—'),
+                    format_datetime_column(pd.to_datetime(shown['Рассчетное время привоза'], errors='coerce'), empty='—'),
+                    format_datetime_column(pd.to_datetime(shown['Время поступления на склад'], errors='coerce'), empty='—'),
+                    format_deviation_column(dev),
+                    [WINDOW_ORDER_STATUSES[code] for code in status_codes]
+                )
+                
+                insert_treeview_rows(tree_orders, [
+                    (values, DEVIATION_TAGS[code]) for values, code in zip(zip(*columns), status_codes.tolist())
+                ])
+                
+                scrollbar_orders = ttk.Scrollbar(orders_frame, orient='vertical', command=tree_orders.yview)
+                tree_orders.configure(yscrollcommand=scrollbar_orders.set)
+                enable_treeview_copy(tree_orders)  # Включаем копирование
+                tree_orders.pack(side='left', fill='both', expand=True)
+                scrollbar_orders.pack(side='right', fill='y')
+                
+                if len(window_data) > 50:
+                    tk.Label(orders_frame, text=f"Показано 50 из {len(window_data)} заказов",
+                            font="SegoeUI9", fg=COLORS['text_light']).pack()
+            else:
+                tk.Label(stats_frame_detail, text="📭 Нет заказов для анализа в этом окне",
+                        font="SegoeUI11", bg=COLORS['bg'], fg=COLORS['text_light']).pack(pady=20)
         
-        if pd.isna(order_time):
-            return None
+        # Собираем уникальные временные слоты из всех дней
+        all_time_slots = set()
+        for day_num in range(1, 8):
+            for sched in schedule_by_day.get(day_num, []):
+                time_order = sched.get('timeOrder', '')
+                if time_order:
+                    all_time_slots.add(time_order)
         
-        weekday_num = WEEKDAY_TO_NUM.get(order_day_name, 0)
-        if weekday_num == 0:
-            return None
+        # Сортируем временные слоты
+        sorted_time_slots = sorted(all_time_slots)
         
-        # Вспомогательная функция для получения окон дня
-        def get_day_windows(day_num):
-            windows = []
-            for (day, time_slot), sched in schedule_index.items():
-                if day == day_num:
-                    try:
-                        h, m = map(int, time_slot.split(':'))
-                        minutes = h * 60 + m
-                        windows.append((minutes, sched, time_slot))
-                    except:
-                        pass
+        # Создаём индекс расписания: (день, время) -> schedule
+        schedule_index = {}
+        for day_num in range(1, 8):
+            for sched in schedule_by_day.get(day_num, []):
+                time_order = sched.get('timeOrder', '')
+                if time_order:
+                    schedule_index[(day_num, time_order)] = sched
+        
+        # Окна каждого дня, отсортированные по времени - строятся один раз, а не на каждый заказ
+        day_windows_by_num = {}
+        for (day, time_slot), sched in schedule_index.items():
+            minutes = parse_time_minutes(time_slot)
+            if minutes is None:
+                continue
+            day_windows_by_num.setdefault(day, []).append((minutes, sched, time_slot))
+        for windows in day_windows_by_num.values():
             windows.sort(key=lambda x: x[0])
-            return windows
         
-        day_windows = get_day_windows(weekday_num)
+        # Распределяем заказы по окнам (каждый заказ только в первое подходящее окно):
+        # для каждой строки запоминаем день и слот окна (0 - окно не найдено)
+        total_orders = len(subset_wd)
+        order_days = subset_wd['День_недели'].cat.codes.to_numpy(dtype=np.int64) + 1
+        order_minutes = subset_wd['Час'].to_numpy(dtype=float) * 60 + subset_wd['Минута'].to_numpy(dtype=float)
+        win_day, win_slot = match_orders_to_windows(order_days, order_minutes, day_windows_by_num)
+        
+        assigned_mask = win_day > 0
+        assigned_positions = np.flatnonzero(assigned_mask)
+        
+        # Статистика всех окон одной группировкой вместо подсчёта в каждой ячейке
+        dev_all = subset_wd['Разница во времени привоза (мин.)'].to_numpy(dtype=float)
+        window_frame = pd.DataFrame({
+            'day': win_day[assigned_mask],
+            'slot': win_slot[assigned_mask],
+            'dev': dev_all[assigned_mask],
+            'on_time': ((dev_all >= -30) & (dev_all <= 30))[assigned_mask],
+        })
+        window_groups = window_frame.groupby(['day', 'slot'], sort=False)
+        window_agg = window_groups.agg(
+            orders=('dev', 'size'),
+            valid=('dev', 'count'),
+            median=('dev', 'median'),
+            on_time=('on_time', 'sum')
+        )
+        window_stats = {
+            (int(day), slot): stats
+            for (day, slot), stats in zip(window_agg.index, window_agg.itertuples(index=False))
+        }
+        # Позиции строк subset_wd по окнам - выборка строится только при клике
+        window_rows = {
+            (int(day), slot): assigned_positions[idx]
+            for (day, slot), idx in window_groups.indices.items()
+        }
         
-        if not day_windows:
-            # Нет окон в этот день - проверяем следующий день
-            next_day_num = (weekday_num % 7) + 1
-            next_day_windows = get_day_windows(next_day_num)
-            if next_day_windows:
-                # Возвращаем первое окно следующего дня
-                return (next_day_windows[0][1], next_day_windows[0][2])
-            return None
+        # Подсчёт распределённых заказов
+        assigned_orders = int(assigned_positions.size)
+        unassigned_count = total_orders - assigned_orders
         
-        # Время заказа в минутах
-        order_minutes = order_time.hour * 60 + order_time.minute
+        # Создаём заголовок сетки - дни недели как столбцы
+        header_bg = '#1a237e'
+        header_fg = 'white'
         
-        # Ищем первое окно, в которое попадает заказ
-        prev_window_minutes = -1
-        for window_minutes, sched, time_slot in day_windows:
-            if prev_window_minutes < order_minutes <= window_minutes:
-                return (sched, time_slot)
-            prev_window_minutes = window_minutes
+        # Первая ячейка - "Окно"
+        tk.Label(grid_frame, text="Окно", font="SegoeUI10B", 
+                bg=header_bg, fg=header_fg, width=14, anchor='center', padx=10, pady=8,
+                relief='ridge').grid(row=0, column=0, sticky='nsew')
         
-        # Заказ ПОСЛЕ последнего окна дня - попадает в первое окно СЛЕДУЮЩЕГО дня
-        # (т.к. доставка будет уже на следующий день)
-        next_day_num = (weekday_num % 7) + 1
-        next_day_windows = get_day_windows(next_day_num)
-        if next_day_windows:
-            return (next_day_windows[0][1], next_day_windows[0][2])
+        # Заголовки дней недели
+        days_header = [('Пн', 1), ('Вт', 2), ('Ср', 3), ('Чт', 4), ('Пт', 5), ('Сб', 6), ('Вс', 7)]
+        for col, (day_short, day_num) in enumerate(days_header, 1):
+            tk.Label(grid_frame, text=day_short, font="SegoeUI10B", 
+                    bg=header_bg, fg=header_fg, width=18, padx=5, pady=8,
+                    relief='ridge').grid(row=0, column=col, sticky='nsew')
         
-        # Fallback: если нет окон на следующий день, возвращаем последнее окно текущего дня
-        # (чтобы заказ не потерялся)
-        if day_windows:
-            return (day_windows[-1][1], day_windows[-1][2])
+        schedule_count = 0
+        problems_count = 0
+        warnings_count = 0
         
-        return None
-    
-    # Распределяем заказы по окнам (каждый заказ только в первое подходящее окно)
-    orders_by_window = {}  # (day_num, time_slot) -> DataFrame
-    unassigned_orders = []  # Заказы без окна
-    
-    for _, order_row in subset_wd.iterrows():
-        window_info = get_window_for_order(order_row)
-        if window_info:
-            sched, time_slot = window_info
-            weekday_num = sched.get('weekday')
-            key = (weekday_num, time_slot)
-            if key not in orders_by_window:
-                orders_by_window[key] = []
-            orders_by_window[key].append(order_row)
-        else:
-            unassigned_orders.append(order_row)
-    
-    # Преобразуем списки в DataFrame
-    for key in orders_by_window:
-        orders_by_window[key] = pd.DataFrame(orders_by_window[key])
-    
-    # Подсчёт распределённых заказов
-    total_orders = len(subset_wd)
-    assigned_orders = sum(len(df) for df in orders_by_window.values())
-    unassigned_count = len(unassigned_orders)
-    
-    # Создаём заголовок сетки - дни недели как столбцы
-    header_bg = '#1a237e'
-    header_fg = 'white'
-    
-    # Первая ячейка - "Окно"
-    tk.Label(grid_frame, text="Окно", font=("Segoe UI", 10, "bold"), 
-            bg=header_bg, fg=header_fg, width=14, anchor='center', padx=10, pady=8,
-            relief='ridge').grid(row=0, column=0, sticky='nsew')
-    
-    # Заголовки дней недели
-    days_header = [('Пн', 1), ('Вт', 2), ('Ср', 3), ('Чт', 4), ('Пт', 5), ('Сб', 6), ('Вс', 7)]
-    for col, (day_short, day_num) in enumerate(days_header, 1):
-        tk.Label(grid_frame, text=day_short, font=("Segoe UI", 10, "bold"), 
-                bg=header_bg, fg=header_fg, width=18, padx=5, pady=8,
-                relief='ridge').grid(row=0, column=col, sticky='nsew')
-    
-    schedule_count = 0
-    problems_count = 0
-    warnings_count = 0
-    
-    # Заполняем сетку по временным слотам (строки) и дням (столбцы)
-    for row_num, time_slot in enumerate(sorted_time_slots, 1):
-        row_bg = '#ffffff' if row_num % 2 == 1 else '#f5f5f5'
-        
-        # Ячейка времени
-        tk.Label(grid_frame, text=f"⏰ {time_slot}", font=("Segoe UI", 10, "bold"), 
-                bg=row_bg, anchor='w', padx=10, pady=8,
-                relief='ridge').grid(row=row_num, column=0, sticky='nsew')
-        
-        # Ячейки для каждого дня недели
-        for col, (day_short, day_num) in enumerate(days_header, 1):
-            day_name = WEEKDAY_MAP.get(day_num, f"День {day_num}")
-            cell_frame = tk.Frame(grid_frame, bg=row_bg, relief='ridge', bd=1)
-            cell_frame.grid(row=row_num, column=col, sticky='nsew')
+        # Заполняем сетку по временным слотам (строки) и дням (столбцы)
+        for row_num, time_slot in enumerate(sorted_time_slots, 1):
+            row_bg = '#ffffff' if row_num % 2 == 1 else '#f5f5f5'
             
-            sched = schedule_index.get((day_num, time_slot))
+            # Ячейка времени
+            tk.Label(grid_frame, text=f"⏰ {time_slot}", font="SegoeUI10B", 
+                    bg=row_bg, anchor='w', padx=10, pady=8,
+                    relief='ridge').grid(row=row_num, column=0, sticky='nsew')
             
-            if sched:
-                time_order = sched.get('timeOrder', '')
-                delivery_duration = sched.get('deliveryDuration', 0)
-                delivery_type = sched.get('type', 'self')
-                deliver_by = calculate_expected_delivery(time_order, delivery_duration)
-                
-                # Получаем заказы для этого окна (уже распределённые)
-                window_key = (day_num, time_slot)
-                if window_key in orders_by_window:
-                    window_data = orders_by_window[window_key]
-                else:
-                    window_data = pd.DataFrame()
+            # Ячейки для каждого дня недели
+            for col, (day_short, day_num) in enumerate(days_header, 1):
+                day_name = WEEKDAY_MAP.get(day_num, f"День {day_num}")
+                cell_frame = tk.Frame(grid_frame, bg=row_bg, relief='ridge', bd=1)
+                cell_frame.grid(row=row_num, column=col, sticky='nsew')
                 
-                orders_count = len(window_data)
-                schedule_count += 1
+                sched = schedule_index.get((day_num, time_slot))
                 
-                if orders_count > 0:
-                    deviations = window_data['Разница во времени привоза (мин.)'].dropna()
-                    median_dev = deviations.median() if len(deviations) > 0 else 0
-                    on_time_pct = (deviations.between(-30, 30).sum() / len(deviations)) * 100 if len(deviations) > 0 else 0
+                if sched:
+                    time_order = sched.get('timeOrder', '')
+                    delivery_duration = sched.get('deliveryDuration', 0)
+                    delivery_type = sched.get('type', 'self')
+                    deliver_by = calculate_expected_delivery(time_order, delivery_duration)
                     
-                    recommended_duration = delivery_duration + int(round(median_dev))
-                    duration_diff = recommended_duration - delivery_duration
+                    # Готовая статистика окна (заказы уже распределены)
+                    window_key = (day_num, time_slot)
+                    stats = window_stats.get(window_key)
+                    orders_count = stats.orders if stats is not None else 0
+                    schedule_count += 1
                     
-                    # Определяем статус и цвет
-                    if abs(duration_diff) <= 15 and on_time_pct >= 70:
-                        cell_bg = '#c8e6c9'  # Зелёный
-                        status_icon = "✅"
-                        status_text = "OK"
-                    elif abs(duration_diff) <= 30:
-                        cell_bg = '#fff9c4'  # Жёлтый
-                        status_icon = "⚠️"
-                        status_text = f"{duration_diff:+d}"
-                        warnings_count += 1
+                    if orders_count > 0:
+                        if stats.valid > 0:
+                            median_dev = float(stats.median)
+                            on_time_pct = stats.on_time / stats.valid * 100
+                        else:
+                            median_dev = 0
+                            on_time_pct = 0
+                        
+                        recommended_duration = delivery_duration + int(round(median_dev))
+                        duration_diff = recommended_duration - delivery_duration
+                        
+                        # Определяем статус и цвет
+                        if abs(duration_diff) <= 15 and on_time_pct >= 70:
+                            cell_bg = '#c8e6c9'  # Зелёный
+                            status_icon = "✅"
+                            status_text = "OK"
+                        elif abs(duration_diff) <= 30:
+                            cell_bg = '#fff9c4'  # Жёлтый
+                            status_icon = "⚠️"
+                            status_text = f"{duration_diff:+d}"
+                            warnings_count += 1
+                        else:
+                            cell_bg = '#ffcdd2'  # Красный
+                            status_icon = "❌"
+                            status_text = f"{duration_diff:+d}"
+                            problems_count += 1
+                        
+                        # Иконка типа доставки
+                        type_icon = '🚗' if delivery_type == 'self' else '📦'
+                        
+                        # Создаём кликабельную ячейку
+                        inner_frame = tk.Frame(cell_frame, bg=cell_bg, cursor='hand2')
+                        inner_frame.pack(fill='both', expand=True, padx=2, pady=2)
+                        
+                        # Время доставки
+                        tk.Label(inner_frame, text=f"{type_icon} →{deliver_by}", 
+                                font="SegoeUI9B", bg=cell_bg, fg=COLORS['text']).pack(anchor='w', padx=5, pady=2)
+                        
+                        # Статистика
+                        stats_label = tk.Label(inner_frame, 
+                                              text=f"{status_icon} {status_text} | {orders_count} зак", 
+                                              font="SegoeUI8", bg=cell_bg, fg=COLORS['text'])
+                        stats_label.pack(anchor='w', padx=5, pady=1)
+                        
+                        # % вовремя и медиана
+                        tk.Label(inner_frame, text=f"{on_time_pct:.0f}% | {median_dev:+.0f}м", 
+                                font="SegoeUI8", bg=cell_bg, fg=COLORS['text_light']).pack(anchor='w', padx=5)
+                        
+                        # Привязка клика
+                        def make_click_handler(s, rows, md, otp, dd):
+                            return lambda e: show_window_details(s, subset_wd.take(rows), md, otp, dd)
+                        
+                        click_handler = make_click_handler(sched, window_rows[window_key], median_dev, on_time_pct, duration_diff)
+                        inner_frame.bind('<Button-1>', click_handler)
+                        for child in inner_frame.winfo_children():
+                            child.bind('<Button-1>', click_handler)
                     else:
-                        cell_bg = '#ffcdd2'  # Красный
-                        status_icon = "❌"
-                        status_text = f"{duration_diff:+d}"
-                        problems_count += 1
-                    
-                    # Иконка типа доставки
-                    type_icon = '🚗' if delivery_type == 'self' else '📦'
-                    
-                    # Создаём кликабельную ячейку
-                    inner_frame = tk.Frame(cell_frame, bg=cell_bg, cursor='hand2')
-                    inner_frame.pack(fill='both', expand=True, padx=2, pady=2)
-                    
-                    # Время доставки
-                    tk.Label(inner_frame, text=f"{type_icon} →{deliver_by}", 
-                            font=("Segoe UI", 9, "bold"), bg=cell_bg, fg=COLORS['text']).pack(anchor='w', padx=5, pady=2)
-                    
-                    # Статистика
-                    stats_label = tk.Label(inner_frame, 
-                                          text=f"{status_icon} {status_text} | {orders_count} зак", 
-                                          font=("Segoe UI", 8), bg=cell_bg, fg=COLORS['text'])
-                    stats_label.pack(anchor='w', padx=5, pady=1)
-                    
-                    # % вовремя и медиана
-                    tk.Label(inner_frame, text=f"{on_time_pct:.0f}% | {median_dev:+.0f}м", 
-                            font=("Segoe UI", 8), bg=cell_bg, fg=COLORS['text_light']).pack(anchor='w', padx=5)
-                    
-                    # Привязка клика
-                    def make_click_handler(s, wd, md, otp, dd):
-                        return lambda e: show_window_details(s, wd, md, otp, dd)
-                    
-                    click_handler = make_click_handler(sched, window_data, median_dev, on_time_pct, duration_diff)
-                    inner_frame.bind('<Button-1>', click_handler)
-                    for child in inner_frame.winfo_children():
-                        child.bind('<Button-1>', click_handler)
+                        # Нет заказов
+                        inner_frame = tk.Frame(cell_frame, bg='#e0e0e0')
+                        inner_frame.pack(fill='both', expand=True, padx=2, pady=2)
+                        
+                        type_icon = '🚗' if delivery_type == 'self' else '📦'
+                        tk.Label(inner_frame, text=f"{type_icon} →{deliver_by}", 
+                                font="SegoeUI9", bg='#e0e0e0', fg=COLORS['text_light']).pack(anchor='w', padx=5, pady=2)
+                        tk.Label(inner_frame, text="📭 Нет данных", 
+                                font="SegoeUI8", bg='#e0e0e0', fg=COLORS['text_light']).pack(anchor='w', padx=5)
                 else:
-                    # Нет заказов
-                    inner_frame = tk.Frame(cell_frame, bg='#e0e0e0')
-                    inner_frame.pack(fill='both', expand=True, padx=2, pady=2)
-                    
-                    type_icon = '🚗' if delivery_type == 'self' else '📦'
-                    tk.Label(inner_frame, text=f"{type_icon} →{deliver_by}", 
-                            font=("Segoe UI", 9), bg='#e0e0e0', fg=COLORS['text_light']).pack(anchor='w', padx=5, pady=2)
-                    tk.Label(inner_frame, text="📭 Нет данных", 
-                            font=("Segoe UI", 8), bg='#e0e0e0', fg=COLORS['text_light']).pack(anchor='w', padx=5)
-            else:
-                # Нет окна в этот день
-                tk.Label(cell_frame, text="—", font=("Segoe UI", 9), 
-                        bg=row_bg, fg=COLORS['text_light'], padx=10, pady=15).pack()
-    
-    # Размещение canvas и scrollbars
-    grid_canvas.pack(side='left', fill='both', expand=True)
-    scrollbar_grid_v.pack(side='right', fill='y')
-    scrollbar_grid_h.pack(side='bottom', fill='x')
-    
-    # Легенда
-    legend_frame = tk.Frame(frame_weekday, bg=COLORS['bg'])
-    legend_frame.pack(fill='x', padx=10, pady=5)
-    
-    tk.Label(legend_frame, text="Легенда:", font=("Segoe UI", 9, "bold"), bg=COLORS['bg']).pack(side='left', padx=5)
-    
-    legend_items = [
-        ('✅ OK', '#c8e6c9'),
-        ('⚠️ Предупреждение', '#fff9c4'),
-        ('❌ Проблема', '#ffcdd2'),
-        ('📭 Нет данных', '#e0e0e0')
-    ]
-    for text, color in legend_items:
-        frame_leg = tk.Frame(legend_frame, bg=color, padx=8, pady=2)
-        frame_leg.pack(side='left', padx=5)
-        tk.Label(frame_leg, text=text, font=("Segoe UI", 8), bg=color).pack()
-    
-    # Статистика внизу
-    summary_parts = [f"📋 Окон: {schedule_count}"]
-    summary_parts.append(f"📦 Заказов: {assigned_orders}/{total_orders}")
-    if unassigned_count > 0:
-        summary_parts.append(f"⚠️ Без окна: {unassigned_count}")
-    if problems_count > 0:
-        summary_parts.append(f"❌ Проблем: {problems_count}")
-    if warnings_count > 0:
-        summary_parts.append(f"⚠️ Предупреждений: {warnings_count}")
-
-    has_issues = problems_count > 0 or unassigned_count > 0
-    summary_color = COLORS['danger'] if has_issues else (COLORS['warning'] if warnings_count > 0 else COLORS['success'])
-    tk.Label(frame_weekday, text=" | ".join(summary_parts),
-            font=("Segoe UI", 9, "bold"), fg=summary_color).pack(pady=5)
-    
-    # Если есть нераспределённые заказы - выводим предупреждение
-    if unassigned_count > 0:
-        warn_frame = tk.Frame(frame_weekday, bg='#fff3e0')
-        warn_frame.pack(fill='x', padx=10, pady=2)
-        
-        # Анализируем причины
-        reasons = []
-        missing_weekday = sum(1 for o in unassigned_orders if not o.get('День_недели'))
-        missing_time = sum(1 for o in unassigned_orders if pd.isna(o.get('Время заказа позиции')))
-        no_schedule = unassigned_count - missing_weekday - missing_time
-        
-        if missing_time > 0:
-            reasons.append(f"нет времени заказа: {missing_time}")
-        if missing_weekday > 0:
-            reasons.append(f"нет дня недели: {missing_weekday}")
-        if no_schedule > 0:
-            reasons.append(f"нет подходящего окна: {no_schedule}")
-        
-        warn_text = f"⚠️ {unassigned_count} заказов не распределены по окнам"
-        if reasons:
-            warn_text += f" ({', '.join(reasons)})"
-        
-        tk.Label(warn_frame, text=warn_text,
-                font=("Segoe UI", 8), bg='#fff3e0', fg=COLORS['warning']).pack(pady=3)
+                    # Нет окна в этот день
+                    tk.Label(cell_frame, text="—", font="SegoeUI9", 
+                            bg=row_bg, fg=COLORS['text_light'], padx=10, pady=15).pack()
+        
+        # Размещение canvas и scrollbars
+        grid_canvas.pack(side='left', fill='both', expand=True)
+        scrollbar_grid_v.pack(side='right', fill='y')
+        scrollbar_grid_h.pack(side='bottom', fill='x')
+        
+        # Легенда
+        legend_frame = tk.Frame(frame_weekday, bg=COLORS['bg'])
+        legend_frame.pack(fill='x', padx=10, pady=5)
+        
+        tk.Label(legend_frame, text="Легенда:", font="SegoeUI9B", bg=COLORS['bg']).pack(side='left', padx=5)
+        
+        legend_items = [
+            ('✅ OK', '#c8e6c9'),
+            ('⚠️ Предупреждение', '#fff9c4'),
+            ('❌ Проблема', '#ffcdd2'),
+            ('📭 Нет данных', '#e0e0e0')
+        ]
+        for text, color in legend_items:
+            frame_leg = tk.Frame(legend_frame, bg=color, padx=8, pady=2)
+            frame_leg.pack(side='left', padx=5)
+            tk.Label(frame_leg, text=text, font="SegoeUI8", bg=color).pack()
+        
+        # Статистика внизу
+        summary_parts = [f"📋 Окон: {schedule_count}"]
+        summary_parts.append(f"📦 Заказов: {assigned_orders}/{total_orders}")
+        if unassigned_count > 0:
+            summary_parts.append(f"⚠️ Без окна: {unassigned_count}")
+        if problems_count > 0:
+            summary_parts.append(f"❌ Проблем: {problems_count}")
+        if warnings_count > 0:
+            summary_parts.append(f"⚠️ Предупреждений: {warnings_count}")
+
+        has_issues = problems_count > 0 or unassigned_count > 0
+        summary_color = COLORS['danger'] if has_issues else (COLORS['warning'] if warnings_count > 0 else COLORS['success'])
+        tk.Label(frame_weekday, text=" | ".join(summary_parts),
+                font="SegoeUI9B", fg=summary_color).pack(pady=5)
+        
+        # Если есть нераспределённые заказы - выводим предупреждение
+        if unassigned_count > 0:
+            warn_frame = tk.Frame(frame_weekday, bg='#fff3e0')
+            warn_frame.pack(fill='x', padx=10, pady=2)
+            
+            # Анализируем причины
+            reasons = []
+            unassigned = subset_wd[~assigned_mask]
+            missing_weekday = int(unassigned['День_недели'].isna().sum())
+            missing_time = int(unassigned['Время заказа позиции'].isna().sum())
+            no_schedule = unassigned_count - missing_weekday - missing_time
+            
+            if missing_time > 0:
+                reasons.append(f"нет времени заказа: {missing_time}")
+            if missing_weekday > 0:
+                reasons.append(f"нет дня недели: {missing_weekday}")
+            if no_schedule > 0:
+                reasons.append(f"нет подходящего окна: {no_schedule}")
+            
+            warn_text = f"⚠️ {unassigned_count} заказов не распределены по окнам"
+            if reasons:
+                warn_text += f" ({', '.join(reasons)})"
+            
+            tk.Label(warn_frame, text=warn_text,
+                    font="SegoeUI8", bg='#fff3e0', fg=COLORS['warning']).pack(pady=3)
     
-    # === Вкладка 3: По ПВ ===
-    frame_pv = ttk.Frame(notebook)
-    notebook.add(frame_pv, text="🏬 По ПВ")
+    def build_pv_tab():
+        """Содержимое вкладки по ПВ"""
+        # Frame для таблицы с прокруткой
+        table_frame_pv = tk.Frame(frame_pv, bg=COLORS['bg'])
+        table_frame_pv.pack(fill='both', expand=True, padx=10, pady=10)
+        
+        cols_pv = ('ПВ', 'Заказов', 'Среднее откл.', 'Медиана', 'Ст. откл.', '% вовремя')
+        tree_pv = SortableTreeview(table_frame_pv, columns=cols_pv, show='headings', height=12)
+        enable_treeview_copy(tree_pv)  # Включаем копирование
+        for col in cols_pv:
+            tree_pv.column(col, width=120 if col == 'ПВ' else 100)
+        tree_pv.column('ПВ', width=250)
+        add_tooltips_to_treeview(tree_pv, cols_pv)
+        
+        # Статистика по ПВ (доля вовремя считается в том же проходе groupby)
+        pv_stats = subset.assign(
+            _ontime=subset['_dev_cat'] == DEV_BAND_ON_TIME
+        ).groupby('ПВ', observed=True).agg(
+            Заказов=('_order_code', 'nunique'),
+            Среднее=('Разница во времени привоза (мин.)', 'mean'),
+            Медиана=('Разница во времени привоза (мин.)', 'median'),
+            СтдОткл=('Разница во времени привоза (мин.)', 'std'),
+            Вовремя=('_ontime', 'mean')
+        )
+        pv_stats['Вовремя'] *= 100
+        pv_stats = pv_stats.round(1).reset_index()
+        
+        # Текст ячеек и теги строк считаются по столбцам, в цикле только сборка кортежей
+        pv_columns = (
+            pv_stats['ПВ'].astype(object).map(normalize_pv_value),
+            pv_stats['Заказов'].tolist(),
+            format_number_column(pv_stats['Среднее'], '%+.1f'),
+            format_number_column(pv_stats['Медиана'], '%+.1f'),
+            format_number_column(pv_stats['СтдОткл'], '%.1f'),
+            format_number_column(pv_stats['Вовремя'], '%.1f%%'),
+        )
+        tag_codes = ontime_tag_codes(pv_stats['Вовремя']).tolist()
+        insert_treeview_rows(tree_pv, [
+            (values, ONTIME_TAGS[code]) for values, code in zip(zip(*pv_columns), tag_codes)
+        ])
+        
+        tree_pv.tag_configure('good', foreground=COLORS['success'])
+        tree_pv.tag_configure('medium', foreground=COLORS['warning'])
+        tree_pv.tag_configure('bad', foreground=COLORS['danger'])
+        
+        # Прокрутка для таблицы tree_pv
+        scrollbar_pv_v = ttk.Scrollbar(table_frame_pv, orient='vertical', command=tree_pv.yview)
+        scrollbar_pv_h = ttk.Scrollbar(table_frame_pv, orient='horizontal', command=tree_pv.xview)
+        tree_pv.configure(yscrollcommand=scrollbar_pv_v.set, xscrollcommand=scrollbar_pv_h.set)
+        
+        # Размещение через grid
+        tree_pv.grid(row=0, column=0, sticky='nsew')
+        scrollbar_pv_v.grid(row=0, column=1, sticky='ns')
+        scrollbar_pv_h.grid(row=1, column=0, sticky='ew')
+        table_frame_pv.grid_rowconfigure(0, weight=1)
+        table_frame_pv.grid_columnconfigure(0, weight=1)
+        
+        tk.Label(frame_pv, text="💡 Статистика по каждому пункту выдачи (ПВ)", 
+                font="SegoeUI9", fg=COLORS['text_light']).pack(pady=5)
     
-    # Frame для таблицы с прокруткой
-    table_frame_pv = tk.Frame(frame_pv, bg=COLORS['bg'])
-    table_frame_pv.pack(fill='both', expand=True, padx=10, pady=10)
-    
-    cols_pv = ('ПВ', 'Заказов', 'Среднее откл.', 'Медиана', 'Ст. откл.', '% вовремя')
-    tree_pv = SortableTreeview(table_frame_pv, columns=cols_pv, show='headings', height=12)
-    enable_treeview_copy(tree_pv)  # Включаем копирование
-    for col in cols_pv:
-        tree_pv.column(col, width=120 if col == 'ПВ' else 100)
-    tree_pv.column('ПВ', width=250)
-    add_tooltips_to_treeview(tree_pv, cols_pv)
-    
-    # Статистика по ПВ
-    pv_stats = subset.groupby('ПВ').agg(
-        Заказов=('№ заказа', 'nunique'),
-        Среднее=('Разница во времени привоза (мин.)', 'mean'),
-        Медиана=('Разница во времени привоза (мин.)', 'median'),
-        СтдОткл=('Разница во времени привоза (мин.)', 'std')
-    ).round(1).reset_index()
-    
-    for _, row in pv_stats.iterrows():
-        pv_data = subset[subset['ПВ'] == row['ПВ']]
-        on_time_pct = (pv_data['Разница во времени привоза (мин.)'].between(-30, 30).sum() / len(pv_data)) * 100
-        
-        tags = ()
-        if on_time_pct >= 80:
-            tags = ('good',)
-        elif on_time_pct >= 60:
-            tags = ('medium',)
-        else:
-            tags = ('bad',)
-        
-        tree_pv.insert('', 'end', values=(
-            normalize_pv_value(row['ПВ']),
-            row['Заказов'],
-            f"{row['Среднее']:+.1f}",
-            f"{row['Медиана']:+.1f}",
-            f"{row['СтдОткл']:.1f}",
-            f"{on_time_pct:.1f}%"
-        ), tags=tags)
-    
-    tree_pv.tag_configure('good', foreground=COLORS['success'])
-    tree_pv.tag_configure('medium', foreground=COLORS['warning'])
-    tree_pv.tag_configure('bad', foreground=COLORS['danger'])
-    
-    # Прокрутка для таблицы tree_pv
-    scrollbar_pv_v = ttk.Scrollbar(table_frame_pv, orient='vertical', command=tree_pv.yview)
-    scrollbar_pv_h = ttk.Scrollbar(table_frame_pv, orient='horizontal', command=tree_pv.xview)
-    tree_pv.configure(yscrollcommand=scrollbar_pv_v.set, xscrollcommand=scrollbar_pv_h.set)
+    # Вкладки заполняются при первом открытии, сразу строится только видимая
+    tab_builders = [build_charts_tab, build_schedule_tab, build_pv_tab]
+    built_tabs = set()
     
-    # Размещение через grid
-    tree_pv.grid(row=0, column=0, sticky='nsew')
-    scrollbar_pv_v.grid(row=0, column=1, sticky='ns')
-    scrollbar_pv_h.grid(row=1, column=0, sticky='ew')
-    table_frame_pv.grid_rowconfigure(0, weight=1)
-    table_frame_pv.grid_columnconfigure(0, weight=1)
+    def on_tab_changed(event=None):
+        index = notebook.index('current')
+        if index not in built_tabs:
+            built_tabs.add(index)
+            tab_builders[index]()
     
-    tk.Label(frame_pv, text="💡 Статистика по каждому пункту выдачи (ПВ)", 
-            font=("Segoe UI", 9), fg=COLORS['text_light']).pack(pady=5)
+    notebook.bind('<<NotebookTabChanged>>', on_tab_changed)
+    on_tab_changed()
 
 
 def show_charts_guide():
@@ -3075,7 +3743,7 @@ def show_charts_guide():
     header = tk.Frame(win, bg=COLORS['info'])
     header.pack(fill='x')
     tk.Label(header, text="❓ Гайд по чтению графиков", 
-            font=("Segoe UI", 16, "bold"), bg=COLORS['info'], fg='white').pack(pady=15)
+            font="SegoeUI16B", bg=COLORS['info'], fg='white').pack(pady=15)
     
     # Контент с прокруткой
     canvas = tk.Canvas(win, bg=COLORS['bg'])
@@ -3141,11 +3809,11 @@ def show_charts_guide():
     ]
     
     for i, (title, text) in enumerate(guides):
-        frame = tk.LabelFrame(content, text=title, font=("Segoe UI", 12, "bold"),
+        frame = tk.LabelFrame(content, text=title, font="SegoeUI12B",
                              bg=COLORS['bg'], fg=COLORS['primary'], padx=15, pady=10)
         frame.pack(fill='x', padx=20, pady=10)
         
-        tk.Label(frame, text=text, font=("Segoe UI", 10), bg=COLORS['bg'],
+        tk.Label(frame, text=text, font="SegoeUI10", bg=COLORS['bg'],
                 justify='left', wraplength=800).pack(anchor='w', padx=10, pady=5)
     
     canvas.pack(side="left", fill="both", expand=True)
@@ -3153,12 +3821,117 @@ def show_charts_guide():
     
     # Подсказка
     tk.Label(win, text="💡 Используйте колесо мыши для прокрутки", 
-            font=("Segoe UI", 9), fg=COLORS['text_light'], bg=COLORS['bg']).pack(pady=5)
+            font="SegoeUI9", fg=COLORS['text_light'], bg=COLORS['bg']).pack(pady=5)
+
+
+# Цвета по отклонению: <-60 ранние, -60..-30, -30..30 вовремя, 30..60, >=60 опоздания
+DEVIATION_THRESHOLDS = np.array([-60, -30, 30, 60])
+DEVIATION_PALETTE = np.array(['#4caf50', '#8bc34a', '#2196f3', '#ff9800', '#f44336'])
+
+# Цвета по проценту вовремя: <60 плохо, 60..80 норма, >=80 отлично
+ONTIME_THRESHOLDS = np.array([60, 80])
+ONTIME_PALETTE = np.array(['#f44336', '#ff9800', '#4caf50'])
+
+# Цвета дней недели: будни синие, выходные оранжевые
+WEEKDAY_COLORS = np.array(['#2196f3'] * 5 + ['#ff9800'] * 2)
+
+# Градиенты палитры Reds по числу столбцов (топ-N рисуется с одним и тем же N)
+_reds_gradient_cache = {}
+
+
+def reds_gradient(n):
+    """Цвета Reds от 0.4 до 0.8 для n столбцов (из кэша)"""
+    if n not in _reds_gradient_cache:
+        _reds_gradient_cache[n] = plt.cm.Reds(np.linspace(0.4, 0.8, n))
+    return _reds_gradient_cache[n]
+
+
+# Готовые PNG графиков поставщиков (сбрасываются при смене df_current)
+_chart_png_cache = {'df': None, 'images': {}}
+
+
+def get_cached_chart_png(key):
+    """PNG графиков из кэша для текущего df_current (или None)"""
+    if _chart_png_cache['df'] is not df_current:
+        return None
+    return _chart_png_cache['images'].get(key)
+
+
+def store_chart_png(df_source, key, png):
+    """Сохранение PNG графиков, построенных по df_source"""
+    if _chart_png_cache['df'] is not df_source:
+        _chart_png_cache['df'] = df_source
+        _chart_png_cache['images'] = {}
+    _chart_png_cache['images'][key] = png
+
+
+# Одна фигура для всех PNG-отрисовок: очистка дешевле создания фигуры заново.
+# Потоки отрисовки могут пересекаться, поэтому доступ к ней под блокировкой.
+_supplier_chart_fig = Figure(figsize=(14, 10), dpi=100, facecolor=COLORS['bg'])
+_supplier_chart_canvas = FigureCanvasAgg(_supplier_chart_fig)
+_supplier_chart_lock = threading.Lock()
+
+
+def render_supplier_charts_png(df, width, height):
+    """Отрисовка графиков поставщика в PNG без Tk (можно вызывать из потока)"""
+    with _supplier_chart_lock:
+        fig = _supplier_chart_fig
+        fig.clf()  # Вместе с осями удаляются и цветовые шкалы
+        fig.set_size_inches(width / 100, height / 100)
+        draw_supplier_charts(fig, df)
+        buf = BytesIO()
+        _supplier_chart_canvas.print_png(buf)
+    return buf.getvalue()
+
+
+# Свободные фигуры для повторного открытия окон графиков: ключ -> Figure
+_chart_fig_pool = {}
+
+
+def acquire_chart_figure(pool_key, figsize):
+    """Фигура из пула (очищенная) или новая; занятая фигура из пула изымается"""
+    fig = _chart_fig_pool.pop(pool_key, None)
+    if fig is None:
+        return Figure(figsize=figsize, dpi=100, facecolor=COLORS['bg'])
+    fig.clear()
+    fig.set_size_inches(figsize)
+    return fig
+
+
+def release_figure_on_close(win, fig, canvas, pool_key=None):
+    """При закрытии окна освобождаем виджет холста, а фигуру очищаем и возвращаем в пул"""
+    def on_close():
+        fig.clear()
+        canvas.get_tk_widget().destroy()
+        if pool_key is not None:
+            _chart_fig_pool[pool_key] = fig
+        else:
+            plt.close(fig)
+        win.destroy()
+    
+    win.protocol('WM_DELETE_WINDOW', on_close)
 
 
 def create_supplier_charts(parent, df, supplier, pv_label=None):
-    """Создание улучшенных графиков для поставщика с пояснениями"""
-    fig = Figure(figsize=(14, 10), dpi=100, facecolor=COLORS['bg'])
+    """Создание интерактивных графиков для поставщика (с панелью зума)"""
+    fig = acquire_chart_figure('supplier', (14, 10))
+    draw_supplier_charts(fig, df)
+    
+    canvas = FigureCanvasTkAgg(fig, parent)
+    canvas.draw()
+    canvas.get_tk_widget().pack(fill='both', expand=True)
+    
+    # Toolbar
+    toolbar = NavigationToolbar2Tk(canvas, parent)
+    toolbar.update()
+    
+    release_figure_on_close(parent.winfo_toplevel(), fig, canvas, pool_key='supplier')
+
+
+def draw_supplier_charts(fig, df):
+    """Построение графиков поставщика с пояснениями на переданной фигуре"""
+    # Производные признаки считаются лениво, в сам subset ничего не записывается
+    derived = DerivedFrame(df)
     
     # 2x3 сетка для 6 графиков
     ax1 = fig.add_subplot(231)
@@ -3168,43 +3941,39 @@ def create_supplier_charts(parent, df, supplier, pv_label=None):
     ax5 = fig.add_subplot(235)
     ax6 = fig.add_subplot(236)
     
+    # Отклонения и номер дня недели извлекаем один раз для всех графиков
+    dev = df['Разница во времени привоза (мин.)'].to_numpy(dtype=float)
+    dow = derived.weekday
+    valid = ~np.isnan(dev)
+    dev_v = dev[valid]
+    dow_v = dow[valid]
+    median_dev = float(np.median(dev_v)) if dev_v.size else float('nan')
+    
     # График 1: Распределение с градиентом
-    deviations = df['Разница во времени привоза (мин.)'].dropna()
-    counts, bins, patches = ax1.hist(deviations, bins=40, edgecolor='white', linewidth=0.5)
-    
-    # Градиентная заливка
-    for i, patch in enumerate(patches):
-        bin_center = (bins[i] + bins[i+1]) / 2
-        if bin_center < -60:
-            color = '#4caf50'  # Зелёный (ранние)
-        elif bin_center < -30:
-            color = '#8bc34a'
-        elif bin_center < 30:
-            color = '#2196f3'  # Синий (вовремя)
-        elif bin_center < 60:
-            color = '#ff9800'  # Оранжевый
-        else:
-            color = '#f44336'  # Красный (опоздания)
+    # Бины строятся только по видимому диапазону -500..500 минут
+    counts, bins, patches = ax1.hist(dev_v, bins=40, range=(-500, 500), edgecolor='white', linewidth=0.5)
+    
+    # Градиентная заливка: цвет бина по таблице порогов его центра
+    centers = (bins[:-1] + bins[1:]) / 2
+    bin_colors = DEVIATION_PALETTE[np.searchsorted(DEVIATION_THRESHOLDS, centers, side='right')]
+    for patch, color in zip(patches, bin_colors):
         patch.set_facecolor(color)
         patch.set_alpha(0.7)
     
     ax1.axvline(x=0, color='#1565c0', linestyle='--', linewidth=2.5, label='График (0 мин)')
-    ax1.axvline(x=deviations.median(), color='#d32f2f', linestyle='-', linewidth=2.5, 
-               label=f'Среднее: {deviations.median():.0f} мин')
+    ax1.axvline(x=median_dev, color='#d32f2f', linestyle='-', linewidth=2.5, 
+               label=f'Среднее: {median_dev:.0f} мин')
     ax1.set_title('📊 Распределение отклонений\n(🟢 раньше | 🔵 вовремя | 🔴 позже)', 
                  fontsize=11, fontweight='bold', pad=10)
     ax1.set_xlabel('Отклонение от графика (минуты)\nОтрицательные = раньше, Положительные = позже', 
                    fontsize=9)
     ax1.set_ylabel('Количество заказов', fontsize=10)
-    ax1.set_xlim(-500, 500)  # Ограничиваем ось X от -500 до 500 минут
     ax1.legend(fontsize=8, loc='upper right', framealpha=0.9)
     ax1.grid(True, alpha=0.2, linestyle='--')
     ax1.set_facecolor('#fafafa')
     
     # График 2: Box plot по дням недели
-    df['dow_num'] = df['День_недели'].map({day: i for i, day in enumerate(DAYS_RU)})
-    weekday_data = [df[df['dow_num'] == i]['Разница во времени привоза (мин.)'].dropna().values 
-                   for i in range(7)]
+    weekday_data = [dev_v[dow_v == i] for i in range(7)]
     
     bp = ax2.boxplot(weekday_data, labels=DAYS_SHORT, patch_artist=True,
                     boxprops=dict(facecolor='#64b5f6', alpha=0.7),
@@ -3221,15 +3990,21 @@ def create_supplier_charts(parent, df, supplier, pv_label=None):
     ax2.set_facecolor('#fafafa')
     
     # График 3: Тепловая карта день-час
-    df['hour'] = df['Время заказа позиции'].dt.hour
-    heatmap_data = df.groupby(['dow_num', 'hour'])['Разница во времени привоза (мин.)'].median().unstack(fill_value=0)
-    
-    if not heatmap_data.empty:
-        im = ax3.imshow(heatmap_data.values, cmap='RdYlGn_r', aspect='auto', vmin=-90, vmax=90)
+    # Медианы раскладываем в фиксированную сетку 7×24 (пустые ячейки - NaN)
+    heat_hour = derived.hour.astype(float)
+    heat_valid = valid & (dow >= 0) & ~np.isnan(heat_hour)
+    heat_median = pd.Series(dev[heat_valid]).groupby(
+        [dow[heat_valid].astype(int), heat_hour[heat_valid].astype(int)]
+    ).median()
+    heatmap_grid = np.full((7, 24), np.nan)
+    
+    if len(heat_median) > 0:
+        heatmap_grid[heat_median.index.get_level_values(0), heat_median.index.get_level_values(1)] = heat_median.to_numpy()
+        im = ax3.imshow(heatmap_grid, cmap='RdYlGn_r', aspect='auto', vmin=-90, vmax=90)
         ax3.set_yticks(range(len(DAYS_SHORT)))
         ax3.set_yticklabels(DAYS_SHORT)
-        ax3.set_xticks(range(len(heatmap_data.columns)))
-        ax3.set_xticklabels([f"{h:02d}" for h in heatmap_data.columns], fontsize=8)
+        ax3.set_xticks(range(24))
+        ax3.set_xticklabels([f"{h:02d}" for h in range(24)], fontsize=7)
         ax3.set_title('🔥 Тепловая карта: День × Час\n(🟢 вовремя | 🔴 опоздание)', 
                      fontsize=11, fontweight='bold', pad=10)
         ax3.set_xlabel('Час заказа', fontsize=10)
@@ -3238,7 +4013,7 @@ def create_supplier_charts(parent, df, supplier, pv_label=None):
         cbar.set_label('Отклонение (мин)\n<0 = раньше, >0 = позже', fontsize=8)
     
     # График 4: Медиана по часам с доверительным интервалом
-    hour_stats = df.groupby('hour')['Разница во времени привоза (мин.)'].agg(['median', 'std', 'count'])
+    hour_stats = pd.Series(dev).groupby(heat_hour).agg(['median', 'std', 'count'])
     hour_stats = hour_stats[hour_stats['count'] >= 3]
     
     if not hour_stats.empty:
@@ -3261,28 +4036,30 @@ def create_supplier_charts(parent, df, supplier, pv_label=None):
         ax4.set_xticks(range(6, 22, 2))
     
     # График 5: Динамика с трендом
-    df['Дата'] = df['Время заказа позиции'].dt.date
-    daily_stats = df.groupby('Дата')['Разница во времени привоза (мин.)'].agg(['median', 'count'])
+    daily_stats = pd.Series(dev).groupby(derived.day).agg(['median', 'count'])
     daily_stats = daily_stats[daily_stats['count'] >= 2]
     
     if len(daily_stats) > 0:
         dates = pd.to_datetime(daily_stats.index)
+        daily_median = daily_stats['median'].to_numpy(dtype=float)
+        daily_count = daily_stats['count'].to_numpy(dtype=float)
         
         # Точки с размером по количеству
-        sizes = (daily_stats['count'] / daily_stats['count'].max() * 100) + 20
-        scatter = ax5.scatter(dates, daily_stats['median'], s=sizes, alpha=0.4, 
-                            c=daily_stats['median'], cmap='RdYlGn_r', vmin=-60, vmax=60,
+        sizes = daily_count / daily_count.max() * 100 + 20
+        scatter = ax5.scatter(dates, daily_median, s=sizes, alpha=0.4, 
+                            c=daily_median, cmap='RdYlGn_r', vmin=-60, vmax=60,
                             edgecolors='#1976d2', linewidth=1)
         
-        # Скользящее среднее
+        # Скользящее среднее (центрированное окно 7 дней, края без значения)
         if len(daily_stats) > 7:
-            rolling = daily_stats['median'].rolling(window=7, center=True).mean()
-            ax5.plot(dates, rolling.values, color='#d32f2f', linewidth=3, 
+            rolling = np.full(len(daily_median), np.nan)
+            rolling[3:-3] = np.convolve(daily_median, np.ones(7) / 7, mode='valid')
+            ax5.plot(dates, rolling, color='#d32f2f', linewidth=3, 
                     label='7-дневное среднее', alpha=0.9)
         
         # Линия тренда
         if len(daily_stats) > 14:
-            z = np.polyfit(range(len(daily_stats)), daily_stats['median'].values, 1)
+            z = np.polyfit(range(len(daily_stats)), daily_median, 1)
             p = np.poly1d(z)
             ax5.plot(dates, p(range(len(daily_stats))), "--", color='#7b1fa2', 
                     linewidth=2, label=f'Тренд: {z[0]:.2f} мин/день', alpha=0.7)
@@ -3299,17 +4076,16 @@ def create_supplier_charts(parent, df, supplier, pv_label=None):
         cbar = fig.colorbar(scatter, ax=ax5, shrink=0.8)
         cbar.set_label('Отклонение (мин)', fontsize=8)
     
-    # График 6: Процент вовремя по дням
-    weekday_ontime = []
-    for day in DAYS_RU:
-        day_data = df[df['День_недели'] == day]
-        if len(day_data) > 0:
-            pct = (day_data['Разница во времени привоза (мин.)'].between(-30, 30).sum() / len(day_data)) * 100
-            weekday_ontime.append(pct)
-        else:
-            weekday_ontime.append(0)
+    # График 6: Процент вовремя по дням (подсчёт bincount по номеру дня)
+    # Знаменатель - все заказы дня, включая заказы без отклонения
+    day_known = dow >= 0
+    dow_int = dow[day_known].astype(int)
+    on_time = (dev >= -30) & (dev <= 30)
+    day_totals = np.bincount(dow_int, minlength=7)
+    day_on_time = np.bincount(dow_int, weights=on_time[day_known], minlength=7)
+    weekday_ontime = np.divide(day_on_time * 100, day_totals, out=np.zeros(7), where=day_totals > 0)
     
-    colors_bars = ['#4caf50' if p >= 80 else '#ff9800' if p >= 60 else '#f44336' for p in weekday_ontime]
+    colors_bars = ONTIME_PALETTE[np.searchsorted(ONTIME_THRESHOLDS, weekday_ontime, side='right')].tolist()
     bars = ax6.bar(range(7), weekday_ontime, color=colors_bars, alpha=0.8, edgecolor='white', linewidth=1.5)
     
     # Добавляем значения на столбцы
@@ -3331,14 +4107,6 @@ def create_supplier_charts(parent, df, supplier, pv_label=None):
     ax6.set_facecolor('#fafafa')
     
     fig.tight_layout(pad=1.5)
-    
-    canvas = FigureCanvasTkAgg(fig, parent)
-    canvas.draw()
-    canvas.get_tk_widget().pack(fill='both', expand=True)
-    
-    # Toolbar
-    toolbar = NavigationToolbar2Tk(canvas, parent)
-    toolbar.update()
 
 
 def show_recommendation_details(rec):
@@ -3356,13 +4124,13 @@ def show_recommendation_details(rec):
     tk.Label(
         header,
         text=f"💡 Рекомендация по корректировке",
-        font=("Segoe UI", 14, "bold"),
+        font="SegoeUI14B",
         bg=COLORS['primary'],
         fg='white'
     ).pack(pady=15)
     
     # Основная информация
-    info_frame = tk.LabelFrame(win, text="📋 Параметры", font=("Segoe UI", 10, "bold"), bg=COLORS['bg'])
+    info_frame = tk.LabelFrame(win, text="📋 Параметры", font="SegoeUI10B", bg=COLORS['bg'])
     info_frame.pack(fill='x', padx=20, pady=15)
     
     params = [
@@ -3381,23 +4149,36 @@ def show_recommendation_details(rec):
         ("📆 Применить с:", rec.effective_from),
     ]
     
+    # Один Text с тегами вместо пары Label на каждый параметр:
+    # подпись прижата к правой табуляции, значение - после неё
+    txt_params = tk.Text(info_frame, height=len(params), wrap='none', bd=0, highlightthickness=0,
+                         bg=COLORS['bg'], font="SegoeUI10", cursor='arrow',
+                         tabs=(200, 'right', 215, 'left'), spacing1=3, spacing3=3)
+    txt_params.tag_configure('value', font="SegoeUI10B")
+    txt_params.tag_configure('sep', foreground=COLORS['text_light'])
+    
+    # Пары (текст, теги) вставляем одним вызовом - без расчёта позиций
+    # (эмодзи в подписях сбивают символьные смещения в Tk)
+    chunks = []
     for i, (label, value) in enumerate(params):
+        newline = "\n" if i < len(params) - 1 else ""
         if label == "":
-            ttk.Separator(info_frame, orient='horizontal').grid(row=i, column=0, columnspan=2, sticky='ew', pady=5)
+            chunks.extend(("─" * 60 + newline, ('sep',)))
         else:
-            tk.Label(info_frame, text=label, font=("Segoe UI", 10), bg=COLORS['bg'], anchor='e').grid(
-                row=i, column=0, sticky='e', padx=(10, 5), pady=3)
-            tk.Label(info_frame, text=value, font=("Segoe UI", 10, "bold"), bg=COLORS['bg'], anchor='w').grid(
-                row=i, column=1, sticky='w', padx=(5, 10), pady=3)
+            chunks.extend((f"\t{label}\t", (), f"{value}{newline}", ('value',)))
+    txt_params.insert('1.0', *chunks)
+    
+    txt_params.configure(state='disabled')
+    txt_params.pack(fill='x', padx=10, pady=5)
     
     # Причина
-    reason_frame = tk.LabelFrame(win, text="💬 Причина рекомендации", font=("Segoe UI", 10, "bold"), bg=COLORS['bg'])
+    reason_frame = tk.LabelFrame(win, text="💬 Причина рекомендации", font="SegoeUI10B", bg=COLORS['bg'])
     reason_frame.pack(fill='x', padx=20, pady=10)
     
     tk.Label(
         reason_frame,
         text=rec.reason,
-        font=("Segoe UI", 10),
+        font="SegoeUI10",
         bg=COLORS['bg'],
         wraplength=720,
         justify='left'
@@ -3405,7 +4186,7 @@ def show_recommendation_details(rec):
     
     # Примеры заказов
     if hasattr(rec, 'example_orders') and rec.example_orders:
-        examples_frame = tk.LabelFrame(win, text="📦 Примеры заказов (последние)", font=("Segoe UI", 10, "bold"), bg=COLORS['bg'])
+        examples_frame = tk.LabelFrame(win, text="📦 Примеры заказов (последние)", font="SegoeUI10B", bg=COLORS['bg'])
         examples_frame.pack(fill='both', expand=True, padx=20, pady=10)
         
         # Frame для таблицы с прокруткой
@@ -3414,7 +4195,7 @@ def show_recommendation_details(rec):
         
         # Таблица примеров
         cols = ('№ заказа', 'ПВ', 'Дата', 'Время заказа', 'План', 'Факт', 'Откл.')
-        tree_examples = ttk.Treeview(table_frame_examples, columns=cols, show='headings', height=5)
+        tree_examples = VirtualTreeview(table_frame_examples, columns=cols, show='headings', height=5)
         
         tree_examples.column('№ заказа', width=100)
         tree_examples.column('ПВ', width=160)
@@ -3429,25 +4210,26 @@ def show_recommendation_details(rec):
         
         add_tooltips_to_treeview(tree_examples, cols)
         
-        for ex in rec.example_orders:
-            dev = ex.get('deviation', 0)
-            tags = ()
-            if abs(dev) <= 30:
-                tags = ('good',)
-            elif abs(dev) <= 60:
-                tags = ('medium',)
-            else:
-                tags = ('bad',)
-            
-            tree_examples.insert('', 'end', values=(
+        # Значения и теги считаем один раз, в виджет попадают только видимые строки
+        examples = rec.example_orders
+        devs = np.fromiter((ex.get('deviation', 0) or 0 for ex in examples), dtype=np.int64, count=len(examples))
+        abs_devs = np.abs(devs)
+        # Индекс в DEVIATION_TAGS: 1 - good, 2 - medium, 3 - bad
+        tag_codes = 3 - (abs_devs <= 30).astype(np.int8) - (abs_devs <= 60).astype(np.int8)
+        dev_labels = [f"{d:+d} мин" if d else '' for d in devs.tolist()]
+        pv_map = {pv: normalize_pv_value(pv) for pv in {ex.get('pv') for ex in examples}}
+        tree_examples.set_rows([
+            ((
                 ex.get('order_id', ''),
-                normalize_pv_value(ex.get('pv')),
+                pv_map[ex.get('pv')],
                 ex.get('order_date', ''),
                 ex.get('order_time', ''),
                 ex.get('plan_time', ''),
                 ex.get('fact_time', ''),
-                f"{dev:+d} мин" if dev else ''
-            ), tags=tags)
+                dev_label
+            ), DEVIATION_TAGS[code])
+            for ex, code, dev_label in zip(examples, tag_codes.tolist(), dev_labels)
+        ])
         
         tree_examples.tag_configure('good', foreground=COLORS['success'])
         tree_examples.tag_configure('medium', foreground=COLORS['warning'])
@@ -3469,7 +4251,7 @@ def show_recommendation_details(rec):
         tk.Label(
             examples_frame,
             text="💡 Двойной клик на заказ — открыть в CRM",
-            font=("Segoe UI", 9),
+            font="SegoeUI9",
             fg=COLORS['text_light'],
             bg=COLORS['bg']
         ).pack(pady=5)
@@ -3491,7 +4273,7 @@ def show_recommendation_details(rec):
         btn_frame,
         text="📊 Анализ поставщика",
         command=lambda: show_supplier_details(rec.supplier, rec.warehouse, rec.pv),
-        font=("Segoe UI", 10),
+        font="SegoeUI10",
         bg=COLORS['info'],
         fg='white',
         width=18
@@ -3501,13 +4283,50 @@ def show_recommendation_details(rec):
         btn_frame,
         text="📥 Экспорт в Excel",
         command=lambda: export_single_rec(rec),
-        font=("Segoe UI", 10),
+        font="SegoeUI10",
         bg=COLORS['success'],
         fg='white',
         width=18
     ).pack(side='left', padx=5)
 
 
+# Запись файлов выполняется в фоне, чтобы не блокировать mainloop
+_io_pool = ThreadPoolExecutor(max_workers=2)
+
+
+def run_export_async(job, args, on_done):
+    """Запуск job(*args) в пуле ввода-вывода; on_done(результат) вызывается в потоке Tk"""
+    future = _io_pool.submit(job, *args)
+    progress_bar.start()
+    update_status("⏳ Сохранение файла...", "info")
+    
+    def check_done():
+        if not future.done():
+            root.after(100, check_done)
+            return
+        progress_bar.stop()
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Ошибка экспорта: {e}")
+            messagebox.showerror("Ошибка", f"Ошибка экспорта: {e}")
+            update_status("❌ Ошибка экспорта", "error")
+            return
+        on_done(result)
+    
+    root.after(100, check_done)
+
+
+def write_rec_card_xlsx(filepath, pairs):
+    """Запись карточки рекомендации (Параметр/Значение) потоково, без DataFrame"""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Рекомендация')
+    ws.append(('Параметр', 'Значение'))
+    for pair in pairs:
+        ws.append(pair)
+    wb.save(filepath)
+
+
 def export_single_rec(rec):
     """Экспорт одной рекомендации"""
     filepath = filedialog.asksaveasfilename(
@@ -3516,22 +4335,73 @@ def export_single_rec(rec):
         initialfile=f"Рекомендация_{rec.supplier}_{rec.warehouse}.xlsx"
     )
     if filepath:
-        data = {
-            'Параметр': ['Поставщик', 'Склад', 'ПВ', 'День', 'Интервал', 'Сдвиг', 'Уверенность', 'Тренд', 'Причина'],
-            'Значение': [
-                rec.supplier,
-                rec.warehouse,
-                normalize_pv_value(getattr(rec, 'pv', None)),
-                rec.weekday,
-                f"{rec.order_time_start}-{rec.order_time_end}",
-                f"{rec.shift_minutes:+d} мин",
-                f"{rec.confidence*100:.0f}%",
-                rec.trend_detected,
-                rec.reason
-            ]
-        }
-        pd.DataFrame(data).to_excel(filepath, index=False)
-        messagebox.showinfo("✅ Готово", f"Сохранено: {Path(filepath).name}")
+        pairs = [
+            ('Поставщик', rec.supplier),
+            ('Склад', rec.warehouse),
+            ('ПВ', normalize_pv_value(getattr(rec, 'pv', None))),
+            ('День', rec.weekday),
+            ('Интервал', f"{rec.order_time_start}-{rec.order_time_end}"),
+            ('Сдвиг', f"{rec.shift_minutes:+d} мин"),
+            ('Уверенность', f"{rec.confidence*100:.0f}%"),
+            ('Тренд', rec.trend_detected),
+            ('Причина', rec.reason),
+        ]
+        
+        def done(_):
+            update_status(f"✅ Сохранено: {Path(filepath).name}", "success")
+            messagebox.showinfo("✅ Готово", f"Сохранено: {Path(filepath).name}")
+        
+        run_export_async(write_rec_card_xlsx, (filepath, pairs), done)
+
+
+def write_recommendations_xlsx(filepath, recs):
+    """Запись рекомендаций в xlsx (без обращений к Tk - выполняется в фоновом потоке)"""
+    headers = ('Поставщик', 'Склад', 'ПВ', 'День', 'Час заказа', 'Сдвиг (мин)',
+               'Уверенность', 'Тренд', 'Причина', 'Применить с')
+    rows = [(
+        r.supplier,
+        r.warehouse,
+        normalize_pv_value(r.pv),
+        r.weekday,
+        r.order_time_start,
+        r.shift_minutes,
+        f"{r.confidence*100:.0f}%",
+        r.trend_detected,
+        r.reason,
+        r.effective_from
+    ) for r in recs]
+    
+    # Ширины считаем за один проход по строкам: в write_only их задают до записи
+    widths = [len(h) for h in headers]
+    for row in rows:
+        for i, value in enumerate(row):
+            length = len(str(value if value is not None else ""))
+            if length > widths[i]:
+                widths[i] = length
+    
+    # Потоковая запись без построения графа ячеек в памяти
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Рекомендации')
+    for i, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = min(width + 2, 50)
+    
+    header_fill = PatternFill(start_color="1a237e", end_color="1a237e", fill_type="solid")
+    header_font = Font(bold=True, color="FFFFFF")
+    header_alignment = Alignment(horizontal="center")
+    header_cells = []
+    for h in headers:
+        cell = WriteOnlyCell(ws, value=h)
+        cell.fill = header_fill
+        cell.font = header_font
+        cell.alignment = header_alignment
+        header_cells.append(cell)
+    ws.append(header_cells)
+    
+    for row in rows:
+        ws.append(row)
+    
+    wb.save(filepath)
+    return len(rows)
 
 
 def export_all_recommendations():
@@ -3549,39 +4419,27 @@ def export_all_recommendations():
     if not filepath:
         return
     
-    data = [{
-        'Поставщик': r.supplier,
-        'Склад': r.warehouse,
-        'ПВ': normalize_pv_value(r.pv),
-        'День': r.weekday,
-        'Час заказа': r.order_time_start,
-        'Сдвиг (мин)': r.shift_minutes,
-        'Уверенность': f"{r.confidence*100:.0f}%",
-        'Тренд': r.trend_detected,
-        'Причина': r.reason,
-        'Применить с': r.effective_from
-    } for r in recommendations]
-    
-    df = pd.DataFrame(data)
-    df.to_excel(filepath, index=False, engine='openpyxl')
-    
-    # Форматирование
-    wb = load_workbook(filepath)
-    ws = wb.active
-    header_fill = PatternFill(start_color="1a237e", end_color="1a237e", fill_type="solid")
-    header_font = Font(bold=True, color="FFFFFF")
-    
-    for cell in ws[1]:
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal="center")
+    def done(count):
+        update_status(f"✅ Экспортировано {count} рекомендаций", "success")
+        messagebox.showinfo("✅ Готово", f"Экспортировано {count} рекомендаций")
     
-    for col in ws.columns:
-        max_len = max(len(str(cell.value or "")) for cell in col)
-        ws.column_dimensions[col[0].column_letter].width = min(max_len + 2, 50)
-    
-    wb.save(filepath)
-    messagebox.showinfo("✅ Готово", f"Экспортировано {len(recommendations)} рекомендаций")
+    # Снимок списка: переобучение модели может заменить recommendations во время записи
+    run_export_async(write_recommendations_xlsx, (filepath, list(recommendations)), done)
+
+
+# Производные агрегаты df_current для общих графиков (сбрасываются при смене df_current)
+_derived_cache = {'df': None, 'values': {}}
+
+
+def get_derived(key, compute):
+    """Агрегат по df_current из кэша или вычисленный compute(df_current)"""
+    if _derived_cache['df'] is not df_current:
+        _derived_cache['df'] = df_current
+        _derived_cache['values'] = {}
+    values = _derived_cache['values']
+    if key not in values:
+        values[key] = compute(df_current)
+    return values[key]
 
 
 def show_overall_charts():
@@ -3599,9 +4457,9 @@ def show_overall_charts():
     header = tk.Frame(win, bg=COLORS['header'])
     header.pack(fill='x')
     tk.Label(header, text="📊 Общая аналитика по всем поставщикам", 
-            font=("Segoe UI", 16, "bold"), bg=COLORS['header'], fg='white').pack(pady=12)
+            font="SegoeUI16B", bg=COLORS['header'], fg='white').pack(pady=12)
     
-    fig = Figure(figsize=(15, 10), dpi=100, facecolor=COLORS['bg'])
+    fig = acquire_chart_figure('overall', (15, 10))
     
     # 2x3 сетка
     ax1 = fig.add_subplot(231)
@@ -3611,33 +4469,40 @@ def show_overall_charts():
     ax5 = fig.add_subplot(235)
     ax6 = fig.add_subplot(236)
     
+    # Маски из готовых кодов полосы отклонения (int8, посчитаны при загрузке)
+    dev = df_current['Разница во времени привоза (мин.)'].to_numpy(dtype=float)
+    dev_cat = df_current['_dev_cat'].to_numpy()
+    on_time_mask = dev_cat == DEV_BAND_ON_TIME
+    late_mask = dev_cat == DEV_BAND_LATE
+    
     # 1. Топ-10 поставщиков по количеству опозданий
-    late_by_supplier = df_current[df_current['Разница во времени привоза (мин.)'] > 30].groupby('Поставщик').size().nlargest(10)
-    colors_top = plt.cm.Reds(np.linspace(0.4, 0.8, len(late_by_supplier)))
-    bars1 = ax1.barh(range(len(late_by_supplier)), late_by_supplier.values, color=colors_top, edgecolor='white', linewidth=1)
-    ax1.set_yticks(range(len(late_by_supplier)))
-    ax1.set_yticklabels([s[:25] for s in late_by_supplier.index], fontsize=9)
+    late_by_supplier = get_derived('supplier_late', lambda df: (
+        df['Поставщик'][late_mask].value_counts().pipe(lambda counts: counts[counts > 0]).head(10)
+    ))
+    late_vals = late_by_supplier.to_numpy()
+    colors_top = reds_gradient(late_vals.size)
+    bars1 = ax1.barh(range(late_vals.size), late_vals, color=colors_top, edgecolor='white', linewidth=1)
+    ax1.set_yticks(range(late_vals.size))
+    ax1.set_yticklabels(late_by_supplier.index.str.slice(0, 25).tolist(), fontsize=9)
     ax1.set_title('🔴 Топ-10 по опозданиям (>30 мин)', fontsize=12, fontweight='bold', pad=10)
     ax1.set_xlabel('Количество опозданий', fontsize=10)
     ax1.invert_yaxis()
     ax1.grid(True, alpha=0.2, axis='x', linestyle='--')
     ax1.set_facecolor('#fafafa')
     
-    for i, bar in enumerate(bars1):
-        width = bar.get_width()
-        ax1.text(width, bar.get_y() + bar.get_height()/2., f' {int(width)}',
-                ha='left', va='center', fontsize=8, fontweight='bold')
+    ax1.bar_label(bars1, labels=[f' {int(v)}' for v in late_vals], fontsize=8, fontweight='bold')
     
     # 2. Топ-10 поставщиков по % вовремя
-    supplier_stats = df_current.groupby('Поставщик').apply(
-        lambda x: (x['Разница во времени привоза (мин.)'].between(-30, 30).sum() / len(x)) * 100
-    ).nlargest(10)
+    supplier_stats = get_derived('supplier_ontime_pct', lambda df: (
+        pd.Series(on_time_mask, index=df.index).groupby(df['Поставщик'], observed=True).mean().mul(100).nlargest(10)
+    ))
     
-    colors_best = ['#4caf50' if p >= 90 else '#8bc34a' if p >= 80 else '#fdd835' for p in supplier_stats.values]
-    bars2 = ax2.barh(range(len(supplier_stats)), supplier_stats.values, color=colors_best, 
+    best_vals = supplier_stats.to_numpy()
+    colors_best = np.select([best_vals >= 90, best_vals >= 80], ['#4caf50', '#8bc34a'], default='#fdd835').tolist()
+    bars2 = ax2.barh(range(best_vals.size), best_vals, color=colors_best, 
                     edgecolor='white', linewidth=1, alpha=0.8)
-    ax2.set_yticks(range(len(supplier_stats)))
-    ax2.set_yticklabels([s[:25] for s in supplier_stats.index], fontsize=9)
+    ax2.set_yticks(range(best_vals.size))
+    ax2.set_yticklabels(supplier_stats.index.str.slice(0, 25).tolist(), fontsize=9)
     ax2.set_title('🟢 Топ-10 лучших по % вовремя', fontsize=12, fontweight='bold', pad=10)
     ax2.set_xlabel('% вовремя', fontsize=10)
     ax2.axvline(x=80, color='#2e7d32', linestyle='--', linewidth=2, alpha=0.6, label='Цель: 80%')
@@ -3646,29 +4511,30 @@ def show_overall_charts():
     ax2.grid(True, alpha=0.2, axis='x', linestyle='--')
     ax2.set_facecolor('#fafafa')
     
-    for i, bar in enumerate(bars2):
-        width = bar.get_width()
+    # Подписи внутри столбцов (bar_label не даёт выровнять по правому краю внутри)
+    for bar, width in zip(bars2, best_vals.tolist()):
         ax2.text(width - 3, bar.get_y() + bar.get_height()/2., f'{width:.1f}%',
                 ha='right', va='center', fontsize=9, fontweight='bold', color='white')
     
     # 3. Распределение всех отклонений (улучшенная гистограмма)
-    deviations = df_current['Разница во времени привоза (мин.)'].dropna()
-    counts, bins, patches = ax3.hist(deviations, bins=60, edgecolor='white', linewidth=0.5)
-    
-    for i, patch in enumerate(patches):
-        bin_center = (bins[i] + bins[i+1]) / 2
-        if -30 <= bin_center <= 30:
-            color = '#4caf50'
-        elif -60 <= bin_center <= 60:
-            color = '#ff9800'
-        else:
-            color = '#f44336'
-        patch.set_facecolor(color)
-        patch.set_alpha(0.7)
+    deviations = dev[~np.isnan(dev)]
+    counts, bins = np.histogram(deviations, bins=60)
+    
+    # Цвет столбца по центру интервала: по одному bar() на каждую группу
+    abs_centers = np.abs((bins[:-1] + bins[1:]) / 2)
+    bin_widths = np.diff(bins)
+    mask_green = abs_centers <= 30
+    mask_orange = ~mask_green & (abs_centers <= 60)
+    mask_red = ~(mask_green | mask_orange)
+    for mask, color in ((mask_green, '#4caf50'), (mask_orange, '#ff9800'), (mask_red, '#f44336')):
+        if mask.any():
+            ax3.bar(bins[:-1][mask], counts[mask], width=bin_widths[mask], align='edge',
+                    color=color, alpha=0.7, edgecolor='white', linewidth=0.5)
     
     ax3.axvline(x=0, color='#1565c0', linestyle='--', linewidth=2.5, label='График')
-    ax3.axvline(x=deviations.median(), color='#d32f2f', linestyle='-', linewidth=2.5, 
-               label=f'Медиана: {deviations.median():.0f} мин')
+    median_dev = np.median(deviations) if deviations.size else np.nan
+    ax3.axvline(x=median_dev, color='#d32f2f', linestyle='-', linewidth=2.5, 
+               label=f'Медиана: {median_dev:.0f} мин')
     ax3.axvline(x=-30, color='#7cb342', linestyle=':', linewidth=1.5, alpha=0.6)
     ax3.axvline(x=30, color='#7cb342', linestyle=':', linewidth=1.5, alpha=0.6, label='±30 мин')
     ax3.set_title('📊 Распределение отклонений', fontsize=12, fontweight='bold', pad=10)
@@ -3680,11 +4546,14 @@ def show_overall_charts():
     ax3.set_facecolor('#fafafa')
     
     # 4. Заказы по дням недели с медианой
-    weekday_counts = df_current.groupby('День_недели').size().reindex(DAYS_RU).fillna(0)
-    weekday_median = df_current.groupby('День_недели')['Разница во времени привоза (мин.)'].median().reindex(DAYS_RU).fillna(0)
+    weekday_counts = get_derived('weekday_counts', lambda df: (
+        df['День_недели'].value_counts(sort=False)
+    ))
+    weekday_median = get_derived('weekday_median', lambda df: (
+        df.groupby('День_недели', observed=False)['Разница во времени привоза (мин.)'].median().fillna(0)
+    ))
     
-    colors_wd = ['#2196f3' if i < 5 else '#ff9800' for i in range(7)]
-    bars4 = ax4.bar(range(7), weekday_counts.values, color=colors_wd, alpha=0.7, edgecolor='white', linewidth=1)
+    bars4 = ax4.bar(range(7), weekday_counts.to_numpy(), color=WEEKDAY_COLORS.tolist(), alpha=0.7, edgecolor='white', linewidth=1)
     
     ax4_twin = ax4.twinx()
     ax4_twin.plot(range(7), weekday_median.values, color='#d32f2f', marker='D', 
@@ -3701,8 +4570,9 @@ def show_overall_charts():
     ax4.set_facecolor('#fafafa')
     
     # 5. Динамика по месяцам
-    df_current['Месяц'] = df_current['Время заказа позиции'].dt.to_period('M')
-    monthly = df_current.groupby('Месяц')['Разница во времени привоза (мин.)'].agg(['median', 'count', 'std'])
+    monthly = get_derived('monthly', lambda df: (
+        df.groupby('Месяц', observed=True)['Разница во времени привоза (мин.)'].agg(['median', 'count', 'std'])
+    ))
     
     if len(monthly) > 0:
         x = range(len(monthly))
@@ -3730,9 +4600,7 @@ def show_overall_charts():
     
     # 6. Общая сводка: вовремя/ранние/опоздания
     total = len(df_current)
-    on_time = len(df_current[df_current['Разница во времени привоза (мин.)'].between(-30, 30)])
-    early = len(df_current[df_current['Разница во времени привоза (мин.)'] < -30])
-    late = len(df_current[df_current['Разница во времени привоза (мин.)'] > 30])
+    early, on_time, late = np.bincount(dev_cat, minlength=4)[:3].tolist()
     
     sizes = [on_time, early, late]
     labels = [f'✅ Вовремя\n{on_time:,}\n({on_time/total*100:.1f}%)', 
@@ -3756,12 +4624,29 @@ def show_overall_charts():
     
     toolbar = NavigationToolbar2Tk(canvas, win)
     toolbar.update()
+    
+    release_figure_on_close(win, fig, canvas, pool_key='overall')
 
 
 # ========================================
 # ГЛАВНОЕ ОКНО
 # ========================================
+# Именованные шрифты "SegoeUI<размер>" / "SegoeUI<размер>B": Tk создаёт каждый один раз,
+# виджеты ссылаются на него по имени вместо разбора кортежа ("Segoe UI", 9, "bold")
+UI_FONT_SIZES = (8, 9, 10, 11, 12, 14, 16, 18, 22)
+_ui_fonts = {}  # ссылки держат шрифты живыми (tkfont.Font удаляет шрифт при сборке мусора)
+
+
+def register_ui_fonts(master):
+    """Создание именованных шрифтов интерфейса"""
+    for size in UI_FONT_SIZES:
+        for suffix, weight in (('', 'normal'), ('B', 'bold')):
+            name = f"SegoeUI{size}{suffix}"
+            _ui_fonts[name] = tkfont.Font(root=master, name=name, family="Segoe UI", size=size, weight=weight)
+
+
 root = tk.Tk()
+register_ui_fonts(root)
 root.title("🤖 ML-Аналитика доставок v2.0")
 root.geometry("1400x900")
 root.configure(bg=COLORS['bg'])
@@ -3769,8 +4654,8 @@ root.configure(bg=COLORS['bg'])
 # Стиль
 style = ttk.Style()
 style.theme_use("clam")
-style.configure("Treeview", rowheight=26, font=("Segoe UI", 9))
-style.configure("Treeview.Heading", font=("Segoe UI", 9, "bold"), background="#e0e0e0")
+style.configure("Treeview", rowheight=26, font="SegoeUI9")
+style.configure("Treeview.Heading", font="SegoeUI9B", background="#e0e0e0")
 style.map("Treeview", background=[('selected', COLORS['primary'])])
 
 # === ЗАГОЛОВОК ===
@@ -3780,7 +4665,7 @@ header_frame.pack(fill='x')
 tk.Label(
     header_frame,
     text="🤖 ML-Аналитика доставок",
-    font=("Segoe UI", 22, "bold"),
+    font="SegoeUI22B",
     bg=COLORS['header'],
     fg='white'
 ).pack(pady=(15, 5))
@@ -3788,7 +4673,7 @@ tk.Label(
 tk.Label(
     header_frame,
     text="Машинное обучение для оптимизации графика поставок",
-    font=("Segoe UI", 10),
+    font="SegoeUI10",
     bg=COLORS['header'],
     fg='#90a4ae'
 ).pack(pady=(0, 2))
@@ -3805,7 +4690,7 @@ else:
 tk.Label(
     header_frame,
     text=env_label_text,
-    font=("Segoe UI", 8),
+    font="SegoeUI8",
     bg=COLORS['header'],
     fg=env_color
 ).pack(pady=(0, 15))
@@ -3815,7 +4700,7 @@ control_frame = tk.Frame(root, bg=COLORS['bg'])
 control_frame.pack(fill='x', padx=15, pady=10)
 
 # Даты
-date_frame = tk.LabelFrame(control_frame, text="📅 Период", font=("Segoe UI", 9), bg=COLORS['bg'])
+date_frame = tk.LabelFrame(control_frame, text="📅 Период", font="SegoeUI9", bg=COLORS['bg'])
 date_frame.pack(side='left', padx=5)
 
 # Календари - используем только базовые параметры для избежания проблем
@@ -3840,18 +4725,18 @@ cal_end.set_date(datetime.today())
 cal_end.pack(side='left', padx=5, pady=5)
 
 # Кнопки загрузки
-btn_load_frame = tk.LabelFrame(control_frame, text="📥 Загрузка", font=("Segoe UI", 9), bg=COLORS['bg'])
+btn_load_frame = tk.LabelFrame(control_frame, text="📥 Загрузка", font="SegoeUI9", bg=COLORS['bg'])
 btn_load_frame.pack(side='left', padx=10)
 
 tk.Button(btn_load_frame, text="📥 Период", command=fetch_data, bg=COLORS['primary'], fg='white', 
-          font=("Segoe UI", 9), width=10).pack(side='left', padx=3, pady=5)
+          font="SegoeUI9", width=10).pack(side='left', padx=3, pady=5)
 tk.Button(btn_load_frame, text="📚 История", command=fetch_historical_data, bg='#7b1fa2', fg='white',
-          font=("Segoe UI", 9), width=10).pack(side='left', padx=3, pady=5)
+          font="SegoeUI9", width=10).pack(side='left', padx=3, pady=5)
 tk.Button(btn_load_frame, text="💾 Кэш", command=load_cached_data, bg=COLORS['success'], fg='white',
-          font=("Segoe UI", 9), width=8).pack(side='left', padx=3, pady=5)
+          font="SegoeUI9", width=8).pack(side='left', padx=3, pady=5)
 
 # Фильтр по ПВ
-pv_filter_frame = tk.LabelFrame(control_frame, text="🏬 Фильтр ПВ", font=("Segoe UI", 9), bg=COLORS['bg'])
+pv_filter_frame = tk.LabelFrame(control_frame, text="🏬 Фильтр ПВ", font="SegoeUI9", bg=COLORS['bg'])
 pv_filter_frame.pack(side='left', padx=10)
 
 pv_filter_var = tk.StringVar(value="Все ПВ")
@@ -3865,13 +4750,17 @@ def apply_pv_filter(event=None):
     if df_original is None:
         return
     
+    # df_current только читается (Copy-on-Write), поэтому без явных копий:
+    # "Все ПВ" - тот же объект, фильтр - выборка по булевой маске numpy
     selected = pv_filter_var.get()
     if selected == "Все ПВ":
-        df_current = df_original.copy()
+        df_current = df_original
         current_pv_filter = None
     else:
-        df_current = df_original[df_original['ПВ'] == selected].copy()
+        mask = (df_original['ПВ'] == selected).to_numpy()  # сравнение по коду категории
+        df_current = df_original[mask]
         current_pv_filter = selected
+    _derived_cache['values'].clear()
     
     update_stats_display()
     update_raw_data_display()
@@ -3880,22 +4769,28 @@ def apply_pv_filter(event=None):
 
 pv_filter_combo.bind('<<ComboboxSelected>>', apply_pv_filter)
 
+# Отсортированный список ПВ для фильтра (пересчитывается только при смене df_original)
+_pv_options_cache = {'df': None, 'values': None}
+
+
 def update_pv_filter_options():
     """Обновить список ПВ в фильтре"""
     if df_original is not None:
-        pv_list = ["Все ПВ"] + sorted(df_original['ПВ'].dropna().unique().tolist())
-        pv_filter_combo['values'] = pv_list
+        if _pv_options_cache['df'] is not df_original:
+            _pv_options_cache['df'] = df_original
+            _pv_options_cache['values'] = ["Все ПВ"] + sorted(df_original['ПВ'].dropna().unique().tolist())
+        pv_filter_combo['values'] = _pv_options_cache['values']
 
 # Кнопки анализа
-btn_analysis_frame = tk.LabelFrame(control_frame, text="🔍 Анализ", font=("Segoe UI", 9), bg=COLORS['bg'])
+btn_analysis_frame = tk.LabelFrame(control_frame, text="🔍 Анализ", font="SegoeUI9", bg=COLORS['bg'])
 btn_analysis_frame.pack(side='left', padx=10)
 
 tk.Button(btn_analysis_frame, text="🔄 Переобучить", command=retrain_model, bg='#9c27b0', fg='white',
-          font=("Segoe UI", 9), width=12).pack(side='left', padx=3, pady=5)
+          font="SegoeUI9", width=12).pack(side='left', padx=3, pady=5)
 tk.Button(btn_analysis_frame, text="📊 Графики", command=show_overall_charts, bg=COLORS['info'], fg='white',
-          font=("Segoe UI", 9), width=10).pack(side='left', padx=3, pady=5)
+          font="SegoeUI9", width=10).pack(side='left', padx=3, pady=5)
 tk.Button(btn_analysis_frame, text="📥 Экспорт", command=export_all_recommendations, bg=COLORS['warning'], fg='white',
-          font=("Segoe UI", 9), width=10).pack(side='left', padx=3, pady=5)
+          font="SegoeUI9", width=10).pack(side='left', padx=3, pady=5)
 
 
 def load_schedule_button():
@@ -3904,21 +4799,21 @@ def load_schedule_button():
     
     def load():
         try:
-            root.after(0, lambda: update_status("⏳ Загрузка расписания...", "info"))
-            root.after(0, progress_bar.start)
+            post_to_ui(lambda: update_status("⏳ Загрузка расписания...", "info"))
+            post_to_ui(progress_bar.start)
             
             schedules_cache = None
             schedules = fetch_schedules()
             
-            root.after(0, progress_bar.stop)
+            post_to_ui(progress_bar.stop)
             
             if schedules:
-                root.after(0, lambda: update_status(f"📋 Загружено {len(schedules)} записей расписания", "success"))
+                post_to_ui(lambda: update_status(f"📋 Загружено {len(schedules)} записей расписания", "success"))
             else:
-                root.after(0, lambda: update_status("⚠️ Расписание не найдено или ошибка", "warning"))
+                post_to_ui(lambda: update_status("⚠️ Расписание не найдено или ошибка", "warning"))
         except Exception as e:
-            root.after(0, progress_bar.stop)
-            root.after(0, lambda: update_status(f"❌ Ошибка: {str(e)[:30]}", "error"))
+            post_to_ui(progress_bar.stop)
+            post_to_ui(lambda: update_status(f"❌ Ошибка: {str(e)[:30]}", "error"))
     
     thread = threading.Thread(target=load, daemon=True)
     thread.start()
@@ -3944,19 +4839,19 @@ def show_all_schedules():
     header = tk.Frame(win, bg=COLORS['header'])
     header.pack(fill='x')
     tk.Label(header, text="📋 Расписание доставки по ПВ", 
-            font=("Segoe UI", 16, "bold"), bg=COLORS['header'], fg='white').pack(pady=10)
+            font="SegoeUI16B", bg=COLORS['header'], fg='white').pack(pady=10)
     
     # Собираем уникальные ПВ
     pv_list = sorted(set(s.get('branchAddress', '') for s in schedules_cache if s.get('branchAddress')))
     
     tk.Label(header, text=f"Всего ПВ: {len(pv_list)} | Окон: {len(schedules_cache)}", 
-            font=("Segoe UI", 9), bg=COLORS['header'], fg='#90a4ae').pack(pady=(0, 10))
+            font="SegoeUI9", bg=COLORS['header'], fg='#90a4ae').pack(pady=(0, 10))
     
     # Фрейм выбора ПВ
     select_frame = tk.Frame(win, bg=COLORS['bg'])
     select_frame.pack(fill='x', padx=10, pady=10)
     
-    tk.Label(select_frame, text="🏬 Выберите ПВ:", font=("Segoe UI", 11, "bold"), 
+    tk.Label(select_frame, text="🏬 Выберите ПВ:", font="SegoeUI11B", 
             bg=COLORS['bg']).pack(side='left', padx=5)
     
     pv_var = tk.StringVar()
@@ -3967,7 +4862,7 @@ def show_all_schedules():
     if pv_list:
         pv_combo.current(0)
     
-    info_label = tk.Label(select_frame, text="", font=("Segoe UI", 9, "bold"), 
+    info_label = tk.Label(select_frame, text="", font="SegoeUI9B", 
                          bg=COLORS['bg'], fg=COLORS['primary'])
     info_label.pack(side='right', padx=10)
     
@@ -4030,7 +4925,7 @@ def show_all_schedules():
         
         if not pv_schedules:
             tk.Label(table_frame, text="Нет расписания для выбранного ПВ", 
-                    font=("Segoe UI", 12), bg=COLORS['bg'], fg=COLORS['text_light']).grid(row=0, column=0)
+                    font="SegoeUI12", bg=COLORS['bg'], fg=COLORS['text_light']).grid(row=0, column=0)
             return
         
         # Группируем по складу
@@ -4048,12 +4943,12 @@ def show_all_schedules():
         header_bg = '#1a237e'
         header_fg = 'white'
         
-        tk.Label(table_frame, text="Склад", font=("Segoe UI", 10, "bold"), 
+        tk.Label(table_frame, text="Склад", font="SegoeUI10B", 
                 bg=header_bg, fg=header_fg, width=25, anchor='w', padx=10, pady=8,
                 relief='ridge').grid(row=0, column=0, sticky='nsew')
         
         for col, day in enumerate(DAYS_SHORT, 1):
-            tk.Label(table_frame, text=day, font=("Segoe UI", 10, "bold"), 
+            tk.Label(table_frame, text=day, font="SegoeUI10B", 
                     bg=header_bg, fg=header_fg, width=15, padx=5, pady=8,
                     relief='ridge').grid(row=0, column=col, sticky='nsew')
         
@@ -4066,7 +4961,7 @@ def show_all_schedules():
             row_bg = '#ffffff' if row_num % 2 == 1 else '#f5f5f5'
             
             # Ячейка склада
-            tk.Label(table_frame, text=warehouse[:35], font=("Segoe UI", 9), 
+            tk.Label(table_frame, text=warehouse[:35], font="SegoeUI9", 
                     bg=row_bg, anchor='w', padx=10, pady=5,
                     relief='ridge', wraplength=200).grid(row=row_num, column=0, sticky='nsew')
             
@@ -4087,10 +4982,10 @@ def show_all_schedules():
                         else:
                             window_bg = '#fff3e0'
                         
-                        tk.Label(cell_frame, text=window_text, font=("Segoe UI", 9), 
+                        tk.Label(cell_frame, text=window_text, font="SegoeUI9", 
                                 bg=window_bg, padx=4, pady=2, anchor='w').pack(fill='x', padx=2, pady=1)
                 else:
-                    tk.Label(cell_frame, text="—", font=("Segoe UI", 9), 
+                    tk.Label(cell_frame, text="—", font="SegoeUI9", 
                             bg=row_bg, fg=COLORS['text_light'], padx=4, pady=5).pack()
             
             row_num += 1
@@ -4116,7 +5011,7 @@ def show_all_schedules():
     
     tk.Label(stats_frame, 
             text="🚗 self = поставщик возит | 📦 courier = наш курьер | Формат: Заказ до → Доставят к",
-            font=("Segoe UI", 9), bg='#eceff1', fg=COLORS['text']).pack(pady=8)
+            font="SegoeUI9", bg='#eceff1', fg=COLORS['text']).pack(pady=8)
     
     # Инициализация таблицы
     update_table()
@@ -4132,7 +5027,7 @@ def show_all_schedules():
 
 
 tk.Button(btn_analysis_frame, text="📋 Расписание", command=show_all_schedules, bg='#00796b', fg='white',
-          font=("Segoe UI", 9), width=11).pack(side='left', padx=3, pady=5)
+          font="SegoeUI9", width=11).pack(side='left', padx=3, pady=5)
 
 # Прогресс и статус
 progress_frame = tk.Frame(control_frame, bg=COLORS['bg'])
@@ -4141,7 +5036,7 @@ progress_frame.pack(side='right', padx=10)
 progress_bar = ttk.Progressbar(progress_frame, mode='indeterminate', length=150)
 progress_bar.pack(side='top', pady=2)
 
-status_label = tk.Label(progress_frame, text="Ожидание данных...", font=("Segoe UI", 9), 
+status_label = tk.Label(progress_frame, text="Ожидание данных...", font="SegoeUI9", 
                        bg=COLORS['bg'], fg=COLORS['text_light'])
 status_label.pack(side='top')
 
@@ -4157,8 +5052,8 @@ stats_header = tk.Frame(frame_stats, bg=COLORS['bg'])
 stats_header.pack(fill='x', padx=10, pady=5)
 
 tk.Label(stats_header, text="💡 Двойной клик — подробный анализ направления", 
-        font=("Segoe UI", 9), bg=COLORS['bg'], fg=COLORS['text_light']).pack(side='left')
-lbl_stats_count = tk.Label(stats_header, text="Поставщиков: 0", font=("Segoe UI", 9, "bold"), 
+        font="SegoeUI9", bg=COLORS['bg'], fg=COLORS['text_light']).pack(side='left')
+lbl_stats_count = tk.Label(stats_header, text="Поставщиков: 0", font="SegoeUI9B", 
                           bg=COLORS['bg'], fg=COLORS['primary'])
 lbl_stats_count.pack(side='right')
 
@@ -4167,7 +5062,7 @@ table_frame_stats = tk.Frame(frame_stats, bg=COLORS['bg'])
 table_frame_stats.pack(fill='both', expand=True, padx=10, pady=5)
 
 cols_stats = ('Поставщик', 'Склад', 'ПВ', 'Заказов', 'Ср. откл.', 'Медиана', 'Ст. откл.', '% вовремя')
-tree_stats = SortableTreeview(table_frame_stats, columns=cols_stats, show='headings', height=22)
+tree_stats = VirtualSortableTreeview(table_frame_stats, columns=cols_stats, show='headings', height=22)
 enable_treeview_copy(tree_stats)  # Включаем копирование
 tree_stats.column('Поставщик', width=200)
 tree_stats.column('Склад', width=180)
@@ -4207,14 +5102,14 @@ ml_rec_info.pack(fill='x', padx=10, pady=10)
 
 tk.Label(ml_rec_info, text="🤖 Рекомендации ML-модели по корректировке расписания доставки.\n"
         "Анализ основан на исторических данных. Двойной клик — подробности и совет по изменению расписания.",
-        font=("Segoe UI", 9), bg='#e8f5e9', fg=COLORS['text'], justify='left').pack(padx=10, pady=8)
+        font="SegoeUI9", bg='#e8f5e9', fg=COLORS['text'], justify='left').pack(padx=10, pady=8)
 
 ml_rec_header = tk.Frame(frame_ml_rec, bg=COLORS['bg'])
 ml_rec_header.pack(fill='x', padx=10)
 
 tk.Label(ml_rec_header, text="💡 Двойной клик — подробности и рекомендация по изменению расписания",
-        font=("Segoe UI", 9), bg=COLORS['bg'], fg=COLORS['text_light']).pack(side='left')
-lbl_ml_rec_count = tk.Label(ml_rec_header, text="ML-рекомендаций: 0", font=("Segoe UI", 9, "bold"),
+        font="SegoeUI9", bg=COLORS['bg'], fg=COLORS['text_light']).pack(side='left')
+lbl_ml_rec_count = tk.Label(ml_rec_header, text="ML-рекомендаций: 0", font="SegoeUI9B",
                            bg=COLORS['bg'], fg=COLORS['success'])
 lbl_ml_rec_count.pack(side='right')
 
@@ -4223,7 +5118,7 @@ table_frame_ml_rec = tk.Frame(frame_ml_rec, bg=COLORS['bg'])
 table_frame_ml_rec.pack(fill='both', expand=True, padx=10, pady=5)
 
 cols_ml_rec = ('Поставщик', 'Склад', 'ПВ', 'День', 'Заказ до', 'Текущее расп.', 'Корректир.', 'Уверен.', 'Причина')
-tree_ml_rec = SortableTreeview(table_frame_ml_rec, columns=cols_ml_rec, show='headings', height=20)
+tree_ml_rec = VirtualSortableTreeview(table_frame_ml_rec, columns=cols_ml_rec, show='headings', height=20)
 enable_treeview_copy(tree_ml_rec)  # Включаем копирование
 tree_ml_rec.column('Поставщик', width=150)
 tree_ml_rec.column('Склад', width=130)
@@ -4264,11 +5159,11 @@ raw_info.pack(fill='x', padx=10, pady=10)
 
 tk.Label(raw_info, text="📄 Исходные данные после импорта из CRM.\n"
         "Двойной клик на заказ — открыть в CRM. Кликните на заголовок столбца для сортировки.",
-        font=("Segoe UI", 9), bg='#fff3e0', fg=COLORS['text'], justify='left').pack(padx=10, pady=8)
+        font="SegoeUI9", bg='#fff3e0', fg=COLORS['text'], justify='left').pack(padx=10, pady=8)
 
 raw_header = tk.Frame(frame_raw, bg=COLORS['bg'])
 raw_header.pack(fill='x', padx=10)
-lbl_raw_count = tk.Label(raw_header, text="Записей: 0", font=("Segoe UI", 9, "bold"),
+lbl_raw_count = tk.Label(raw_header, text="Записей: 0", font="SegoeUI9B",
                         bg=COLORS['bg'], fg=COLORS['warning'])
 lbl_raw_count.pack(side='right')
 
@@ -4277,7 +5172,7 @@ tree_frame_raw = tk.Frame(frame_raw, bg=COLORS['bg'])
 tree_frame_raw.pack(fill='both', expand=True, padx=10, pady=5)
 
 cols_raw = ('№ заказа', 'Поставщик', 'Склад', 'ПВ', 'Бренд', 'Артикул', 'Дата заказа', 'План привоза', 'Факт привоза', 'Откл. (мин)')
-tree_raw = SortableTreeview(tree_frame_raw, columns=cols_raw, show='headings', height=20)
+tree_raw = VirtualSortableTreeview(tree_frame_raw, columns=cols_raw, show='headings', height=20)
 enable_treeview_copy(tree_raw)  # Включаем копирование
 tree_raw.column('№ заказа', width=90)
 tree_raw.column('Поставщик', width=150)
@@ -4326,7 +5221,7 @@ map_info.pack(fill='x', padx=10, pady=10)
 
 tk.Label(map_info, text="🗺️ Визуализация цепочки поставок: Склад поставщика → ПВ\n"
         "Размер узла = количество заказов. Цвет: 🟢 ≥80% вовремя, 🟠 60-80%, 🔴 <60%",
-        font=("Segoe UI", 9), bg='#e3f2fd', fg=COLORS['text'], justify='left').pack(padx=10, pady=8)
+        font="SegoeUI9", bg='#e3f2fd', fg=COLORS['text'], justify='left').pack(padx=10, pady=8)
 
 map_header = tk.Frame(frame_map, bg=COLORS['bg'])
 map_header.pack(fill='x', padx=10)
@@ -4336,13 +5231,13 @@ map_buttons = tk.Frame(map_header, bg=COLORS['bg'])
 map_buttons.pack(side='left')
 
 tk.Button(map_buttons, text="🔴 Проблемные", command=show_problematic_routes, bg=COLORS['danger'], fg='white',
-          font=("Segoe UI", 9), width=14).pack(side='left', padx=3)
+          font="SegoeUI9", width=14).pack(side='left', padx=3)
 tk.Button(map_buttons, text="🔥 Популярные", command=show_popular_routes, bg=COLORS['info'], fg='white',
-          font=("Segoe UI", 9), width=14).pack(side='left', padx=3)
+          font="SegoeUI9", width=14).pack(side='left', padx=3)
 tk.Button(map_buttons, text="🔄 Обновить", command=update_supply_chain_map, bg=COLORS['success'], fg='white',
-          font=("Segoe UI", 9), width=11).pack(side='left', padx=3)
+          font="SegoeUI9", width=11).pack(side='left', padx=3)
 
-lbl_map_count = tk.Label(map_header, text="Направлений: 0", font=("Segoe UI", 9, "bold"),
+lbl_map_count = tk.Label(map_header, text="Направлений: 0", font="SegoeUI9B",
                         bg=COLORS['bg'], fg=COLORS['primary'])
 lbl_map_count.pack(side='right')
 
@@ -4356,7 +5251,7 @@ footer = tk.Frame(root, bg='#eceff1')
 footer.pack(fill='x')
 
 tk.Label(footer, text="🤖 Признаки: Поставщик×Склад×ПВ, день недели, час, скользящие средние, тренды | Рекомендации: на основе расписания и медианы отклонений",
-        font=("Segoe UI", 8), bg='#eceff1', fg=COLORS['text_light']).pack(pady=5)
+        font="SegoeUI8", bg='#eceff1', fg=COLORS['text_light']).pack(pady=5)
 
 # === АВТОЗАГРУЗКА РАСПИСАНИЯ ПРИ ЗАПУСКЕ ===
 def auto_load_schedules():
@@ -4367,9 +5262,9 @@ def auto_load_schedules():
         try:
             schedules = fetch_schedules()
             if schedules:
-                root.after(0, lambda: update_status(f"📋 Расписание загружено: {len(schedules)} окон", "success"))
+                post_to_ui(lambda: update_status(f"📋 Расписание загружено: {len(schedules)} окон", "success"))
             else:
-                root.after(0, lambda: update_status("⚠️ Расписание недоступно", "warning"))
+                post_to_ui(lambda: update_status("⚠️ Расписание недоступно", "warning"))
         except Exception as e:
             print(f"Ошибка автозагрузки расписания: {e}")
     
@@ -4379,6 +5274,9 @@ def auto_load_schedules():
 # Автозагрузка расписания
 auto_load_schedules()
 
+# Разбор очереди обновлений от фоновых потоков
+root.after(100, drain_ui_queue)
+
 # Запуск главного цикла с обработкой прерываний
 try:
     root.mainloop()
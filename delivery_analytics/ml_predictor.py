@@ -109,7 +109,7 @@ class DeliveryMLPredictor:
         for pv in df['ПВ'].unique():
             if pv not in self.pv_mapping:
                 self.pv_mapping[pv] = len(self.pv_mapping)
-        df['pv_encoded'] = df['ПВ'].map(lambda x: self.pv_mapping.get(x, -1))
+        df['pv_encoded'] = df['ПВ'].map(lambda x: self.pv_mapping.get(x, -1)).astype(int)
         return df
         
     def prepare_features(self, df: pd.DataFrame) -> pd.DataFrame:
@@ -154,17 +154,17 @@ class DeliveryMLPredictor:
         
         for window in [3, 7, 14]:
             col_name = f'rolling_mean_{window}'
-            df[col_name] = df.groupby(group_cols)[target_col].transform(
+            df[col_name] = df.groupby(group_cols, observed=True)[target_col].transform(
                 lambda x: x.rolling(window=window, min_periods=1).mean()
             )
             
             col_name_std = f'rolling_std_{window}'
-            df[col_name_std] = df.groupby(group_cols)[target_col].transform(
+            df[col_name_std] = df.groupby(group_cols, observed=True)[target_col].transform(
                 lambda x: x.rolling(window=window, min_periods=1).std().fillna(0)
             )
         
         # Тренд (разница между последними и предыдущими)
-        df['trend_7d'] = df.groupby(group_cols)[target_col].transform(
+        df['trend_7d'] = df.groupby(group_cols, observed=True)[target_col].transform(
             lambda x: x.rolling(window=7, min_periods=1).mean() - 
                      x.rolling(window=14, min_periods=1).mean()
         ).fillna(0)
@@ -203,7 +203,7 @@ class DeliveryMLPredictor:
         
         # Обучаем модель для каждого поставщика-склада-ПВ
         # Это позволяет учитывать специфику каждого ПВ при предсказании
-        for (supplier, warehouse, pv), group_df in df.groupby(['Поставщик', 'Склад', 'ПВ']):
+        for (supplier, warehouse, pv), group_df in df.groupby(['Поставщик', 'Склад', 'ПВ'], observed=True):
             if len(group_df) < 10:  # Минимум 10 записей для обучения
                 continue
             
@@ -449,7 +449,7 @@ class DeliveryMLPredictor:
             return []
         
         # Берем последние заказы
-        subset = subset.sort_values('Время заказа позиции', ascending=False).head(limit)
+        subset = subset.nlargest(limit, 'Время заказа позиции')
         
         # Отладочный вывод для диагностики
         # print(f"DEBUG get_example_orders: subset.shape = {subset.shape}")
@@ -602,7 +602,7 @@ class DeliveryMLPredictor:
         df_prep = df_prep.dropna(subset=['Разница во времени привоза (мин.)', 'Поставщик', 'Склад'])
         
         # Группируем по поставщик-склад-день-час
-        grouped = df_prep.groupby(['Поставщик', 'Склад', 'ПВ', 'day_of_week', 'hour'])
+        grouped = df_prep.groupby(['Поставщик', 'Склад', 'ПВ', 'day_of_week', 'hour'], observed=True)
         
         for (supplier, warehouse, pv, weekday, hour), group in grouped:
             if len(group) < min_samples:
@@ -1189,6 +1189,27 @@ class TrendDetector:
             return "stable", slope
 
 
+def train_and_recommend(df: pd.DataFrame, schedules: Optional[List[Dict]] = None,
+                        min_samples: int = 5, min_shift: int = 15
+                        ) -> Tuple[DeliveryMLPredictor, List[ScheduleRecommendation]]:
+    """
+    Обучение модели и генерация рекомендаций одним вызовом.
+    """
+    predictor = DeliveryMLPredictor()
+    predictor.fit(df)
+    
+    if schedules:
+        recommendations = predictor.generate_recommendations_by_schedule(
+            df, schedules, min_samples=min_samples, min_shift=min_shift
+        )
+    else:
+        # Если расписание недоступно - старый метод по часам
+        recommendations = predictor.generate_recommendations(
+            df, min_samples=min_samples, min_shift=min_shift
+        )
+    return predictor, recommendations
+
+
 # Пример использования
 if __name__ == "__main__":
     # Тестовые данные
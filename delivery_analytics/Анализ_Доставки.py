@@ -6,6 +6,7 @@ from datetime import datetime, timedelta
 import webbrowser
 from pathlib import Path
 from openpyxl import load_workbook
+from openpyxl.utils import get_column_letter
 from openpyxl.styles import Alignment, Font, PatternFill, Border, Side
 import requests
 from io import BytesIO
@@ -13,11 +14,19 @@ import sqlite3
 import os
 import sys
 
+# Copy-on-Write: отфильтрованные DataFrame разделяют данные с исходным до первой записи,
+# поэтому явные копии при загрузке и фильтрации не нужны (с pandas 3.0 режим включён всегда,
+# а опция устарела - задаём её только для pandas 2.x)
+if int(pd.__version__.split('.')[0]) < 3:
+    pd.set_option('mode.copy_on_write', True)
+
 # Константы
 TIME_TOLERANCE_MINUTES = 179  # Допустимое отклонение времени (±3 часа)
 CRM_BASE_URL = "https://crm.podzamenu.ru"
 ORDER_URL_TEMPLATE = "https://podzamenu.ru/crm/order/{order_id}"
 DAYS_RU = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота", "Воскресенье"]
+# Подписи часа заказа по номеру часа ("09:00") - подставляются словарём вместо strftime на каждую строку
+HOUR_LABELS = {hour: f"{hour:02d}:00" for hour in range(24)}
 
 # Глобальные переменные
 df_original = None
@@ -34,6 +43,15 @@ schedule_refresh_callback = None  # Callback для обновления рас
 # ОБЩАЯ ФУНКЦИЯ ФИЛЬТРАЦИИ ДАННЫХ
 # ----------------------------
 
+def column_text_widths(df):
+    """Максимальная длина текста в каждом столбце (с заголовком) - по данным, без обхода ячеек листа"""
+    widths = []
+    for col in df.columns:
+        lengths = df[col].astype(str).str.len()
+        widths.append(max(len(str(col)), int(lengths.max()) if len(lengths) else 0))
+    return widths
+
+
 def apply_common_filters(df, start_date, end_date, search_term="", selected_days=None, exclude_orders=None):
     """
     Применяет общие фильтры к DataFrame.
@@ -52,7 +70,7 @@ def apply_common_filters(df, start_date, end_date, search_term="", selected_days
     if df is None or df.empty:
         return df
     
-    df_filtered = df.copy()
+    df_filtered = df
     
     # Фильтр по дате
     mask_date = (df_filtered['Время поступления на склад'] >= pd.Timestamp(start_date)) & \
@@ -365,11 +383,11 @@ def fetch_data():
         for col in ['Рассчетное время привоза', 'Время поступления на склад', 'Время заказа позиции']:
             df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True)
         df['Разница во времени привоза (мин.)'] = pd.to_numeric(df['Разница во времени привоза (мин.)'], errors='coerce')
-        df['День_недели'] = df['Время заказа позиции'].apply(get_weekday_name)
-        df['Час_заказа'] = df['Время заказа позиции'].dt.floor('h').dt.strftime('%H:%M')
+        df['День_недели'] = df['Время заказа позиции'].dt.weekday.map(dict(enumerate(DAYS_RU))).fillna("")
+        df['Час_заказа'] = df['Время заказа позиции'].dt.hour.map(HOUR_LABELS)
 
-        df_original = df.copy()
-        df_current = df.copy()
+        df_original = df
+        df_current = df
         messagebox.showinfo("Успех", f"Данные за период {start_date.strftime('%d.%m.%Y')}–{end_date.strftime('%d.%m.%Y')} успешно загружены!")
         refresh_analysis()
 
@@ -409,8 +427,9 @@ def format_datetime(dt):
 
 def refresh_analysis():
     global sort_column, sort_reverse, min_orders_filter
-    for item in tree_analytics.get_children():
-        tree_analytics.delete(item)
+    children = tree_analytics.get_children()
+    if children:
+        tree_analytics.delete(*children)
     if df_current is None:
         return
     
@@ -570,17 +589,8 @@ def export_recommendations_weekday():
                     cell.number_format = '0.0"%"'
                 else:
                     cell.number_format = '0.0'
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = max(max_length + 2, 20)
-        ws.column_dimensions[column_letter].width = adjusted_width
+    for i, max_length in enumerate(column_text_widths(result), 1):
+        ws.column_dimensions[get_column_letter(i)].width = max(max_length + 2, 20)
     wb.save(filepath)
     messagebox.showinfo("Готово", f"Рекомендации сохранены:\n{Path(filepath).name}")
 
@@ -688,17 +698,8 @@ def export_problematic():
                     cell.number_format = '0.0"%"'
                 else:
                     cell.number_format = '0.0'
-    for column in ws.columns:
-        max_length = 0
-        column_letter = column[0].column_letter
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = max(min(max_length + 2, 30), 15)
-        ws.column_dimensions[column_letter].width = adjusted_width
+    for i, max_length in enumerate(column_text_widths(final), 1):
+        ws.column_dimensions[get_column_letter(i)].width = max(min(max_length + 2, 30), 15)
     wb.save(filepath)
     messagebox.showinfo("Готово", f"Проблемные поставщики сохранены:\n{Path(filepath).name}")
 
@@ -726,7 +727,7 @@ def show_early_deliveries_in_app():
         messagebox.showwarning("Внимание", "Нет данных после фильтрации.")
         return
     
-    early_df = df_filtered[df_filtered['Разница во времени привоза (мин.)'] < -TIME_TOLERANCE_MINUTES].copy()
+    early_df = df_filtered[df_filtered['Разница во времени привоза (мин.)'] < -TIME_TOLERANCE_MINUTES]
     if early_df.empty:
         messagebox.showinfo("Информация", "Нет ранних привозов.")
         return
@@ -782,8 +783,9 @@ def show_early_deliveries_in_app():
     tree.pack(fill='both', expand=True, padx=10, pady=10)
     tree.tag_configure('modified', background='#fff9c4')
     def refresh_tree(data_df):
-        for item in tree.get_children():
-            tree.delete(item)
+        children = tree.get_children()
+        if children:
+            tree.delete(*children)
         if sort_col_local:
             col_map = {
                 'Поставщик': 'Поставщик',
@@ -805,7 +807,9 @@ def show_early_deliveries_in_app():
                 rec = f"Сдвинуть на {shift} мин"
             else:
                 rec = "Исключить заказ"
-            item_id = tree.insert('', 'end', values=(
+            # Тег задаётся сразу при вставке - без отдельного вызова item() на строку
+            key = (row['Поставщик'], row['Склад'])
+            tree.insert('', 'end', values=(
                 row['Поставщик'],
                 row['Склад'],
                 row['День_недели'],
@@ -815,10 +819,7 @@ def show_early_deliveries_in_app():
                 f"{row['%_ранних']:.1f}%",
                 row['Медианное_отклонение'],
                 rec
-            ))
-            key = (row['Поставщик'], row['Склад'])
-            if key in modified_rows:
-                tree.item(item_id, tags=('modified',))
+            ), tags=('modified',) if key in modified_rows else ())
     def apply_filters():
         filtered_df = result_df.copy()
         if selected_days:
@@ -843,7 +844,7 @@ def show_supplier_details_early(supplier, warehouse, day, hour):
     global excluded_orders
     start_date = cal_start.get_date()
     end_date = cal_end.get_date() + timedelta(days=1)
-    df_filtered = df_current.copy()
+    df_filtered = df_current
     mask_date = (df_filtered['Время поступления на склад'] >= pd.Timestamp(start_date)) & \
                 (df_filtered['Время поступления на склад'] < pd.Timestamp(end_date))
     df_filtered = df_filtered[mask_date]
@@ -853,14 +854,13 @@ def show_supplier_details_early(supplier, warehouse, day, hour):
         (df_filtered['День_недели'] == day) &
         (df_filtered['Час_заказа'] == hour)
     )
-    df_subset = df_filtered[mask].copy()
+    df_subset = df_filtered[mask]
     if df_subset.empty:
         messagebox.showinfo("Информация", "Нет данных.")
         return
     df_subset = df_subset[~df_subset['№ заказа'].isin(excluded_orders)]
-    df_subset['Время поступления на склад'] = df_subset['Время поступления на склад'].apply(format_datetime)
-    df_subset['Время заказа позиции'] = df_subset['Время заказа позиции'].apply(format_datetime)
-    df_subset['Рассчетное время привоза'] = df_subset['Рассчетное время привоза'].apply(format_datetime)
+    for col in ['Время поступления на склад', 'Время заказа позиции', 'Рассчетное время привоза']:
+        df_subset[col] = df_subset[col].dt.strftime('%d.%m.%Y %H:%M:%S').fillna("")
     top = tk.Toplevel()
     top.title(f"Заказы: {supplier} — {warehouse} ({day}, {hour})")
     top.geometry("1200x600")
@@ -870,9 +870,10 @@ def show_supplier_details_early(supplier, warehouse, day, hour):
     chk_unique = tk.Checkbutton(frame_controls, text="Только уникальные заказы", variable=var_unique)
     chk_unique.pack(side='left', padx=5)
     def apply_filters():
-        for item in tree_det.get_children():
-            tree_det.delete(item)
-        df_to_show = df_subset.copy()
+        children = tree_det.get_children()
+        if children:
+            tree_det.delete(*children)
+        df_to_show = df_subset
         if var_unique.get():
             df_to_show = df_to_show.drop_duplicates(subset=['№ заказа'])
         for _, row in df_to_show.iterrows():
@@ -962,7 +963,7 @@ def _export_early_deliveries_file():
     if df_filtered is None or df_filtered.empty:
         messagebox.showwarning("Внимание", "Нет данных.")
         return
-    early_df = df_filtered[df_filtered['Разница во времени привоза (мин.)'] < -TIME_TOLERANCE_MINUTES].copy()
+    early_df = df_filtered[df_filtered['Разница во времени привоза (мин.)'] < -TIME_TOLERANCE_MINUTES]
     if early_df.empty:
         messagebox.showinfo("Информация", "Нет ранних привозов.")
         return
@@ -1042,11 +1043,9 @@ def _export_early_deliveries_file():
                     cell.number_format = '0.0"%"'
                 else:
                     cell.number_format = '0.0'
-    for i, column in enumerate(ws.columns, 1):
-        if i == len(ws[1]):
-            ws.column_dimensions[column[0].column_letter].width = 50
-        else:
-            ws.column_dimensions[column[0].column_letter].width = 20
+    n_cols = len(result.columns)
+    for i in range(1, n_cols + 1):
+        ws.column_dimensions[get_column_letter(i)].width = 50 if i == n_cols else 20
     wb.save(filepath)
     messagebox.showinfo("Готово", f"Ранние привозы сохранены:\n{Path(filepath).name}")
 
@@ -1138,8 +1137,9 @@ def open_schedule_window():
 
     # --- ОПРЕДЕЛЯЕМ refresh_schedule_view ДО использования ---
     def refresh_schedule_view():
-        for item in schedule_tree.get_children():
-            schedule_tree.delete(item)
+        children = schedule_tree.get_children()
+        if children:
+            schedule_tree.delete(*children)
         search_term = schedule_search.get().strip()
         selected_days = [day for day, var in day_filters_vars.items() if var.get()]
         data = get_schedule_filtered(search_term=search_term, selected_weekdays=selected_days)
@@ -1222,7 +1222,7 @@ def show_supplier_details(supplier, warehouse):
         return
     
     mask = (df_filtered['Поставщик'] == supplier) & (df_filtered['Склад'] == warehouse)
-    df_subset = df_filtered[mask].copy()
+    df_subset = df_filtered[mask]
     if df_subset.empty:
         messagebox.showinfo("Информация", "Нет данных.")
         return
@@ -1250,15 +1250,16 @@ def show_supplier_details(supplier, warehouse):
     chk_unique = tk.Checkbutton(frame_filter, text="Только уникальные заказы", variable=var_unique)
     chk_unique.pack(side='left', padx=10)
     def apply_filters():
-        filtered_df = df_subset.copy()
+        filtered_df = df_subset
         if selected_days:
             filtered_df = filtered_df[filtered_df['День_недели'].isin(selected_days)]
         if selected_hours:
             filtered_df = filtered_df[filtered_df['Час_заказа'].isin(selected_hours)]
         if var_unique.get():
             filtered_df = filtered_df.drop_duplicates(subset=['№ заказа'])
-        for item in tree.get_children():
-            tree.delete(item)
+        children = tree.get_children()
+        if children:
+            tree.delete(*children)
         for _, row in filtered_df.iterrows():
             tree.insert('', 'end', values=(
                 row['№ заказа'],